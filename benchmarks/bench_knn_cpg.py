@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""Benchmarks `KnnCpgFeatureExtractor.extract`.
+
+Compares the vectorized extractor with the former per-site loop on random
+CpG positions and checks that both return the same output.
+
+Examples
+--------
+.. code:: bash
+
+    python bench_knn_cpg.py --nb_target 100000 --nb_source 20000 --k 25
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import time
+
+import argparse
+import numpy as np
+from numpy import testing as npt
+from six.moves import range
+
+from deepcpg.data import feature_extractor as fext
+
+
+def extract_loop(x, y, ys, k):
+    """Former per-site implementation of `KnnCpgFeatureExtractor.extract`."""
+    n = len(x)
+    m = len(y)
+    kk = 2 * k
+    yc = np.searchsorted(y, x, side='left')
+    knn_cpg = np.empty((n, kk), dtype=np.float16)
+    knn_cpg.fill(np.nan)
+    knn_dist = np.empty((n, kk), dtype=np.float32)
+    knn_dist.fill(np.nan)
+
+    for i in range(n):
+        # Left side
+        yl = yc[i] - k
+        yr = yc[i] - 1
+        if yr >= 0:
+            xl = 0
+            xr = k - 1
+            if yl < 0:
+                xl += np.abs(yl)
+                yl = 0
+            xr += 1
+            yr += 1
+            knn_cpg[i, xl:xr] = ys[yl:yr]
+            knn_dist[i, xl:xr] = np.abs(y[yl:yr] - x[i])
+
+        # Right side
+        yl = yc[i]
+        if yl >= m:
+            continue
+        if x[i] == y[yl]:
+            yl += 1
+            if yl >= m:
+                continue
+        yr = yl + k - 1
+        xl = 0
+        xr = k - 1
+        if yr >= m:
+            xr -= yr - m + 1
+            yr = m - 1
+        xl += k
+        xr += k + 1
+        yr += 1
+        knn_cpg[i, xl:xr] = ys[yl:yr]
+        knn_dist[i, xl:xr] = np.abs(y[yl:yr] - x[i])
+
+    return (knn_cpg, knn_dist)
+
+
+def timeit(fun, nb_repeat):
+    times = []
+    for i in range(nb_repeat):
+        start = time.time()
+        rv = fun()
+        times.append(time.time() - start)
+    return (rv, min(times))
+
+
+def main(args):
+    p = argparse.ArgumentParser(
+        prog='bench_knn_cpg.py',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Benchmarks extraction of neighboring CpG sites.')
+    p.add_argument('--nb_target', type=int, default=32768,
+                   help='Number of target sites')
+    p.add_argument('--nb_source', type=int, default=8000,
+                   help='Number of observed source sites')
+    p.add_argument('--k', type=int, default=25,
+                   help='Number of neighbors on each side')
+    p.add_argument('--nb_repeat', type=int, default=3,
+                   help='Number of repetitions')
+    p.add_argument('--seed', type=int, default=0,
+                   help='Seed of random number generator')
+    opts = p.parse_args(args[1:])
+
+    np.random.seed(opts.seed)
+    max_pos = opts.nb_target * 100
+    x = np.sort(np.random.choice(max_pos, opts.nb_target, replace=False))
+    # Source sites are a subset of the target sites, as in `dcpg_data.py`
+    y = np.sort(np.random.choice(x, opts.nb_source, replace=False))
+    ys = np.random.binomial(1, 0.5, len(y)).astype(np.int8)
+
+    ext = fext.KnnCpgFeatureExtractor(opts.k)
+    loop, loop_time = timeit(lambda: extract_loop(x, y, ys, opts.k),
+                             opts.nb_repeat)
+    vec, vec_time = timeit(lambda: ext.extract(x, y, ys), opts.nb_repeat)
+    npt.assert_array_equal(vec[0], loop[0])
+    npt.assert_array_equal(vec[1], loop[1])
+
+    print('targets=%d sources=%d k=%d' % (opts.nb_target, opts.nb_source,
+                                         opts.k))
+    print('loop:       %8.4fs' % loop_time)
+    print('vectorized: %8.4fs' % vec_time)
+    print('speedup:    %8.1fx' % (loop_time / max(vec_time, 1e-9)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""Benchmarks storage profiles of HDF5 data files.
+
+Writes random data with the datasets and shapes of `dcpg_data.py` output files
+with each storage profile, and reports the file size and the throughput of
+reading all datasets in batches with :func:`deepcpg.data.hdf.reader`.
+
+Examples
+--------
+.. code:: bash
+
+    python bench_storage.py --nb_sample 32768 --batch_size 128
+    python bench_storage.py --profiles default fast gzip:1,chunk_rows=512
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import argparse
+import h5py as h5
+import numpy as np
+from six.moves import range
+
+from deepcpg.data import hdf
+
+
+def make_data(nb_sample, nb_cell, dna_wlen, cpg_wlen, nb_anno):
+    """Returns dict with random data of a `dcpg_data.py` output file."""
+    data = dict()
+    data['chromo'] = np.array([b'1'] * nb_sample, dtype='S2')
+    data['pos'] = np.cumsum(np.random.randint(1, 100, nb_sample)).astype(
+        np.int32)
+    # Sequence windows are correlated, since neighboring CpG sites are close
+    seq = np.random.randint(0, 4, data['pos'][-1] + dna_wlen).astype(np.int8)
+    data['inputs/dna'] = seq[data['pos'][:, None] + np.arange(dna_wlen)]
+    for i in range(nb_cell):
+        name = 'cell%d' % i
+        state = np.random.binomial(1, 0.3, nb_sample).astype(np.int8)
+        state[np.random.random(nb_sample) < 0.7] = -1
+        data['outputs/cpg/%s' % name] = state
+        shape = (nb_sample, cpg_wlen)
+        state = np.random.binomial(1, 0.3, shape).astype(np.int8)
+        dist = np.random.randint(1, 10000, shape).astype(np.float32)
+        data['inputs/cpg/%s/state' % name] = state
+        data['inputs/cpg/%s/dist' % name] = dist
+    for i in range(nb_anno):
+        data['inputs/annos/anno%d' % i] = np.random.binomial(
+            1, 0.1, nb_sample).astype(np.int8)
+    return data
+
+
+def write(filename, data, profile):
+    with h5.File(filename, 'w') as h5_file:
+        for name, value in data.items():
+            hdf.create_dataset(h5_file, name, value, profile=profile)
+
+
+def read(filename, names, batch_size):
+    reader = hdf.reader(filename, names, batch_size=batch_size, loop=False,
+                        shuffle=False)
+    nb_sample = 0
+    for batch in reader:
+        nb_sample += len(batch['pos'])
+    return nb_sample
+
+
+def timeit(fun, nb_repeat):
+    times = []
+    for i in range(nb_repeat):
+        start = time.time()
+        rv = fun()
+        times.append(time.time() - start)
+    return (rv, min(times))
+
+
+def main(args):
+    p = argparse.ArgumentParser(
+        prog='bench_storage.py',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Benchmarks storage profiles of data files.')
+    p.add_argument('--profiles', nargs='+',
+                   default=list(hdf.STORAGE_PROFILES.keys()),
+                   help='Names or specifications of storage profiles')
+    p.add_argument('--nb_sample', type=int, default=32768,
+                   help='Number of samples')
+    p.add_argument('--nb_cell', type=int, default=4,
+                   help='Number of cells')
+    p.add_argument('--dna_wlen', type=int, default=1001,
+                   help='DNA window length')
+    p.add_argument('--cpg_wlen', type=int, default=50,
+                   help='CpG window length')
+    p.add_argument('--nb_anno', type=int, default=2,
+                   help='Number of annotations')
+    p.add_argument('--batch_size', type=int, default=128,
+                   help='Batch size of reader')
+    p.add_argument('--nb_repeat', type=int, default=3,
+                   help='Number of repetitions')
+    p.add_argument('--seed', type=int, default=0,
+                   help='Seed of random number generator')
+    opts = p.parse_args(args[1:])
+
+    np.random.seed(opts.seed)
+    data = make_data(opts.nb_sample, opts.nb_cell, opts.dna_wlen,
+                     opts.cpg_wlen, opts.nb_anno)
+    names = sorted(data.keys())
+    nb_byte = sum([value.nbytes for value in data.values()])
+
+    print('samples=%d cells=%d dna_wlen=%d cpg_wlen=%d batch_size=%d' % (
+        opts.nb_sample, opts.nb_cell, opts.dna_wlen, opts.cpg_wlen,
+        opts.batch_size))
+    print('%-36s %9s %7s %9s %10s %10s' % (
+        'profile', 'size(MB)', 'ratio', 'write(s)', 'read(s)', 'samples/s'))
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for profile in opts.profiles:
+            filename = os.path.join(tmp_dir, 'data.h5')
+            _, write_time = timeit(lambda: write(filename, data, profile), 1)
+            size = os.path.getsize(filename)
+            nb_read, read_time = timeit(
+                lambda: read(filename, names, opts.batch_size),
+                opts.nb_repeat)
+            assert nb_read == opts.nb_sample
+            print('%-36s %9.2f %7.2f %9.3f %10.3f %10.0f' % (
+                profile, size / 2**20, nb_byte / size, write_time, read_time,
+                nb_read / max(read_time, 1e-9)))
+            os.remove(filename)
+    finally:
+        shutil.rmtree(tmp_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1 +1,3 @@
 from .utils import *
+from .range_index import RangeIndex, get_range_index, get_region_rows, \
+    read_regions
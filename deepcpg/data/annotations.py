@@ -1,10 +1,18 @@
 from __future__ import division
 from __future__ import print_function
 
+from collections import OrderedDict
+import hashlib
+import os
+
 import pandas as pd
 import numpy as np
+import six
 from six.moves import range
 
+from . import intervals
+from .utils import GzipFile
+
 
 def read_bed(filename, sort=False, usecols=[0, 1, 2], *args, **kwargs):
     """Read chromo,start,end from BED file without formatting chromo."""
@@ -31,42 +39,17 @@ def in_which(x, ys, ye):
     numpy array of same length than x with index or -1
     """
 
-    n = len(ys)
-    m = len(x)
-    rv = np.empty(m, dtype=np.int)
-    rv.fill(-1)
-    i = 0
-    j = 0
-    while i < n and j < m:
-        while j < m and x[j] <= ye[i]:
-            if x[j] >= ys[i]:
-                rv[j] = i
-            j += 1
-        i += 1
-    return rv
+    return intervals.index(x, ys, ye)
 
 
 def is_in(pos, start, end):
-    return in_which(pos, start, end) >= 0
+    return intervals.is_in(pos, start, end)
 
 
 def distance(pos, start, end):
-    m = len(start)
-    n = len(pos)
-    i = 0
-    j = 0
-    end_prev = -10**7
-    dist = np.zeros(n)
-    while i < m and j < n:
-        while j < n and pos[j] <= end[i]:
-            if pos[j] < start[i]:
-                dist[j] = min(pos[j] - end_prev, start[i] - pos[j])
-            j += 1
-        end_prev = end[i]
-        i += 1
-    dist[j:] = pos[j:] - end_prev
-    assert np.all(dist >= 0)
-    return dist
+    """Returns distance of positions to the nearest of non-overlapping
+    intervals, which is `np.inf` if there are no intervals."""
+    return intervals.distance(pos, start, end)
 
 
 def join_overlapping(s, e):
@@ -82,24 +65,8 @@ def join_overlapping(s, e):
     -------
     Tuple (s, e) of non-overlapping intervals
     """
-    rs = []
-    re = []
-    n = len(s)
-    if n == 0:
-        return (rs, re)
-    l = s[0]
-    r = e[0]
-    for i in range(1, n):
-        if s[i] > r:
-            rs.append(l)
-            re.append(r)
-            l = s[i]
-            r = e[i]
-        else:
-            r = max(r, e[i])
-    rs.append(l)
-    re.append(r)
-    return (rs, re)
+    rs, re = intervals.merge(s, e)
+    return (rs.tolist(), re.tolist())
 
 
 def join_overlapping_frame(d):
@@ -128,20 +95,7 @@ def group_overlapping(s, e):
     -------
     int array of length len(s) with group indices
     """
-    n = len(s)
-    group = np.zeros(n, dtype='int32')
-    if n == 0:
-        return group
-    idx = 0
-    r = e[0]
-    for i in range(1, n):
-        if s[i] > r:
-            idx += 1
-            r = e[i]
-        else:
-            r = max(r, e[i])
-        group[i] = idx
-    return group
+    return intervals.group(s, e)
 
 
 def extend_len(start, end, min_len, min_pos=1):
@@ -159,3 +113,241 @@ def extend_len_frame(d, min_len):
     e['start'] = start
     e['end'] = end
     return e
+
+
+def format_anno_chromo(chromo):
+    """Formats chromosome name of annotation files, e.g. 'chr1' to '1'."""
+    return str(chromo).upper().replace('CHR', '')
+
+
+def hash_file(filename, block_size=2**20):
+    """Returns SHA1 hash of the content of `filename`."""
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class AnnoTrack(object):
+    """Merged intervals of an annotation track partitioned by chromosome.
+
+    Parameters
+    ----------
+    chromos: list
+        Chromosome names.
+    offsets: np.array
+        Array of length `len(chromos) + 1`. Intervals of `chromos[i]` are
+        stored at `offsets[i]:offsets[i + 1]`.
+    start: np.array
+        Start of non-overlapping intervals sorted by chromosome and start.
+    end: np.array
+        End of intervals.
+    """
+
+    def __init__(self, chromos, offsets, start, end):
+        self.chromos = list(chromos)
+        self.offsets = np.asarray(offsets)
+        self.start = start
+        self.end = end
+        self._chromo_idx = {chromo: i for i, chromo in enumerate(self.chromos)}
+        assert len(self.offsets) == len(self.chromos) + 1
+        assert len(self.start) == len(self.end) == self.offsets[-1]
+
+    @classmethod
+    def read(cls, filename):
+        """Reads BED file `filename`, which can be gzip compressed.
+
+        The file is parsed once and overlapping intervals of all chromosomes
+        are merged in a single call.
+        """
+        bed_file = GzipFile(filename, 'r')
+        d = pd.read_table(bed_file, header=None, usecols=[0, 1, 2],
+                          dtype={0: 'category', 1: np.int32, 2: np.int32})
+        bed_file.close()
+        d.columns = ['chromo', 'start', 'end']
+        chromo = d['chromo'].values
+        # Chromosome names are formatted per category
+        names = [format_anno_chromo(name) for name in chromo.categories]
+        names_codes, names = pd.factorize(names, sort=True)
+        codes = names_codes[chromo.codes]
+        codes, start, end = intervals.merge(d['start'].values,
+                                            d['end'].values, codes)
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(codes, minlength=len(names)))
+        return cls(names, offsets, start.astype(np.int32),
+                   end.astype(np.int32))
+
+    def save(self, filename):
+        """Saves track to numpy `.npz` file."""
+        np.savez(filename, chromos=np.array(self.chromos, dtype=np.str_),
+                 offsets=self.offsets, start=self.start, end=self.end)
+
+    @classmethod
+    def load(cls, filename):
+        """Loads track from `.npz` file that was created by :meth:`save`."""
+        with np.load(filename) as data:
+            return cls([str(chromo) for chromo in data['chromos']],
+                       data['offsets'], data['start'], data['end'])
+
+    def __len__(self):
+        return len(self.start)
+
+    def __contains__(self, chromo):
+        return chromo in self._chromo_idx
+
+    def get(self, chromo):
+        """Returns tuple (`start`, `end`) of sorted intervals of `chromo`."""
+        idx = self._chromo_idx.get(chromo)
+        if idx is None:
+            return (self.start[:0], self.end[:0])
+        idx = slice(self.offsets[idx], self.offsets[idx + 1])
+        return (self.start[idx], self.end[idx])
+
+
+class AnnoIndex(object):
+    """Index of multiple annotation tracks.
+
+    Parses annotation files once, such that queries for different
+    chromosomes do not require to read files again.
+
+    Parameters
+    ----------
+    tracks: OrderedDict
+        :class:`AnnoTrack` by name.
+    """
+
+    FEATURES = ['is_in', 'distance', 'signed_distance', 'density']
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+
+    @classmethod
+    def read(cls, filenames, names=None, cache_dir=None):
+        """Reads annotation tracks from BED files.
+
+        Parameters
+        ----------
+        filenames: list
+            BED files, which can be gzip compressed.
+        names: list
+            Names of tracks. Defaults to `filenames`.
+        cache_dir: str
+            If provided, parsed tracks are stored as binary files in
+            `cache_dir`, which are named by the hash of the content of BED
+            files, and reused if files did not change.
+
+        Returns
+        -------
+        :class:`AnnoIndex`
+            Index of annotation tracks.
+        """
+        if names is None:
+            names = filenames
+        tracks = OrderedDict()
+        for name, filename in zip(names, filenames):
+            cache_file = None
+            if cache_dir:
+                cache_file = os.path.join(
+                    cache_dir, 'anno_%s.npz' % hash_file(filename)[:16])
+                if os.path.isfile(cache_file):
+                    tracks[name] = AnnoTrack.load(cache_file)
+                    continue
+            tracks[name] = AnnoTrack.read(filename)
+            if cache_file:
+                if not os.path.exists(cache_dir):
+                    os.makedirs(cache_dir)
+                tmp_file = '%s.%d.tmp.npz' % (cache_file[:-4], os.getpid())
+                tracks[name].save(tmp_file)
+                os.rename(tmp_file, cache_file)
+        return cls(tracks)
+
+    @property
+    def names(self):
+        return list(self.tracks.keys())
+
+    def query(self, chromo, pos, features=['is_in'], radius=1000):
+        """Computes features of positions for all tracks.
+
+        All features of a track are derived from a single binary search of
+        positions in the sorted intervals of the track.
+
+        Parameters
+        ----------
+        chromo: str
+            Chromosome of positions.
+        pos: np.array
+            Positions.
+        features: list
+            Names of features:
+
+            * `is_in`: 1 if position is in an interval, 0 otherwise.
+            * `distance`: Distance to the nearest interval, which is zero
+              inside intervals and `np.inf` if `chromo` has no intervals.
+            * `signed_distance`: int32 distance to the nearest interval,
+              which is negative if the interval is upstream, i.e. at smaller
+              positions. Equally distant upstream intervals are preferred.
+              Distances are clipped to the range of int32, which is also the
+              distance if `chromo` has no intervals.
+            * `density`: Number of intervals that overlap with the window
+              [pos - `radius`, pos + `radius`].
+        radius: int
+            Radius of windows for computing `density`.
+
+        Returns
+        -------
+        OrderedDict
+            Matrix of shape [len(pos), len(tracks)] for each feature.
+        """
+        for feature in features:
+            if feature not in self.FEATURES:
+                raise ValueError('Invalid annotation feature "%s"!' %
+                                 feature)
+        pos = np.asarray(pos, dtype=np.int64)
+        shape = (len(pos), len(self.tracks))
+        result = OrderedDict()
+        for feature in self.FEATURES:
+            if feature not in features:
+                continue
+            if feature == 'is_in':
+                result[feature] = np.zeros(shape, dtype=np.int8)
+            elif feature == 'distance':
+                result[feature] = np.empty(shape)
+            else:
+                result[feature] = np.empty(shape, dtype=np.int32)
+        max_dist = np.iinfo(np.int32).max
+
+        for i, track in enumerate(six.itervalues(self.tracks)):
+            start, end = track.get(chromo)
+            # Index of the last interval with start <= pos. Intervals are
+            # non-overlapping, such that ends are sorted as well.
+            left = np.searchsorted(start, pos, side='right') - 1
+            right = left + 1
+            has_left = left >= 0
+            has_right = right < len(start)
+            # Distances to the left and right interval, which are
+            # non-positive for positions inside the left interval.
+            left_dist = np.empty(len(pos))
+            left_dist.fill(np.inf)
+            left_dist[has_left] = pos[has_left] - end[left[has_left]]
+            right_dist = np.empty(len(pos))
+            right_dist.fill(np.inf)
+            right_dist[has_right] = start[right[has_right]] - pos[has_right]
+            inside = left_dist <= 0
+
+            if 'is_in' in result:
+                result['is_in'][:, i] = inside
+            if 'distance' in result:
+                result['distance'][:, i] = np.where(
+                    inside, 0, np.minimum(left_dist, right_dist))
+            if 'signed_distance' in result:
+                dist = np.where(has_left & (left_dist <= right_dist),
+                                -left_dist, right_dist)
+                dist[inside] = 0
+                result['signed_distance'][:, i] = np.clip(dist, -max_dist,
+                                                          max_dist)
+            if 'density' in result:
+                result['density'][:, i] = \
+                    np.searchsorted(start, pos + radius, side='right') - \
+                    np.searchsorted(end, pos - radius, side='left')
+        return result
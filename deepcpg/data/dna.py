@@ -4,12 +4,31 @@ from __future__ import print_function
 from collections import OrderedDict
 
 import numpy as np
+import six
 from six.moves import range
 
 CHAR_TO_INT = OrderedDict([('A', 0), ('T', 1), ('G', 2), ('C', 3), ('N', 4)])
 INT_TO_CHAR = {v: k for k, v in CHAR_TO_INT.items()}
 
 
+def _char_to_int_table():
+    table = np.empty(256, dtype=np.int8)
+    table.fill(CHAR_TO_INT['N'])
+    for char, code in six.iteritems(CHAR_TO_INT):
+        table[ord(char)] = code
+        table[ord(char.lower())] = code
+    return table
+
+
+# Translation tables between ASCII codes and integer codes. Characters that
+# are not in `CHAR_TO_INT` are encoded as 'N'.
+ASCII_TO_INT = _char_to_int_table()
+INT_TO_ASCII = np.array([ord(INT_TO_CHAR[i]) for i in range(len(INT_TO_CHAR))],
+                        dtype=np.uint8)
+# Number of characters that are encoded at once when writing to a buffer
+_BLOCK_SIZE = 2**20
+
+
 def get_alphabet(special=False, reverse=False):
     alpha = OrderedDict(CHAR_TO_INT)
     if not special:
@@ -19,27 +38,124 @@ def get_alphabet(special=False, reverse=False):
     return alpha
 
 
+def _as_ascii(seq):
+    if isinstance(seq, six.text_type):
+        seq = seq.encode('ascii')
+    if isinstance(seq, (bytes, bytearray, memoryview)):
+        return np.frombuffer(seq, dtype=np.uint8)
+    seq = np.asarray(seq)
+    if seq.dtype.kind == 'S':
+        seq = seq.view(np.uint8)
+    return seq
+
+
+def ascii_to_int(seq, out=None):
+    """Encodes an ASCII DNA sequence as integers.
+
+    Parameters
+    ----------
+    seq: str, bytes, bytearray, or np.array
+        DNA sequence as string, byte buffer, or array of ASCII codes.
+    out: np.array
+        Optional int8 array of length `len(seq)` into which the encoded
+        sequence is written. Can share memory with `seq`.
+
+    Returns
+    -------
+    np.array
+        int8 array with integer-encoded sequence.
+    """
+    seq = _as_ascii(seq).astype(np.uint8, copy=False)
+    # Fancy indexing with uint8 avoids casting `seq` to a full intp array,
+    # as `np.take` does.
+    if out is None:
+        return ASCII_TO_INT[seq]
+    if len(out) != len(seq):
+        raise ValueError('Output buffer must have length %d!' % len(seq))
+    for start in range(0, len(seq), _BLOCK_SIZE):
+        end = start + _BLOCK_SIZE
+        out[start:end] = ASCII_TO_INT[seq[start:end]]
+    return out
+
+
+def _check_codes(seqs, nb_code):
+    """Raises `ValueError` if integer codes `seqs` are not in
+    [0, `nb_code`)."""
+    if seqs.size and (seqs.min() < 0 or seqs.max() >= nb_code):
+        raise ValueError('Invalid nucleotide codes! Codes must be between 0'
+                         ' and %d.' % (nb_code - 1))
+
+
+def int_to_ascii(seq):
+    """Decodes integer-encoded sequences into an array of ASCII codes.
+
+    Parameters
+    ----------
+    seq: np.array
+        Integer-encoded sequences of any shape.
+
+    Returns
+    -------
+    np.array
+        uint8 array of the same shape as `seq` with ASCII codes.
+
+    Raises
+    ------
+    ValueError
+        If `seq` contains codes that are not in `CHAR_TO_INT`.
+    """
+    seq = np.asarray(seq)
+    _check_codes(seq, len(INT_TO_ASCII))
+    return INT_TO_ASCII[seq]
+
+
 def char_to_int(seq):
-    return [CHAR_TO_INT[x] for x in seq.upper()]
+    return ascii_to_int(seq).tolist()
 
 
 def int_to_char(seq, join=True):
-    t = [INT_TO_CHAR[x] for x in seq]
-    if join:
-        t = ''.join(t)
+    t = int_to_ascii(np.asarray(seq)).tobytes().decode()
+    if not join:
+        t = list(t)
     return t
 
 
-def int_to_onehot(seqs, dim=4):
-    """Special nucleotides will be encoded as [0, 0, 0, 0]."""
+def int_to_onehot(seqs, dim=4, out=None):
+    """One-hot encodes integer-encoded sequences.
+
+    Special nucleotides will be encoded as [0, 0, 0, 0].
+
+    Parameters
+    ----------
+    seqs: np.array
+        Integer-encoded sequences of shape [nb_seq, seq_len].
+    dim: int
+        Number of characters.
+    out: np.array
+        Optional int8 array of shape [nb_seq, seq_len, dim] into which the
+        encoded sequences are written.
+
+    Returns
+    -------
+    np.array
+        int8 array of shape [nb_seq, seq_len, dim].
+
+    Raises
+    ------
+    ValueError
+        If `seqs` contains codes that are negative or neither in
+        `CHAR_TO_INT` nor smaller than `dim`.
+    """
     seqs = np.atleast_2d(np.asarray(seqs))
-    n = seqs.shape[0]
-    l = seqs.shape[1]
-    enc_seqs = np.zeros((n, l, dim), dtype='int8')
-    for i in range(dim):
-        t = seqs == i
-        enc_seqs[t, i] = 1
-    return enc_seqs
+    nb_code = max(len(CHAR_TO_INT), dim)
+    _check_codes(seqs, nb_code)
+    # Codes larger than `dim` map to zero rows
+    table = np.zeros((nb_code, dim), dtype='int8')
+    table[np.arange(dim), np.arange(dim)] = 1
+    if nb_code <= 256:
+        # Avoids casting `seqs` to a full intp array
+        seqs = seqs.astype(np.uint8, copy=False)
+    return np.take(table, seqs, axis=0, out=out)
 
 
 def onehot_to_int(seqs, axis=-1):
@@ -1,14 +1,21 @@
 from __future__ import division
 from __future__ import print_function
 
+from collections import OrderedDict
 import os
 from glob import glob
 import gzip as gz
 
-from six.moves import range
+import numpy as np
 
+from . import dna
 from ..utils import to_list
 
+# Number of bytes that are read and decompressed at once
+BLOCK_SIZE = 2**22
+# Characters that are removed from sequence lines
+WHITESPACE = b' \t\r\n'
+
 
 class FastaSeq(object):
 
@@ -17,39 +24,290 @@ class FastaSeq(object):
         self.seq = seq
 
 
+def iter_lines(lines):
+    """Iterates over FASTA records in `lines`.
+
+    Parameters
+    ----------
+    lines: iterable
+        Lines of a FASTA file.
+
+    Returns
+    -------
+    generator
+        Generator of :class:`FastaSeq` records.
+    """
+    head = None
+    seq = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] == '>':
+            if head is not None:
+                yield FastaSeq(head, ''.join(seq))
+            head = line
+            seq = []
+        elif head is not None:
+            seq.append(line)
+    if head is not None:
+        yield FastaSeq(head, ''.join(seq))
+
+
 def parse_lines(lines):
-    seqs = []
-    seq = None
-    start = None
-    lines = [line.strip() for line in lines]
-    lines = [line for line in lines if len(line) > 0]
-    for i in range(len(lines)):
-        if lines[i][0] == '>':
-            if start is not None:
-                head = lines[start]
-                seq = ''.join(lines[start + 1: i])
-                seqs.append(FastaSeq(head, seq))
-            start = i
-    if start is not None:
-        head = lines[start]
-        seq = ''.join(lines[start + 1:])
-        seqs.append(FastaSeq(head, seq))
-    return seqs
+    return list(iter_lines(lines))
 
 
-def read_file(filename, gzip=None):
+def _open(filename, gzip=None):
     if gzip is None:
         gzip = filename.endswith('.gz')
     if gzip:
-        lines = gz.open(filename, 'r').read().decode()
+        return gz.open(filename, 'rb')
+    else:
+        return open(filename, 'rb')
+
+
+def _to_seq(seq, encode=False):
+    """Converts bytearray `seq` to str or int8 array, which reuses `seq`."""
+    if encode:
+        seq = np.frombuffer(seq, dtype=np.uint8)
+        return dna.ascii_to_int(seq, out=seq.view(np.int8))
     else:
-        lines = open(filename, 'r').read()
-    lines = lines.splitlines()
-    return parse_lines(lines)
+        return seq.decode()
+
+
+def get_name(head):
+    """Returns the name of a FASTA record, i.e. the first word of `head`."""
+    return head.lstrip('>').split()[0]
+
+
+def iter_file(filename, gzip=None, encode=False, select=None,
+              block_size=BLOCK_SIZE):
+    """Iterates over the records of a FASTA file with bounded memory.
+
+    Reads and decompresses the file in blocks of `block_size` bytes and
+    writes sequence lines directly into a buffer of the current record, such
+    that at most one record is held in memory.
+
+    Parameters
+    ----------
+    filename: str
+        FASTA file, which can be gzip compressed.
+    gzip: bool
+        If `True`, decompress file. Inferred from file extension if `None`.
+    encode: bool
+        If `True`, return sequences as integer-encoded int8 arrays instead of
+        strings.
+    select: function
+        Function that takes the header of a record and returns `True` if the
+        record is to be read. Sequences of other records are skipped.
+    block_size: int
+        Number of bytes that are read at once.
+
+    Returns
+    -------
+    generator
+        Generator of :class:`FastaSeq` records.
+    """
+    head = None
+    seq = None
+    pending = b''
+    fh = _open(filename, gzip)
+    try:
+        while True:
+            block = fh.read(block_size)
+            eof = not block
+            block = pending + block
+            pending = b''
+            if not eof:
+                # Only process complete lines
+                cut = block.rfind(b'\n') + 1
+                pending = block[cut:]
+                block = block[:cut]
+            start = 0
+            while start < len(block):
+                if block[start:start + 1] == b'>':
+                    end = block.find(b'\n', start)
+                    if end < 0:
+                        end = len(block)
+                    if head is not None and seq is not None:
+                        yield FastaSeq(head, _to_seq(seq, encode))
+                    head = block[start:end].decode().strip()
+                    seq = None
+                    if select is None or select(head):
+                        seq = bytearray()
+                    start = end + 1
+                else:
+                    end = block.find(b'\n>', start)
+                    end = len(block) if end < 0 else end + 1
+                    if seq is not None:
+                        seq.extend(block[start:end].translate(None,
+                                                              WHITESPACE))
+                    start = end
+            if eof:
+                break
+    finally:
+        fh.close()
+    if head is not None and seq is not None:
+        yield FastaSeq(head, _to_seq(seq, encode))
+
+
+def read_file(filename, gzip=None):
+    return list(iter_file(filename, gzip=gzip))
+
+
+def read_fai(filename):
+    """Reads FASTA index file as created by `samtools faidx`.
+
+    Returns
+    -------
+    OrderedDict
+        `dict (key, value)`, where `key` is the record name and `value` a tuple
+        (`length`, `offset`, `line_bases`, `line_width`).
+    """
+    index = OrderedDict()
+    with open(filename, 'r') as fai_file:
+        for line in fai_file:
+            line = line.rstrip('\n').split('\t')
+            if len(line) < 5:
+                continue
+            index[line[0]] = tuple([int(x) for x in line[1:5]])
+    return index
+
+
+def write_fai(filename, fai_filename=None):
+    """Writes FASTA index file of uncompressed FASTA file `filename`.
+
+    The index is compatible with `samtools faidx` and written to
+    `filename`.fai by default. All sequence lines of a record except the last
+    must have the same length.
+
+    Returns
+    -------
+    str
+        Name of FASTA index file.
+    """
+    if fai_filename is None:
+        fai_filename = filename + '.fai'
+    index = OrderedDict()
+    name = None
+    offset = 0
+    is_last = False
+    with open(filename, 'rb') as fh:
+        for line in fh:
+            if line.startswith(b'>'):
+                name = get_name(line.decode())
+                index[name] = [0, offset + len(line), 0, 0]
+                is_last = False
+            elif name is not None:
+                entry = index[name]
+                line_bases = len(line.rstrip(WHITESPACE))
+                if not entry[2]:
+                    entry[2] = line_bases
+                    entry[3] = len(line)
+                elif is_last or line_bases > entry[2]:
+                    raise ValueError('Lines of record "%s" in "%s" have'
+                                     ' different lengths!' % (name, filename))
+                is_last = line_bases < entry[2]
+                entry[0] += line_bases
+            offset += len(line)
+    with open(fai_filename, 'w') as fai_file:
+        for name, entry in index.items():
+            print('\t'.join([name] + [str(x) for x in entry]), file=fai_file)
+    return fai_filename
+
+
+def read_seq(filename, name, encode=False, fai_filename=None,
+             block_size=BLOCK_SIZE):
+    """Reads the sequence of record `name` from a FASTA file.
+
+    Seeks to the record using the FASTA index `fai_filename`, or
+    `filename`.fai if it exists, and reads its sequence into a preallocated
+    buffer. Without index, streams the file and skips other records.
+
+    Parameters
+    ----------
+    filename: str
+        FASTA file. Must be uncompressed to be read with an index.
+    name: str
+        Name of record, i.e. the first word of its header.
+    encode: bool
+        If `True`, return integer-encoded int8 array instead of string.
+    fai_filename: str
+        FASTA index file.
+    block_size: int
+        Number of bytes that are read at once.
+
+    Returns
+    -------
+    str or np.array
+        Sequence of record `name`.
+    """
+    if fai_filename is None and not filename.endswith('.gz') and \
+            os.path.isfile(filename + '.fai'):
+        fai_filename = filename + '.fai'
+
+    if fai_filename is None:
+        for fasta_seq in iter_file(filename, encode=encode,
+                                   select=lambda head: get_name(head) == name,
+                                   block_size=block_size):
+            return fasta_seq.seq
+        raise ValueError('Record "%s" not found in "%s"!' % (name, filename))
+
+    index = read_fai(fai_filename)
+    if name not in index:
+        raise ValueError('Record "%s" not found in "%s"!' % (name,
+                                                            fai_filename))
+    length, offset, line_bases, line_width = index[name]
+    nb_byte = (length // line_bases) * line_width + length % line_bases \
+        if line_bases else 0
+    seq = bytearray(length)
+    buf = np.frombuffer(seq, dtype=np.uint8)
+    nb_base = 0
+    with open(filename, 'rb') as fh:
+        fh.seek(offset)
+        while nb_byte > 0 and nb_base < length:
+            block = fh.read(min(block_size, nb_byte))
+            if not block:
+                break
+            nb_byte -= len(block)
+            block = block.translate(None, WHITESPACE)
+            buf[nb_base:nb_base + len(block)] = np.frombuffer(block,
+                                                              dtype=np.uint8)
+            nb_base += len(block)
+    if nb_base != length:
+        raise ValueError('Invalid index for record "%s" in "%s"!' %
+                         (name, filename))
+    return _to_seq(seq, encode)
 
 
 def select_file_by_chromo(filenames, chromo):
+    """Selects file with the DNA sequence of chromosome `chromo`.
+
+    Genome stores created by :func:`genome.fasta_to_store` take precedence
+    over FASTA files if they contain `chromo`.
+
+    Parameters
+    ----------
+    filenames: list
+        Genome store directories, directory with FASTA files named
+        "*.dna.chromosome.`chromo`.fa*", or list of FASTA files.
+    chromo: str
+        Chromosome name.
+
+    Returns
+    -------
+    str
+        Genome store directory or FASTA file. `None` if not found.
+    """
+    from . import genome
+
     filenames = to_list(filenames)
+    for filename in filenames:
+        if os.path.isdir(filename) and genome.is_store(filename) and \
+                chromo in genome.GenomeStore(filename):
+            return filename
+
     if len(filenames) == 1 and os.path.isdir(filenames[0]):
         filenames = glob(os.path.join(filenames[0],
                                       '*.dna.chromosome.%s.fa*' % chromo))
@@ -59,12 +317,38 @@ def select_file_by_chromo(filenames, chromo):
             return filename
 
 
-def read_chromo(filenames, chromo):
+def read_chromo(filenames, chromo, encode=False):
+    """Reads the DNA sequence of chromosome `chromo`.
+
+    Parameters
+    ----------
+    filenames: list
+        Genome store directories or FASTA files. See
+        :func:`select_file_by_chromo`.
+    chromo: str
+        Chromosome name.
+    encode: bool
+        If `True`, return integer-encoded int8 array instead of string. Reading
+        from an `int8` genome store then returns a memory-mapped view.
+
+    Returns
+    -------
+    str or np.array
+        DNA sequence.
+    """
+    from . import genome
+
     filename = select_file_by_chromo(filenames, chromo)
     if not filename:
         raise ValueError('DNA file for chromosome "%s" not found!' % chromo)
 
-    fasta_seqs = read_file(filename)
+    if os.path.isdir(filename) and genome.is_store(filename):
+        seq = genome.GenomeStore(filename).seq(chromo)
+        if not encode:
+            seq = dna.int_to_char(seq)
+        return seq
+
+    fasta_seqs = list(iter_file(filename, encode=encode))
     if len(fasta_seqs) != 1:
         raise ValueError('Single sequence expected in file "%s"!' % filename)
     return fasta_seqs[0].seq
@@ -4,6 +4,8 @@ from __future__ import print_function
 import numpy as np
 from six.moves import range
 
+from . import intervals
+
 
 class KnnCpgFeatureExtractor(object):
     """Extracts k CpG sites next to target sites. Excludes CpG sites at the
@@ -17,6 +19,9 @@ class KnnCpgFeatureExtractor(object):
         """Extracts state and distance of k CpG sites next to target sites.
         Target site is excluded.
 
+        Left and right neighbors of all target sites are gathered at once by
+        adding an offset matrix to the insertion points of `x` into `y`.
+
         Parameters
         ----------
         x: numpy array with target positions sorted in ascending order
@@ -30,51 +35,36 @@ class KnnCpgFeatureExtractor(object):
             dist: Distances to the left (0:k) and right (k:2k)
         """
 
+        x = np.asarray(x)
+        y = np.asarray(y)
+        ys = np.asarray(ys)
         n = len(x)
         m = len(y)
         k = self.k
         kk = 2 * self.k
-        yc = self.__larger_equal(x, y)
         knn_cpg = np.empty((n, kk), dtype=np.float16)
         knn_cpg.fill(np.nan)
         knn_dist = np.empty((n, kk), dtype=np.float32)
         knn_dist.fill(np.nan)
+        if n == 0 or m == 0:
+            return (knn_cpg, knn_dist)
 
-        for i in range(n):
-            # Left side
-            yl = yc[i] - k
-            yr = yc[i] - 1
-            if yr >= 0:
-                xl = 0
-                xr = k - 1
-                if yl < 0:
-                    xl += np.abs(yl)
-                    yl = 0
-                xr += 1
-                yr += 1
-                knn_cpg[i, xl:xr] = ys[yl:yr]
-                knn_dist[i, xl:xr] = np.abs(y[yl:yr] - x[i])
-
-            # Right side
-            yl = yc[i]
-            if yl >= m:
-                continue
-            if x[i] == y[yl]:
-                yl += 1
-                if yl >= m:
-                    continue
-            yr = yl + k - 1
-            xl = 0
-            xr = k - 1
-            if yr >= m:
-                xr -= yr - m + 1
-                yr = m - 1
-            xl += k
-            xr += k + 1
-            yr += 1
-            knn_cpg[i, xl:xr] = ys[yl:yr]
-            knn_dist[i, xl:xr] = np.abs(y[yl:yr] - x[i])
-
+        yc = self.__larger_equal(x, y)
+        # Skip source site at the same position as the target site
+        yr = yc.copy()
+        on_y = yc < m
+        yr[on_y] += y[yc[on_y]] == x[on_y]
+
+        # Indices of left (0:k) and right (k:2k) neighbors
+        idx = np.empty((n, kk), dtype=yc.dtype)
+        idx[:, :k] = yc.reshape(-1, 1) + np.arange(-k, 0)
+        idx[:, k:] = yr.reshape(-1, 1) + np.arange(k)
+        valid = (idx >= 0) & (idx < m)
+
+        idx = idx[valid]
+        knn_cpg[valid] = ys[idx]
+        knn_dist[valid] = np.abs(y[idx] - np.broadcast_to(x.reshape(-1, 1),
+                                                          valid.shape)[valid])
         return (knn_cpg, knn_dist)
 
     def __larger_equal(self, x, y):
@@ -86,20 +76,7 @@ class KnnCpgFeatureExtractor(object):
         y : numpy array of with positions sorted in ascending order
         """
 
-        n = len(x)
-        m = len(y)
-        rv = np.empty(n, dtype=np.int)
-        i = 0
-        j = 0
-        while i < n and j < m:
-            while j < m and x[i] > y[j]:
-                j += 1
-            rv[i] = j
-            i += 1
-        if i < n:
-            # x[i] > y[m - 1]
-            rv[i:] = m
-        return rv
+        return np.searchsorted(y, x, side='left')
 
 
 class IntervalFeatureExtractor(object):
@@ -120,24 +97,8 @@ class IntervalFeatureExtractor(object):
         Tuple (s, e) of non-overlapping intervals
         """
 
-        rs = []
-        re = []
-        n = len(s)
-        if n == 0:
-            return (rs, re)
-        l = s[0]
-        r = e[0]
-        for i in range(1, n):
-            if s[i] > r:
-                rs.append(l)
-                re.append(r)
-                l = s[i]
-                r = e[i]
-            else:
-                r = max(r, e[i])
-        rs.append(l)
-        re.append(r)
-        return (rs, re)
+        rs, re = intervals.merge(s, e)
+        return (rs.tolist(), re.tolist())
 
     @staticmethod
     def index_intervals(x, ys, ye):
@@ -155,30 +116,78 @@ class IntervalFeatureExtractor(object):
         numpy array of same length than x with index or -1
         """
 
-        n = len(ys)
-        m = len(x)
-        rv = np.empty(m, dtype=np.int)
-        rv.fill(-1)
-        i = 0
-        j = 0
-        while i < n and j < m:
-            while j < m and x[j] <= ye[i]:
-                if x[j] >= ys[i]:
-                    rv[j] = i
-                j += 1
-            i += 1
-        return rv
+        return intervals.index(x, ys, ye)
 
     def extract(self, x, ys, ye):
         return self.index_intervals(x, ys, ye) >= 0
 
 
 class KmersFeatureExtractor(object):
+    """Extracts k-mer frequencies from integer sequences.
+
+    K-mer codes of all sequences are computed at once by shifting and adding
+    sequences, and counted by a single `np.bincount` with an offset for each
+    sequence. The code of a k-mer with characters c_0, ..., c_{k-1} is
+    sum_i c_i * nb_char**i.
+
+    Parameters
+    ----------
+    kmer_len: int
+        Length of k-mers.
+    nb_char: int
+        Number of characters. K-mers that contain characters >= `nb_char`,
+        e.g. 'N', are ignored.
+    canonical: bool
+        If `True`, frequencies of k-mers and their reverse complement are
+        merged and counted at the smaller code of both. Requires the
+        encoding of :mod:`deepcpg.data.dna`, i.e. `nb_char=4`.
+    batch_size: int
+        Maximum number of characters that are processed at once.
+    """
 
-    def __init__(self, kmer_len, nb_char=4):
+    def __init__(self, kmer_len, nb_char=4, canonical=False,
+                 batch_size=2**22):
         self.kmer_len = kmer_len
         self.nb_char = nb_char
         self.nb_kmer = self.nb_char**self.kmer_len
+        self.canonical = canonical
+        self.batch_size = batch_size
+        self._canonical_codes = None
+        if self.canonical:
+            if self.nb_char != 4:
+                raise ValueError('Canonical k-mers require four characters!')
+            self._canonical_codes = self._get_canonical_codes()
+
+    def _get_canonical_codes(self):
+        """Returns for each k-mer code the smaller of itself and the code of
+        its reverse complement."""
+        codes = np.arange(self.nb_kmer, dtype=np.int64)
+        weights = self.nb_char**np.arange(self.kmer_len, dtype=np.int64)
+        chars = codes.reshape(-1, 1) // weights % self.nb_char
+        # Complementary characters of `dna.CHAR_TO_INT` differ in the last
+        # bit, i.e. A <-> T and G <-> C.
+        rc_codes = (chars[:, ::-1] ^ 1).dot(weights)
+        return np.minimum(codes, rc_codes)
+
+    def _count(self, seqs):
+        nb_seq, seq_len = seqs.shape
+        nb_kmer_seq = seq_len - self.kmer_len + 1
+        invalid = (seqs < 0) | (seqs >= self.nb_char)
+        # Number of invalid characters in k-mers from prefix sums
+        nb_invalid = np.zeros((nb_seq, seq_len + 1), dtype=np.int32)
+        np.cumsum(invalid, axis=1, out=nb_invalid[:, 1:])
+        valid = nb_invalid[:, self.kmer_len:] == nb_invalid[:, :nb_kmer_seq]
+
+        seqs = np.where(invalid, 0, seqs).astype(np.int64)
+        codes = np.zeros((nb_seq, nb_kmer_seq), dtype=np.int64)
+        for i in range(self.kmer_len):
+            codes += seqs[:, i:(i + nb_kmer_seq)] * self.nb_char**i
+        if self.canonical:
+            codes = self._canonical_codes[codes]
+        codes += np.arange(nb_seq, dtype=np.int64).reshape(-1, 1) * \
+            self.nb_kmer
+        kmer_freq = np.bincount(codes[valid], minlength=nb_seq * self.nb_kmer)
+        return kmer_freq.reshape(nb_seq, self.nb_kmer)
 
     def __call__(self, seqs):
         """Extracts kmer frequencies from integer sequences.
@@ -192,12 +201,13 @@ class KmersFeatureExtractor(object):
         freq: numpy array of size M x C of kmer frequencies.
         """
 
+        seqs = np.asarray(seqs)
         nb_seq, seq_len = seqs.shape
         kmer_freq = np.zeros((nb_seq, self.nb_kmer), dtype=np.int32)
-        vec = np.array([self.nb_char**i for i in range(self.kmer_len)],
-                       dtype=np.int32)
-        for i in range(nb_seq):
-            for j in range(seq_len - self.kmer_len + 1):
-                kmer = seqs[i, j:(j + self.kmer_len)]
-                kmer_freq[i, kmer.dot(vec)] += 1
+        if seq_len < self.kmer_len:
+            return kmer_freq
+        batch_size = max(1, self.batch_size // seq_len)
+        for i in range(0, nb_seq, batch_size):
+            kmer_freq[i:(i + batch_size)] = \
+                self._count(seqs[i:(i + batch_size)])
         return kmer_freq
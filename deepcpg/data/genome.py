@@ -0,0 +1,371 @@
+"""Compact on-disk genome store with random access to sequence windows.
+
+A genome store is a directory with the following files:
+
+* ``genome.idx``: Tab-delimited index with columns `chromo`, `length`,
+  `offset`, and `mask_offset`, which are the length of the chromosome and
+  byte offsets of its sequence in ``genome.seq`` and ``genome.mask``.
+* ``genome.seq``: Integer-encoded sequences of all chromosomes, either one
+  byte per base (`int8` encoding) or four bases per byte (`2bit` encoding).
+* ``genome.mask``: Bit-packed mask of 'N' nucleotides. Only used by the
+  `2bit` encoding, since 'N' can not be represented by two bits.
+
+Sequences are memory-mapped, such that reading windows of a chromosome does
+not require to read the entire chromosome into memory. With `int8` encoding,
+:meth:`GenomeStore.seq` returns a zero-copy view.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+from glob import glob
+import os
+import re
+
+import numpy as np
+
+from . import dna
+from . import fasta
+from ..utils import to_list
+
+INDEX_FILE = 'genome.idx'
+SEQ_FILE = 'genome.seq'
+MASK_FILE = 'genome.mask'
+ENCODINGS = ['int8', '2bit']
+
+
+def format_chromo_name(head):
+    """Extracts chromosome name from FASTA header `head`.
+
+    Uses the first word of the header, which is upper-cased and stripped of a
+    leading 'CHR', e.g. '>chr18 description' becomes '18'.
+    """
+    name = head.lstrip('>').split()[0]
+    return re.sub('^CHR', '', name.upper())
+
+
+def is_store(dirname):
+    """Tests if `dirname` is a genome store."""
+    return os.path.isfile(os.path.join(dirname, INDEX_FILE))
+
+
+def pack_2bit(seq):
+    """Packs integer-encoded sequence into 2-bit codes and bit-packed N mask.
+
+    Parameters
+    ----------
+    seq: np.array
+        int8 array with integer-encoded sequence.
+
+    Returns
+    -------
+    tuple
+        Tuple (`packed`, `mask`) of uint8 arrays of length `ceil(len(seq) / 4)`
+        and `ceil(len(seq) / 8)`.
+    """
+    seq = np.asarray(seq)
+    mask = seq == dna.CHAR_TO_INT['N']
+    codes = np.zeros(int(np.ceil(len(seq) / 4)) * 4, dtype=np.uint8)
+    codes[:len(seq)] = seq
+    codes[:len(seq)][mask] = 0
+    codes = codes.reshape(-1, 4)
+    packed = (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | \
+        codes[:, 3]
+    return (packed.astype(np.uint8), np.packbits(mask))
+
+
+def unpack_2bit(packed, mask, start, end):
+    """Decodes range [`start`, `end`) of a 2-bit packed sequence.
+
+    Parameters
+    ----------
+    packed: np.array
+        uint8 array with 2-bit codes of the entire sequence.
+    mask: np.array
+        uint8 array with bit-packed N mask of the entire sequence.
+    start: int
+        0-based start of the range.
+    end: int
+        0-based end of the range (exclusive).
+
+    Returns
+    -------
+    np.array
+        int8 array of length `end - start` with integer-encoded sequence.
+    """
+    if end <= start:
+        return np.empty(0, dtype=np.int8)
+    shifts = np.array([6, 4, 2, 0], dtype=np.uint8)
+    block = np.asarray(packed[start // 4:(end + 3) // 4])
+    seq = ((block.reshape(-1, 1) >> shifts) & 3).ravel()
+    seq = seq[start % 4:start % 4 + end - start].astype(np.int8)
+    block = np.asarray(mask[start // 8:(end + 7) // 8])
+    is_n = np.unpackbits(block)[start % 8:start % 8 + end - start]
+    seq[is_n.astype(bool)] = dna.CHAR_TO_INT['N']
+    return seq
+
+
+class GenomeStore(object):
+    """Reads integer-encoded chromosome sequences from a genome store.
+
+    Parameters
+    ----------
+    dirname: str
+        Directory of the genome store.
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.index = OrderedDict()
+        self.encoding = ENCODINGS[0]
+        with open(os.path.join(dirname, INDEX_FILE), 'r') as index_file:
+            for line in index_file:
+                line = line.rstrip('\n').split('\t')
+                if line[0] == '#encoding':
+                    self.encoding = line[1]
+                elif not line[0].startswith('#'):
+                    self.index[line[0]] = tuple([int(x) for x in line[1:4]])
+        if self.encoding not in ENCODINGS:
+            raise ValueError('Invalid encoding "%s"!' % self.encoding)
+        self._seq = self._memmap(SEQ_FILE, np.int8)
+        self._mask = None
+        if self.encoding == '2bit':
+            self._seq = self._seq.view(np.uint8)
+            self._mask = self._memmap(MASK_FILE, np.uint8)
+
+    def _memmap(self, filename, dtype):
+        filename = os.path.join(self.dirname, filename)
+        if not os.path.getsize(filename):
+            return np.empty(0, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode='r')
+
+    @property
+    def chromos(self):
+        return list(self.index.keys())
+
+    def __contains__(self, chromo):
+        return chromo in self.index
+
+    def get_len(self, chromo):
+        """Returns the length of chromosome `chromo`."""
+        return self.index[chromo][0]
+
+    def seq(self, chromo, start=0, end=None):
+        """Returns integer-encoded sequence of `chromo` in [`start`, `end`).
+
+        Parameters
+        ----------
+        chromo: str
+            Chromosome name.
+        start: int
+            0-based start position.
+        end: int
+            0-based end position (exclusive). Chromosome end if `None`.
+
+        Returns
+        -------
+        np.array
+            int8 array with integer-encoded sequence. Read-only view of the
+            memory-mapped store with `int8` encoding.
+        """
+        if chromo not in self.index:
+            raise ValueError('Chromosome "%s" not in genome store "%s"!' %
+                             (chromo, self.dirname))
+        length, offset, mask_offset = self.index[chromo]
+        start = max(0, start)
+        end = length if end is None else min(length, end)
+        end = max(start, end)
+        if self.encoding == 'int8':
+            return self._seq[offset + start:offset + end]
+        packed = self._seq[offset:offset + (length + 3) // 4]
+        mask = self._mask[mask_offset:mask_offset + (length + 7) // 8]
+        return unpack_2bit(packed, mask, start, end)
+
+    def windows(self, chromo, pos, wlen, seq_index=1):
+        """Returns sequence windows centered on positions of `chromo`.
+
+        Windows are gathered from the store by a single vectorized lookup,
+        without reading the entire chromosome. Bases outside the chromosome
+        are 'N'.
+
+        Parameters
+        ----------
+        chromo: str
+            Chromosome name.
+        pos: np.array
+            Positions of window centers.
+        wlen: int
+            Window length.
+        seq_index: int
+            Offset at which positions start.
+
+        Returns
+        -------
+        np.array
+            int8 array of shape [len(pos), wlen] with integer-encoded windows.
+        """
+        if chromo not in self.index:
+            raise ValueError('Chromosome "%s" not in genome store "%s"!' %
+                             (chromo, self.dirname))
+        length, offset, mask_offset = self.index[chromo]
+        delta = wlen // 2
+        idx = np.asarray(pos, dtype=np.int64).reshape(-1, 1) - seq_index + \
+            np.arange(-delta, wlen - delta, dtype=np.int64)
+        inside = (idx >= 0) & (idx < length)
+        if not length:
+            wins = np.empty(idx.shape, dtype=np.int8)
+        elif self.encoding == 'int8':
+            wins = np.asarray(self._seq[offset + np.where(inside, idx, 0)])
+        else:
+            idx = np.where(inside, idx, 0)
+            shifts = (6 - 2 * (idx % 4)).astype(np.uint8)
+            wins = ((self._seq[offset + idx // 4] >> shifts) & 3)
+            wins = wins.astype(np.int8)
+            shifts = (7 - idx % 8).astype(np.uint8)
+            is_n = (self._mask[mask_offset + idx // 8] >> shifts) & 1
+            wins[is_n.astype(bool)] = dna.CHAR_TO_INT['N']
+        wins[~inside] = dna.CHAR_TO_INT['N']
+        return wins
+
+    def sample_windows(self, chromos, pos, wlen, rng=None):
+        """Returns sequence windows of sites on different chromosomes.
+
+        Windows are read by :meth:`windows` for each chromosome, and missing
+        nucleotides ('N') are chosen randomly as by `dcpg_data.py`, such that
+        the windows of data files created with `dcpg_data.py --dna_ref` can
+        be reconstructed.
+
+        Parameters
+        ----------
+        chromos: np.array
+            Chromosome names of sites as str or bytes, e.g. the `chromo`
+            dataset of data files.
+        pos: np.array
+            Positions (1-based) of sites.
+        wlen: int
+            Window length.
+        rng: np.random.RandomState
+            Random number generator for choosing missing nucleotides. Uses
+            the global generator of `np.random` if `None`.
+
+        Returns
+        -------
+        np.array
+            int8 array of shape [len(pos), wlen] with integer-encoded windows
+            without 'N'.
+        """
+        if rng is None:
+            rng = np.random
+        chromos = np.asarray(chromos)
+        pos = np.asarray(pos)
+        wins = np.empty((len(pos), wlen), dtype=np.int8)
+        for chromo in np.unique(chromos):
+            idx = chromos == chromo
+            if isinstance(chromo, bytes):
+                chromo = chromo.decode()
+            wins[idx] = self.windows(str(chromo), pos[idx], wlen)
+        idx = wins == dna.CHAR_TO_INT['N']
+        wins[idx] = rng.randint(0, 4, idx.sum())
+        return wins
+
+
+def write_store(dirname, seqs, encoding='int8'):
+    """Writes sequences to a genome store.
+
+    Parameters
+    ----------
+    dirname: str
+        Output directory. Existing store files will be overwritten.
+    seqs: iterable
+        Iterable of tuples (`chromo`, `seq`), where `seq` is a DNA sequence or
+        an integer-encoded int8 array.
+    encoding: str
+        `int8` to store one byte per base or `2bit` to store four bases per
+        byte and a bit-packed N mask.
+
+    Returns
+    -------
+    list
+        Names of stored chromosomes.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError('Invalid encoding "%s"!' % encoding)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    index_filename = os.path.join(dirname, INDEX_FILE)
+    if os.path.exists(index_filename):
+        os.remove(index_filename)
+    index = OrderedDict()
+    offset = 0
+    mask_offset = 0
+    seq_file = open(os.path.join(dirname, SEQ_FILE), 'wb')
+    mask_file = open(os.path.join(dirname, MASK_FILE), 'wb')
+    for chromo, seq in seqs:
+        if chromo in index:
+            raise ValueError('Chromosome "%s" stored twice!' % chromo)
+        if not (isinstance(seq, np.ndarray) and seq.dtype == np.int8):
+            seq = dna.ascii_to_int(seq)
+        index[chromo] = (len(seq), offset, mask_offset)
+        if encoding == 'int8':
+            seq_file.write(seq.tobytes())
+            offset += len(seq)
+        else:
+            packed, mask = pack_2bit(seq)
+            seq_file.write(packed.tobytes())
+            mask_file.write(mask.tobytes())
+            offset += len(packed)
+            mask_offset += len(mask)
+    seq_file.close()
+    mask_file.close()
+
+    # Write index last, such that incomplete stores are not recognized
+    with open(index_filename, 'w') as index_file:
+        print('#encoding\t%s' % encoding, file=index_file)
+        for chromo, entry in index.items():
+            print('%s\t%d\t%d\t%d' % ((chromo,) + entry), file=index_file)
+    return list(index.keys())
+
+
+def fasta_to_store(filenames, dirname, chromos=None, encoding='int8'):
+    """Converts FASTA files into a genome store.
+
+    Parameters
+    ----------
+    filenames: list
+        FASTA files, which can be gzip compressed, or a directory with FASTA
+        files named "*.fa*".
+    dirname: str
+        Output directory of genome store.
+    chromos: list
+        Names of chromosomes to be stored, which are formatted by
+        :func:`format_chromo_name`, e.g. 'chrx' selects 'X'. All chromosomes
+        if `None`.
+    encoding: str
+        Encoding of genome store. See :func:`write_store`.
+
+    Returns
+    -------
+    list
+        Names of stored chromosomes.
+    """
+    filenames = to_list(filenames)
+    if len(filenames) == 1 and os.path.isdir(filenames[0]):
+        filenames = sorted(glob(os.path.join(filenames[0], '*.fa*')))
+        filenames = [filename for filename in filenames
+                     if re.search(r'\.fa(sta)?(\.gz)?$', filename)]
+
+    if chromos is not None:
+        chromos = set([format_chromo_name(chromo)
+                       for chromo in to_list(chromos)])
+
+    def select(head):
+        return chromos is None or format_chromo_name(head) in chromos
+
+    def iter_seqs():
+        for filename in filenames:
+            for fasta_seq in fasta.iter_file(filename, encode=True,
+                                             select=select):
+                yield (format_chromo_name(fasta_seq.head), fasta_seq.seq)
+
+    return write_store(dirname, iter_seqs(), encoding=encoding)
@@ -1,6 +1,7 @@
 from __future__ import division
 from __future__ import print_function
 
+from collections import OrderedDict
 import re
 
 import h5py as h5
@@ -8,8 +9,58 @@ import numpy as np
 import six
 from six.moves import range
 
+from . import packing
 from ..utils import filter_regex, to_list
 
+# Attribute of matrix datasets with the names of columns
+NAMES_ATTR = 'names'
+
+
+def get_names(dataset):
+    """Returns column names of matrix dataset or `None`.
+
+    Matrix datasets store data of multiple cells as columns, i.e. along the
+    second dimension, and have an attribute with the names of columns.
+    Column `name` of matrix dataset `matrix` can be read as `matrix/name`.
+    """
+    names = dataset.attrs.get(NAMES_ATTR)
+    if names is None:
+        return None
+    return [name.decode() if isinstance(name, bytes) else str(name)
+            for name in names]
+
+
+def set_names(dataset, names):
+    """Sets column names of matrix dataset. See :func:`get_names`."""
+    dataset.attrs[NAMES_ATTR] = np.array([name.encode() for name in names])
+
+
+def resolve(h5_file, name):
+    """Returns tuple (`dataset`, `column`) with dataset `name`, or matrix
+    dataset and column index if `name` is a column of a matrix dataset.
+    `column` is `None` if `name` is a dataset. Raises `ValueError` if `name`
+    does not exist.
+
+    Encoded datasets are returned as
+    :class:`deepcpg.data.packing.EncodedDataset`, which decodes rows when
+    they are read.
+    """
+    def get(name):
+        dataset = h5_file[name]
+        if packing.get_encoding(dataset) is not None:
+            dataset = packing.EncodedDataset(dataset)
+        return dataset
+
+    if name in h5_file and isinstance(h5_file[name], h5.Dataset):
+        return (get(name), None)
+    matrix, _, column = name.rpartition('/')
+    if matrix and matrix in h5_file and \
+            isinstance(h5_file[matrix], h5.Dataset):
+        names = get_names(h5_file[matrix])
+        if names is not None and column in names:
+            return (get(matrix), names.index(column))
+    raise ValueError('%s does not exist!' % name)
+
 
 def _ls(item, recursive=False, groups=False, level=0):
     keys = []
@@ -20,21 +71,36 @@ def _ls(item, recursive=False, groups=False, level=0):
             for key in list(item.keys()):
                 keys.extend(_ls(item[key], recursive, groups, level + 1))
     elif not groups:
-        keys.append(item.name)
+        names = get_names(item)
+        if names is None:
+            keys.append(item.name)
+        else:
+            keys.extend(['%s/%s' % (item.name, name) for name in names])
     return keys
 
 
 def ls(filename, group='/', recursive=False, groups=False,
        regex=None, nb_key=None, must_exist=True):
+    from .manifest import get_entry, ls as ls_entry
+
     if not group.startswith('/'):
         group = '/%s' % group
-    h5_file = h5.File(filename, 'r')
-    if not must_exist and not group in h5_file:
-        return None
-    keys = _ls(h5_file[group], recursive, groups)
+    entry = get_entry(filename)
+    if entry is not None:
+        # Answer from manifest without opening the file
+        keys = ls_entry(entry, group, recursive, groups)
+        if keys is None:
+            if not must_exist:
+                return None
+            raise KeyError('%s does not exist!' % group)
+    else:
+        h5_file = h5.File(filename, 'r')
+        if not must_exist and not group in h5_file:
+            return None
+        keys = _ls(h5_file[group], recursive, groups)
+        h5_file.close()
     for i, key in enumerate(keys):
         keys[i] = re.sub('^%s/' % group, '', key)
-    h5_file.close()
     if regex:
         keys = filter_regex(keys, regex)
     if nb_key is not None:
@@ -55,6 +121,152 @@ def write_data(data, filename):
         group.close()
 
 
+class StorageProfile(object):
+    """Compression and chunking of HDF5 datasets.
+
+    Parameters
+    ----------
+    compression: str
+        `gzip`, `lzf`, or `None` for no compression.
+    level: int
+        Compression level of `gzip` between 0 and 9. Defaults to 4.
+    shuffle: bool
+        If `True`, apply shuffle filter before compression, which groups the
+        bytes of values and often improves compression of multi-byte types.
+    chunk_rows: int
+        Number of rows of chunks. Should be a multiple of the number of rows
+        that are read at once, e.g. the batch size of :func:`reader`, such
+        that reading a batch decompresses only the chunks that contain it.
+        Chunks are chosen by h5py if `None`.
+    """
+
+    def __init__(self, compression='gzip', level=None, shuffle=False,
+                 chunk_rows=None):
+        if compression not in ['gzip', 'lzf', None]:
+            raise ValueError('Invalid compression "%s"!' % compression)
+        if level is not None and compression != 'gzip':
+            raise ValueError('Compression level requires gzip!')
+        self.compression = compression
+        self.level = level
+        self.shuffle = shuffle
+        self.chunk_rows = chunk_rows
+
+    @classmethod
+    def parse(cls, spec):
+        """Creates profile from name of :data:`STORAGE_PROFILES` or string of
+        comma-separated options, e.g. `gzip:6,shuffle,chunk_rows=1024`.
+
+        The first option is the compression, i.e. `gzip[:level]`, `lzf`, or
+        `none`, followed by optional `shuffle` and `chunk_rows=<rows>`.
+        """
+        spec = STORAGE_PROFILES.get(spec, spec)
+        options = spec.split(',')
+        compression, _, level = options[0].partition(':')
+        kwargs = dict()
+        kwargs['compression'] = None if compression == 'none' else compression
+        if level:
+            kwargs['level'] = int(level)
+        for option in options[1:]:
+            key, _, value = option.partition('=')
+            if key == 'shuffle' and not value:
+                kwargs['shuffle'] = True
+            elif key == 'chunk_rows' and value:
+                kwargs['chunk_rows'] = int(value)
+            else:
+                raise ValueError('Invalid storage option "%s"!' % option)
+        return cls(**kwargs)
+
+    def get_kwargs(self, shape, rows_per_row=1):
+        """Returns named arguments of `h5py.Group.create_dataset` to create a
+        dataset of shape `shape`, one row of which stores `rows_per_row`
+        rows, e.g. of an encoded dataset."""
+        kwargs = dict()
+        if self.compression is not None:
+            kwargs['compression'] = self.compression
+            if self.level is not None:
+                kwargs['compression_opts'] = self.level
+        if self.shuffle:
+            kwargs['shuffle'] = True
+        if self.chunk_rows and len(shape) and shape[0]:
+            rows = max(1, self.chunk_rows // rows_per_row)
+            kwargs['chunks'] = (min(rows, shape[0]),) + tuple(shape[1:])
+        return kwargs
+
+
+# Predefined storage profiles. `default` corresponds to compressing with gzip
+# and chunks chosen by h5py.
+STORAGE_PROFILES = OrderedDict([
+    ('default', 'gzip'),
+    ('fast', 'lzf,shuffle,chunk_rows=1024'),
+    ('small', 'gzip:9,shuffle,chunk_rows=1024'),
+    ('none', 'none')])
+
+
+def get_storage_profile(profile=None):
+    """Returns :class:`StorageProfile` of `profile`, which can be a profile,
+    a string parsed by :meth:`StorageProfile.parse`, or `None` for the
+    `default` profile."""
+    if profile is None:
+        profile = 'default'
+    if isinstance(profile, StorageProfile):
+        return profile
+    return StorageProfile.parse(profile)
+
+
+def create_dataset(group, name, data=None, shape=None, dtype=None,
+                   profile=None, encoding=None, **kwargs):
+    """Creates dataset with storage options of a storage profile.
+
+    Parameters
+    ----------
+    group: h5py.Group
+        HDF5 group or file.
+    name: str
+        Name of dataset.
+    data: np.array
+        Data of dataset. If `None`, an empty dataset with `shape` and `dtype`
+        is created.
+    shape: tuple
+        Shape of empty dataset.
+    dtype: np.dtype
+        Type of dataset.
+    profile: str or StorageProfile
+        Storage profile. See :func:`get_storage_profile`.
+    encoding: str
+        Name of encoding of `data`. See :mod:`deepcpg.data.packing`.
+    **kwargs: dict
+        Named arguments of `h5py.Group.create_dataset`, which overwrite the
+        arguments of the storage profile.
+
+    Returns
+    -------
+    h5py.Dataset
+        Created dataset.
+    """
+    attrs = dict()
+    rows_per_row = 1
+    if encoding is not None:
+        if data is None:
+            raise ValueError('Encoding requires data!')
+        data, attrs = packing.encode(data, encoding)
+        rows_per_row = packing.ROWS_PER_ROW[encoding]
+        dtype = None
+    if data is not None:
+        if dtype is not None:
+            data = np.asarray(data).astype(dtype, copy=False)
+        shape = np.shape(data)
+    _kwargs = get_storage_profile(profile).get_kwargs(shape, rows_per_row)
+    _kwargs.update(kwargs)
+    if data is None:
+        dataset = group.create_dataset(name, shape=shape, dtype=dtype,
+                                       **_kwargs)
+    else:
+        dataset = group.create_dataset(name, data=data, **_kwargs)
+    for key, value in six.iteritems(attrs):
+        dataset.attrs[key] = value
+    return dataset
+
+
 def hnames_to_names(hnames):
     names = []
     for key, value in six.iteritems(hnames):
@@ -71,8 +283,45 @@ def hnames_to_names(hnames):
     return names
 
 
+def _read_rows(dataset, rows):
+    """Reads sorted `rows` of `dataset` from the range of rows that contains
+    them."""
+    if not len(rows):
+        return dataset[0:0]
+    return dataset[rows[0]:rows[-1] + 1][rows - rows[0]]
+
+
 def reader(data_files, names, batch_size=128, nb_sample=None, shuffle=False,
-           loop=False):
+           loop=False, regions=None):
+    """Reads datasets `names` of `data_files` in batches.
+
+    Parameters
+    ----------
+    data_files: list
+        Data files.
+    names: list or dict
+        Names of datasets. See :func:`hnames_to_names`.
+    batch_size: int
+        Maximum number of samples per batch. Batches do not span files.
+    nb_sample: int
+        Maximum number of samples.
+    shuffle: bool
+        If `True`, shuffle files and samples within files.
+    loop: bool
+        If `True`, loop over files indefinitely.
+    regions: tuple or str
+        If provided, only read samples in genomic regions, which are given by
+        a tuple (`chromo`, `start`, `end`) of arrays or a BED file. See
+        :func:`deepcpg.data.range_index.get_region_rows`.
+
+    Returns
+    -------
+    generator
+        Generator of dicts with batches by dataset name.
+    """
+    from .manifest import get_entry, has_dataset
+    from .range_index import get_region_rows
+
     if isinstance(names, dict):
         names = hnames_to_names(names)
     else:
@@ -80,12 +329,24 @@ def reader(data_files, names, batch_size=128, nb_sample=None, shuffle=False,
     # Copy, since list will be changes if shuffle=True
     data_files = list(to_list(data_files))
 
+    file_rows = None
+    if regions is not None:
+        file_rows = get_region_rows(data_files, regions)
+        data_files = list(file_rows.keys())
+        if not data_files:
+            return
+
     # Check if names exist
-    h5_file = h5.File(data_files[0], 'r')
-    for name in names:
-        if name not in h5_file:
-            raise ValueError('%s does not exist!' % name)
-    h5_file.close()
+    entry = get_entry(data_files[0])
+    if entry is not None:
+        for name in names:
+            if not has_dataset(entry, name):
+                raise ValueError('%s does not exist!' % name)
+    else:
+        h5_file = h5.File(data_files[0], 'r')
+        for name in names:
+            resolve(h5_file, name)
+        h5_file.close()
 
     if nb_sample:
         # Select the first k files s.t. the total sample size is at least
@@ -93,9 +354,15 @@ def reader(data_files, names, batch_size=128, nb_sample=None, shuffle=False,
         _data_files = []
         nb_seen = 0
         for data_file in data_files:
-            h5_file = h5.File(data_file, 'r')
-            nb_seen += len(h5_file[names[0]])
-            h5_file.close()
+            entry = get_entry(data_file)
+            if file_rows is not None:
+                nb_seen += len(file_rows[data_file])
+            elif entry is not None:
+                nb_seen += entry['nb_sample']
+            else:
+                h5_file = h5.File(data_file, 'r')
+                nb_seen += len(resolve(h5_file, names[0])[0])
+                h5_file.close()
             _data_files.append(data_file)
             if nb_seen >= nb_sample:
                 break
@@ -110,10 +377,19 @@ def reader(data_files, names, batch_size=128, nb_sample=None, shuffle=False,
             np.random.shuffle(data_files)
 
         h5_file = h5.File(data_files[file_idx], 'r')
+        # Columns of the same matrix dataset are read at once
         data_file = dict()
+        columns = dict()
         for name in names:
-            data_file[name] = h5_file[name]
-        nb_sample_file = len(list(data_file.values())[0])
+            dataset, column = resolve(h5_file, name)
+            data_file[dataset.name] = dataset
+            columns[name] = (dataset.name, column)
+        rows = None
+        if file_rows is not None:
+            rows = file_rows[data_files[file_idx]]
+            nb_sample_file = len(rows)
+        else:
+            nb_sample_file = len(list(data_file.values())[0])
 
         if shuffle:
             # Shuffle data within the entire file, which requires reading
@@ -121,7 +397,10 @@ def reader(data_files, names, batch_size=128, nb_sample=None, shuffle=False,
             idx = np.arange(nb_sample_file)
             np.random.shuffle(idx)
             for name, value in six.iteritems(data_file):
-                data_file[name] = value[:len(idx)][idx]
+                if rows is None:
+                    data_file[name] = value[:len(idx)][idx]
+                else:
+                    data_file[name] = _read_rows(value, rows)[idx]
 
         nb_batch = int(np.ceil(nb_sample_file / batch_size))
         for batch in range(nb_batch):
@@ -132,9 +411,19 @@ def reader(data_files, names, batch_size=128, nb_sample=None, shuffle=False,
             if _batch_size == 0:
                 break
 
+            values = dict()
+            for name, value in six.iteritems(data_file):
+                if rows is None or shuffle:
+                    values[name] = value[batch_start:batch_end]
+                else:
+                    values[name] = _read_rows(
+                        value, rows[batch_start:batch_end])
             data_batch = dict()
             for name in names:
-                data_batch[name] = data_file[name][batch_start:batch_end]
+                dataset, column = columns[name]
+                data_batch[name] = values[dataset]
+                if column is not None:
+                    data_batch[name] = data_batch[name][:, column]
             yield data_batch
 
             nb_seen += _batch_size
@@ -188,6 +477,8 @@ def read_from(reader, nb_sample=None):
 
 
 def read(data_files, names, nb_sample=None, batch_size=1024, *args, **kwargs):
+    """Reads datasets `names` of `data_files` into memory. See
+    :func:`reader`."""
     data_reader = reader(data_files, names, batch_size=batch_size,
                          nb_sample=nb_sample, loop=False, *args, **kwargs)
     return read_from(data_reader, nb_sample)
@@ -0,0 +1,229 @@
+"""Vectorized operations on genomic intervals.
+
+Intervals are given by arrays of 1-based inclusive `start` and `end`
+positions. Functions optionally take arrays with chromosome names of
+positions and intervals, such that intervals of multiple chromosomes can be
+processed in one call. Intervals and positions are then encoded as 64-bit
+keys, which are sorted by chromosome and position, such that intervals on
+different chromosomes never overlap.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+# Offset between keys of consecutive chromosomes
+_CHROMO_OFFSET = 2**32
+
+
+def _get_chromos(*chromos):
+    """Returns sorted unique chromosome names of arrays `chromos`."""
+    return np.unique(np.concatenate([np.asarray(chromo).ravel()
+                                     for chromo in chromos]))
+
+
+def _encode(values, chromo=None, chromos=None):
+    """Encodes positions `values` on chromosomes `chromo` as int64 keys."""
+    values = np.asarray(values, dtype=np.int64)
+    if chromo is None:
+        return values
+    codes = np.searchsorted(chromos, np.asarray(chromo)).astype(np.int64)
+    return codes * _CHROMO_OFFSET + (values + _CHROMO_OFFSET // 2)
+
+
+def _decode(keys, chromos=None):
+    """Decodes keys into tuple (`chromo`, `values`)."""
+    if chromos is None:
+        return (None, keys)
+    codes = keys // _CHROMO_OFFSET
+    values = keys - codes * _CHROMO_OFFSET - _CHROMO_OFFSET // 2
+    return (chromos[codes], values)
+
+
+def _sort(start, end, chromo=None, chromos=None):
+    """Encodes and sorts intervals by chromosome and start.
+
+    Returns
+    -------
+    tuple
+        Tuple (`start`, `end`, `order`) with encoded `start` and `end` sorted
+        by `order`.
+    """
+    start = _encode(start, chromo, chromos)
+    end = _encode(end, chromo, chromos)
+    order = np.argsort(start, kind='mergesort')
+    return (start[order], end[order], order)
+
+
+def _new_group(start, end):
+    """Returns boolean array, which is `True` for the first interval of groups
+    of overlapping intervals sorted by start."""
+    new = np.ones(len(start), dtype=bool)
+    if len(start):
+        new[1:] = start[1:] > np.maximum.accumulate(end)[:-1]
+    return new
+
+
+def merge(start, end, chromo=None):
+    """Merges overlapping intervals.
+
+    Intervals that overlap or share a position are merged by comparing
+    starts with the cumulative maximum of ends.
+
+    Parameters
+    ----------
+    start: np.array
+        Start of intervals.
+    end: np.array
+        End of intervals.
+    chromo: np.array
+        Optional chromosome of intervals.
+
+    Returns
+    -------
+    tuple
+        Tuple (`start`, `end`) of merged intervals sorted by start, or
+        (`chromo`, `start`, `end`) if `chromo` is provided.
+    """
+    chromos = None
+    if chromo is not None:
+        chromos = _get_chromos(chromo)
+    start, end, _ = _sort(start, end, chromo, chromos)
+    new = _new_group(start, end)
+    first = np.flatnonzero(new)
+    last = np.empty_like(first)
+    last[:-1] = first[1:] - 1
+    last[-1:] = len(start) - 1
+    merged_start = start[first]
+    merged_end = np.maximum.accumulate(end)[last]
+    chromo, merged_start = _decode(merged_start, chromos)
+    _, merged_end = _decode(merged_end, chromos)
+    if chromos is None:
+        return (merged_start, merged_end)
+    return (chromo, merged_start, merged_end)
+
+
+def group(start, end, chromo=None):
+    """Assigns group index to intervals. Overlapping intervals are assigned
+    to the same group.
+
+    Parameters
+    ----------
+    start: np.array
+        Start of intervals.
+    end: np.array
+        End of intervals.
+    chromo: np.array
+        Optional chromosome of intervals.
+
+    Returns
+    -------
+    np.array
+        int32 array of length `len(start)` with group indices, which increase
+        with the start of intervals.
+    """
+    chromos = None
+    if chromo is not None:
+        chromos = _get_chromos(chromo)
+    start, end, order = _sort(start, end, chromo, chromos)
+    groups = np.empty(len(start), dtype=np.int32)
+    groups[order] = np.cumsum(_new_group(start, end)) - 1
+    return groups
+
+
+def index(pos, start, end, pos_chromo=None, chromo=None):
+    """Returns for positions `pos[i]` index `j` of the interval that contains
+    `pos[i]`, or -1.
+
+    Intervals must be non-overlapping.
+
+    Parameters
+    ----------
+    pos: np.array
+        Positions.
+    start: np.array
+        Start of intervals.
+    end: np.array
+        End of intervals.
+    pos_chromo: np.array
+        Optional chromosome of positions. Requires `chromo`.
+    chromo: np.array
+        Optional chromosome of intervals. Requires `pos_chromo`.
+
+    Returns
+    -------
+    np.array
+        Array of length `len(pos)` with indices of intervals or -1.
+    """
+    chromos = None
+    if chromo is not None:
+        chromos = _get_chromos(chromo, pos_chromo)
+    start, end, order = _sort(start, end, chromo, chromos)
+    pos = _encode(pos, pos_chromo, chromos)
+    idx = np.searchsorted(start, pos, side='right') - 1
+    found = idx >= 0
+    found[found] = pos[found] <= end[idx[found]]
+    rv = np.empty(len(pos), dtype=np.int64)
+    rv.fill(-1)
+    rv[found] = order[idx[found]]
+    return rv
+
+
+def is_in(pos, start, end, pos_chromo=None, chromo=None):
+    """Tests if positions are in non-overlapping intervals. See :func:`index`.
+    """
+    return index(pos, start, end, pos_chromo, chromo) >= 0
+
+
+def distance(pos, start, end, pos_chromo=None, chromo=None):
+    """Returns distance of positions to the nearest interval.
+
+    Intervals must be non-overlapping. The distance of positions inside an
+    interval is zero.
+
+    Parameters
+    ----------
+    pos: np.array
+        Positions.
+    start: np.array
+        Start of intervals.
+    end: np.array
+        End of intervals.
+    pos_chromo: np.array
+        Optional chromosome of positions. Requires `chromo`.
+    chromo: np.array
+        Optional chromosome of intervals. Requires `pos_chromo`.
+
+    Returns
+    -------
+    np.array
+        float64 array of length `len(pos)` with distances. `np.inf` for
+        positions on chromosomes without intervals.
+    """
+    chromos = None
+    if chromo is not None:
+        chromos = _get_chromos(chromo, pos_chromo)
+    start, end, _ = _sort(start, end, chromo, chromos)
+    pos = _encode(pos, pos_chromo, chromos)
+    # Index of last interval with start <= pos. Since intervals are
+    # non-overlapping, it is also the last interval with end < pos if pos
+    # is not inside the interval.
+    left = np.searchsorted(start, pos, side='right') - 1
+    right = left + 1
+    dist = np.empty(len(pos))
+    dist.fill(np.inf)
+
+    has_left = left >= 0
+    if chromos is not None:
+        has_left[has_left] = start[left[has_left]] // _CHROMO_OFFSET == \
+            pos[has_left] // _CHROMO_OFFSET
+    dist[has_left] = np.maximum(0, pos[has_left] - end[left[has_left]])
+
+    has_right = right < len(start)
+    if chromos is not None:
+        has_right[has_right] = start[right[has_right]] // _CHROMO_OFFSET == \
+            pos[has_right] // _CHROMO_OFFSET
+    dist[has_right] = np.minimum(dist[has_right],
+                                 start[right[has_right]] - pos[has_right])
+    return dist
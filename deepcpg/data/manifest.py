@@ -0,0 +1,301 @@
+"""Manifests of data directories.
+
+A manifest is a JSON file `manifest.json` in a directory of `dcpg_data.py`
+output files, which describes each data file by its
+
+* number of samples,
+* chromosome and position ranges,
+* names, shapes, and types of datasets, including column names of matrix
+  datasets,
+* layout version and genome store.
+
+Functions such as :func:`deepcpg.data.utils.get_nb_sample` or
+:func:`deepcpg.data.hdf.reader` use the manifest to answer queries without
+opening data files. Files that are not listed in the manifest of their
+directory are opened as before, and entries are ignored if the size or
+modification time of their file changed. `dcpg_data.py` writes manifests,
+and `dcpg_data_manifest.py` builds or checks manifests of existing
+directories, e.g. after data files have been modified.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import glob
+import json
+import os
+
+import h5py as h5
+import numpy as np
+import six
+
+from . import hdf
+
+MANIFEST_FILE = 'manifest.json'
+VERSION = 1
+
+# Manifests by filename, which are reloaded if their file is modified
+_CACHE = dict()
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        value = value.decode()
+    return value
+
+
+def _stat(filename):
+    stat = os.stat(filename)
+    return (stat.st_size, stat.st_mtime)
+
+
+def describe(filename):
+    """Describes data file `filename` by an entry of a manifest.
+
+    Returns
+    -------
+    OrderedDict
+        Entry with keys
+
+        * `nb_sample`: number of samples.
+        * `regions`: list of [chromo, first position, last position, first
+          row, last row + 1] of consecutive rows on the same chromosome.
+        * `layout`: layout version. See :func:`deepcpg.data.utils.get_layout`.
+        * `dna_store`, `dna_wlen`: genome store and length of DNA sequence
+          windows if windows are read from a genome store, or `None`.
+        * `groups`: names of groups.
+        * `datasets`: shape, type, encoding, and column names of datasets by
+          name.
+        * `size`, `mtime`: size and modification time of the file.
+    """
+    entry = OrderedDict()
+    h5_file = h5.File(filename, 'r')
+    chromo = h5_file['chromo'][:]
+    pos = h5_file['pos'][:]
+    entry['nb_sample'] = len(pos)
+    regions = []
+    if len(pos):
+        starts = np.r_[0, np.flatnonzero(chromo[1:] != chromo[:-1]) + 1]
+        ends = np.r_[starts[1:], len(pos)]
+        for start, end in zip(starts, ends):
+            _pos = pos[start:end]
+            regions.append([_decode(chromo[start]), int(_pos.min()),
+                            int(_pos.max()), int(start), int(end)])
+    entry['regions'] = regions
+    entry['layout'] = int(h5_file.attrs.get('layout', 1))
+    entry['dna_store'] = None
+    entry['dna_wlen'] = None
+    if 'inputs' in h5_file and '/inputs/dna' not in h5_file:
+        attrs = h5_file['inputs'].attrs
+        entry['dna_store'] = _decode(attrs.get('dna_store'))
+        if 'dna_wlen' in attrs:
+            entry['dna_wlen'] = int(attrs['dna_wlen'])
+    entry['groups'] = hdf._ls(h5_file, recursive=True, groups=True)
+
+    datasets = OrderedDict()
+    names = []
+    h5_file.visititems(lambda name, item: names.append(name)
+                       if isinstance(item, h5.Dataset) else None)
+    for name in names:
+        dataset = h5_file[name]
+        desc = OrderedDict()
+        desc['shape'] = list(hdf.resolve(h5_file, name)[0].shape)
+        desc['dtype'] = dataset.dtype.str
+        encoding = dataset.attrs.get('encoding')
+        if encoding is not None:
+            desc['encoding'] = _decode(encoding)
+        columns = hdf.get_names(dataset)
+        if columns is not None:
+            desc['names'] = columns
+        datasets[dataset.name] = desc
+    entry['datasets'] = datasets
+    h5_file.close()
+    entry['size'], entry['mtime'] = _stat(filename)
+    return entry
+
+
+class Manifest(object):
+    """Manifest of data directory `dirname`.
+
+    Parameters
+    ----------
+    dirname: str
+        Data directory.
+    files: OrderedDict
+        Entries created by :func:`describe` by basename of data files.
+    """
+
+    def __init__(self, dirname, files=None):
+        self.dirname = dirname
+        if files is None:
+            files = OrderedDict()
+        self.files = files
+
+    @property
+    def filename(self):
+        return os.path.join(self.dirname, MANIFEST_FILE)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, data_file):
+        return os.path.basename(data_file) in self.files
+
+    def get(self, data_file):
+        """Returns entry of `data_file` or `None`."""
+        return self.files.get(os.path.basename(data_file))
+
+    def is_current(self, data_file):
+        """Tests if the entry of `data_file` exists and the size and
+        modification time of `data_file` did not change since it has been
+        created."""
+        entry = self.get(data_file)
+        if entry is None:
+            return False
+        filename = os.path.join(self.dirname, os.path.basename(data_file))
+        try:
+            stat = _stat(filename)
+        except OSError:
+            return False
+        return list(stat) == [entry['size'], entry['mtime']]
+
+    def update(self, data_files):
+        """Adds or updates entries of `data_files`, and removes entries of
+        files that no longer exist."""
+        for data_file in data_files:
+            self.files[os.path.basename(data_file)] = describe(data_file)
+        self.files = OrderedDict(
+            [(name, entry) for name, entry in sorted(six.iteritems(self.files))
+             if os.path.isfile(os.path.join(self.dirname, name))])
+
+    def remove(self, data_files):
+        """Removes entries of `data_files`."""
+        for data_file in data_files:
+            self.files.pop(os.path.basename(data_file), None)
+
+    def check(self):
+        """Returns names of data files, which are not listed in the manifest,
+        missing, or modified since their entry has been created."""
+        stale = [name for name in self.files if not self.is_current(name)]
+        for filename in find_data_files(self.dirname):
+            if filename not in self:
+                stale.append(os.path.basename(filename))
+        return sorted(stale)
+
+    @classmethod
+    def build(cls, dirname, data_files=None):
+        """Builds manifest of `data_files` or all data files in `dirname`."""
+        if data_files is None:
+            data_files = find_data_files(dirname)
+        manifest = cls(dirname)
+        manifest.update(data_files)
+        return manifest
+
+    def save(self):
+        """Writes manifest to `dirname`.
+
+        The manifest is first written to a temporary file, which is then
+        renamed, such that readers never see an incomplete manifest.
+        """
+        data = OrderedDict()
+        data['version'] = VERSION
+        data['files'] = self.files
+        tmp_file = '%s.%d.tmp' % (self.filename, os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_file, self.filename)
+
+    @classmethod
+    def load(cls, dirname):
+        """Reads manifest of `dirname` or returns `None` if it does not
+        exist."""
+        filename = os.path.join(dirname, MANIFEST_FILE)
+        if not os.path.isfile(filename):
+            return None
+        with open(filename) as f:
+            data = json.load(f, object_pairs_hook=OrderedDict)
+        if data.get('version') != VERSION:
+            raise ValueError('Invalid manifest version of %s!' % filename)
+        return cls(dirname, data['files'])
+
+
+def find_data_files(dirname):
+    """Returns sorted filenames of data files in `dirname`."""
+    return sorted(glob.glob(os.path.join(dirname, '*.h5')))
+
+
+def get_manifest(dirname):
+    """Returns cached manifest of `dirname` or `None`."""
+    filename = os.path.join(os.path.abspath(dirname), MANIFEST_FILE)
+    try:
+        mtime = os.path.getmtime(filename)
+    except OSError:
+        _CACHE.pop(filename, None)
+        return None
+    cached = _CACHE.get(filename)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, Manifest.load(os.path.dirname(filename)))
+        _CACHE[filename] = cached
+    return cached[1]
+
+
+def get_entry(data_file):
+    """Returns entry of `data_file` in the manifest of its directory, or
+    `None` if the file is not listed or modified since its entry has been
+    created."""
+    if not isinstance(data_file, six.string_types):
+        return None
+    manifest = get_manifest(os.path.dirname(os.path.abspath(data_file)))
+    if manifest is None or not manifest.is_current(data_file):
+        return None
+    return manifest.get(data_file)
+
+
+def _columns(name, desc):
+    if 'names' in desc:
+        return ['%s/%s' % (name, column) for column in desc['names']]
+    return [name]
+
+
+def has_dataset(entry, name):
+    """Tests if dataset or matrix column `name` exists. See
+    :func:`deepcpg.data.hdf.resolve`."""
+    if not name.startswith('/'):
+        name = '/%s' % name
+    datasets = entry['datasets']
+    if name in datasets:
+        return True
+    matrix, _, column = name.rpartition('/')
+    return matrix in datasets and \
+        column in datasets[matrix].get('names', [])
+
+
+def ls(entry, group='/', recursive=False, groups=False):
+    """Lists datasets or groups of `group` like :func:`deepcpg.data.hdf.ls`.
+
+    Returns
+    -------
+    list
+        Absolute names of datasets or groups, or `None` if `group` does not
+        exist.
+    """
+    group = '/' + group.strip('/')
+    datasets = entry['datasets']
+    if group in datasets:
+        return [] if groups else _columns(group, datasets[group])
+    if group != '/' and group not in entry['groups']:
+        return None
+    prefix = group.rstrip('/') + '/'
+
+    def is_child(name):
+        return name.startswith(prefix) and \
+            (recursive or '/' not in name[len(prefix):])
+
+    if groups:
+        return [name for name in entry['groups'] if is_child(name)]
+    names = []
+    for name, desc in six.iteritems(datasets):
+        if is_child(name):
+            names.extend(_columns(name, desc))
+    return names
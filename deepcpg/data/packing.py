@@ -0,0 +1,201 @@
+"""Compact encodings of datasets of `dcpg_data.py` output files.
+
+Encoded datasets have an attribute `encoding` and are decoded when they are
+read by :func:`deepcpg.data.hdf.reader`. Supported encodings are:
+
+* `2bit`: Integer values between -1 and 2, e.g. binary CpG states with
+  missing values (`CPG_NAN`), are stored as 2-bit codes, four consecutive
+  rows per byte. The attribute `length` stores the number of rows.
+* `uint16`: Distances of neighboring CpG sites, which are positive integers
+  or `CPG_NAN`, are stored as uint16 saturated at 65535, and `CPG_NAN` as
+  zero.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+ENCODING_ATTR = 'encoding'
+LENGTH_ATTR = 'length'
+ENCODINGS = ['2bit', 'uint16']
+# Number of rows that are stored in one row of encoded datasets
+ROWS_PER_ROW = {'2bit': 4, 'uint16': 1}
+
+# Value of missing CpG sites, which is `CPG_NAN`
+_NAN = -1
+# Smallest value of 2-bit encoded arrays, which is stored as code 0
+_MIN_2BIT = -1
+_MAX_DIST = np.iinfo(np.uint16).max
+
+
+def _unpack_table():
+    table = np.empty((256, 4), dtype=np.int8)
+    codes = np.arange(256)
+    for i, shift in enumerate([6, 4, 2, 0]):
+        table[:, i] = ((codes >> shift) & 3) + _MIN_2BIT
+    return table
+
+
+# Values of the four rows encoded by a byte
+_UNPACK_TABLE = _unpack_table()
+
+
+def can_pack_2bit(x):
+    """Tests if integer array `x` can be encoded as `2bit`."""
+    x = np.asarray(x)
+    if x.dtype.kind not in 'iu':
+        return False
+    return not len(x) or (x.min() >= _MIN_2BIT and x.max() <= _MIN_2BIT + 3)
+
+
+def pack_2bit(x):
+    """Packs integer array with values between -1 and 2 into 2-bit codes.
+
+    Parameters
+    ----------
+    x: np.array
+        Array of shape [rows, ...].
+
+    Returns
+    -------
+    np.array
+        uint8 array of shape [ceil(rows / 4), ...].
+    """
+    x = np.asarray(x)
+    nb_row = int(np.ceil(len(x) / 4)) * 4
+    codes = np.zeros((nb_row,) + x.shape[1:], dtype=np.uint8)
+    codes[:len(x)] = x - _MIN_2BIT
+    codes = codes.reshape((-1, 4) + x.shape[1:])
+    packed = (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | \
+        codes[:, 3]
+    return packed.astype(np.uint8)
+
+
+def unpack_2bit(packed):
+    """Decodes array encoded by :func:`pack_2bit`.
+
+    Parameters
+    ----------
+    packed: np.array
+        uint8 array of shape [rows, ...].
+
+    Returns
+    -------
+    np.array
+        int8 array of shape [4 * rows, ...].
+    """
+    packed = np.asarray(packed)
+    values = _UNPACK_TABLE[packed]
+    values = np.moveaxis(values, -1, 1)
+    return values.reshape((-1,) + packed.shape[1:])
+
+
+def quantize_dist(dist):
+    """Encodes distances of neighboring CpG sites as saturated uint16."""
+    dist = np.asarray(dist)
+    quant = np.minimum(np.round(dist), _MAX_DIST).astype(np.uint16)
+    quant[dist == _NAN] = 0
+    return quant
+
+
+def dequantize_dist(quant, dtype=np.float32):
+    """Decodes distances encoded by :func:`quantize_dist`."""
+    quant = np.asarray(quant)
+    dist = quant.astype(dtype)
+    dist[quant == 0] = _NAN
+    return dist
+
+
+def encode(data, encoding):
+    """Encodes `data`.
+
+    Parameters
+    ----------
+    data: np.array
+        Data.
+    encoding: str
+        Name of encoding.
+
+    Returns
+    -------
+    tuple
+        Tuple (`encoded`, `attrs`) with encoded data and attributes of the
+        dataset, in which `encoded` is stored.
+    """
+    if encoding == '2bit':
+        encoded = pack_2bit(data)
+    elif encoding == 'uint16':
+        encoded = quantize_dist(data)
+    else:
+        raise ValueError('Invalid encoding "%s"!' % encoding)
+    attrs = {ENCODING_ATTR: encoding.encode(), LENGTH_ATTR: len(data)}
+    return (encoded, attrs)
+
+
+def get_encoding(dataset):
+    """Returns encoding of HDF5 dataset or `None`."""
+    encoding = dataset.attrs.get(ENCODING_ATTR)
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode()
+    return encoding
+
+
+class EncodedDataset(object):
+    """Decodes rows of an encoded HDF5 dataset when they are read.
+
+    Parameters
+    ----------
+    dataset: h5py.Dataset
+        Dataset with data encoded by :func:`encode`.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.encoding = get_encoding(dataset)
+        if self.encoding not in ENCODINGS:
+            raise ValueError('Invalid encoding "%s"!' % self.encoding)
+        self.name = dataset.name
+        self.attrs = dataset.attrs
+
+    def __len__(self):
+        return int(self.attrs[LENGTH_ATTR])
+
+    @property
+    def shape(self):
+        return (len(self),) + self.dataset.shape[1:]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, tuple):
+            values = self[idx[0]]
+            if np.ndim(idx[0]) == 0 and not isinstance(idx[0], slice):
+                return values[idx[1:]]
+            return values[(slice(None),) + idx[1:]]
+        if idx is Ellipsis:
+            return self[:]
+        if not isinstance(idx, slice):
+            # Decode only the range of rows that contains the selected rows
+            rows = np.asarray(idx)
+            if rows.dtype == bool:
+                rows = np.nonzero(rows)[0]
+            elif rows.ndim == 0:
+                row = int(rows) + len(self) * (int(rows) < 0)
+                if not 0 <= row < len(self):
+                    raise IndexError('Index %d out of range!' % int(rows))
+                return self[row:row + 1][0]
+            rows = np.where(rows < 0, rows + len(self), rows)
+            if not rows.size:
+                return self[0:0][rows]
+            start = rows.min()
+            return self[start:rows.max() + 1][rows - start]
+        start, stop, step = idx.indices(len(self))
+        stop = max(start, stop)
+        if self.encoding == '2bit':
+            # Read blocks of four rows that contain the selected rows
+            values = unpack_2bit(self.dataset[start // 4:(stop + 3) // 4])
+            values = values[start % 4:start % 4 + stop - start]
+        else:
+            values = dequantize_dist(self.dataset[start:stop])
+        if step != 1:
+            values = values[::step]
+        return values
@@ -0,0 +1,334 @@
+"""Index of genomic positions of data files.
+
+Maps positions (`chromo`, `pos`) of sites in `dcpg_data.py` output files to
+(file, row), such that the sites in genomic regions can be read as contiguous
+row ranges (hyperslabs) of data files without scanning all files.
+
+The index stores the sorted positions of each chromosome, which are divided
+into segments of consecutive rows of the same file. `dcpg_data.py` writes the
+index of its output directory to `range_index.npz`, and
+`dcpg_data_manifest.py` builds it for existing directories.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import os
+
+import h5py as h5
+import numpy as np
+import six
+
+from . import intervals
+from .manifest import find_data_files
+from ..utils import to_list
+
+INDEX_FILE = 'range_index.npz'
+
+# Indices by filename, which are reloaded if their file is modified
+_CACHE = dict()
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        value = value.decode()
+    return value
+
+
+class RangeIndex(object):
+    """Index of genomic positions of data files.
+
+    Parameters
+    ----------
+    files: list
+        Names of data files.
+    chromos: list
+        Sorted chromosome names.
+    offsets: np.array
+        Offsets of chromosome `chromos[i]` in `pos`, which is
+        `pos[offsets[i]:offsets[i + 1]]`.
+    pos: np.array
+        Sorted positions of each chromosome.
+    seg_offsets: np.array
+        Offsets of segments in `pos`, including the end of the last segment.
+        Segments are consecutive rows of the same file and chromosome.
+    seg_files: np.array
+        Index of the file of each segment in `files`.
+    seg_rows: np.array
+        Row of the first site of each segment in its file.
+    """
+
+    def __init__(self, files, chromos, offsets, pos, seg_offsets, seg_files,
+                 seg_rows):
+        self.files = files
+        self.chromos = chromos
+        self.offsets = offsets
+        self.pos = pos
+        self.seg_offsets = seg_offsets
+        self.seg_files = seg_files
+        self.seg_rows = seg_rows
+        self._chromo_idx = {chromo: i for i, chromo in enumerate(chromos)}
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __contains__(self, chromo):
+        return chromo in self._chromo_idx
+
+    @classmethod
+    def build(cls, data_files):
+        """Builds index of `data_files`.
+
+        Positions must be sorted within consecutive rows of the same
+        chromosome, and the positions of different files must not overlap,
+        which is the case for `dcpg_data.py` output files. Raises
+        `ValueError` otherwise.
+        """
+        data_files = list(to_list(data_files))
+        segments = []
+        for i, data_file in enumerate(data_files):
+            h5_file = h5.File(data_file, 'r')
+            chromo = h5_file['chromo'][:]
+            pos = h5_file['pos'][:].astype(np.int32)
+            h5_file.close()
+            if not len(pos):
+                continue
+            starts = np.r_[0, np.flatnonzero(chromo[1:] != chromo[:-1]) + 1]
+            ends = np.r_[starts[1:], len(pos)]
+            for start, end in zip(starts, ends):
+                seg_pos = pos[start:end]
+                if np.any(seg_pos[1:] < seg_pos[:-1]):
+                    raise ValueError('Positions of %s are not sorted!' %
+                                     data_file)
+                segments.append((_decode(chromo[start]), seg_pos[0], i,
+                                 start, seg_pos))
+        segments = sorted(segments, key=lambda segment: segment[:2])
+
+        chromos = sorted(set([segment[0] for segment in segments]))
+        offsets = np.zeros(len(chromos) + 1, dtype=np.int64)
+        for j in range(1, len(segments)):
+            if segments[j][0] == segments[j - 1][0] and \
+                    segments[j][1] <= segments[j - 1][4][-1]:
+                raise ValueError('Positions of %s and %s overlap!' % (
+                    data_files[segments[j - 1][2]],
+                    data_files[segments[j][2]]))
+        seg_lens = np.array([len(segment[4]) for segment in segments],
+                            dtype=np.int64)
+        seg_offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+        seg_offsets[1:] = np.cumsum(seg_lens)
+        seg_chromos = np.array([chromos.index(segment[0])
+                                for segment in segments], dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(seg_chromos, weights=seg_lens,
+                                            minlength=len(chromos)))
+        if segments:
+            pos = np.concatenate([segment[4] for segment in segments])
+        else:
+            pos = np.empty(0, dtype=np.int32)
+        seg_files = np.array([segment[2] for segment in segments],
+                             dtype=np.int32)
+        seg_rows = np.array([segment[3] for segment in segments],
+                            dtype=np.int64)
+        return cls(data_files, chromos, offsets, pos, seg_offsets, seg_files,
+                   seg_rows)
+
+    def save(self, dirname):
+        """Saves index of data files in `dirname` to `INDEX_FILE`. Files are
+        stored by their basename."""
+        filename = os.path.join(dirname, INDEX_FILE)
+        tmp_file = '%s.%d.tmp.npz' % (filename[:-4], os.getpid())
+        files = [os.path.basename(data_file) for data_file in self.files]
+        np.savez(tmp_file,
+                 files=np.array(files, dtype=np.str_),
+                 chromos=np.array(self.chromos, dtype=np.str_),
+                 offsets=self.offsets, pos=self.pos,
+                 seg_offsets=self.seg_offsets, seg_files=self.seg_files,
+                 seg_rows=self.seg_rows)
+        os.rename(tmp_file, filename)
+
+    @classmethod
+    def load(cls, dirname):
+        """Loads index of `dirname` created by :meth:`save`, or returns `None`
+        if it does not exist."""
+        filename = os.path.join(dirname, INDEX_FILE)
+        if not os.path.isfile(filename):
+            return None
+        with np.load(filename) as data:
+            files = [os.path.join(dirname, str(name))
+                     for name in data['files']]
+            return cls(files, [str(chromo) for chromo in data['chromos']],
+                       data['offsets'], data['pos'], data['seg_offsets'],
+                       data['seg_files'], data['seg_rows'])
+
+    def query(self, chromo, start, end):
+        """Returns hyperslabs of data files with the sites in intervals.
+
+        Overlapping intervals are merged, and hyperslabs of consecutive rows
+        of the same file are joined.
+
+        Parameters
+        ----------
+        chromo: str or np.array
+            Chromosome of intervals.
+        start: int or np.array
+            Start of intervals (inclusive).
+        end: int or np.array
+            End of intervals (inclusive).
+
+        Returns
+        -------
+        list
+            List of tuples (`filename`, `row_start`, `row_end`) with rows
+            `row_start` to `row_end` (exclusive) of `filename`, sorted by
+            chromosome and position.
+        """
+        chromo, start, end = np.broadcast_arrays(
+            np.asarray(chromo, dtype=np.str_), np.asarray(start),
+            np.asarray(end))
+        chromo = chromo.ravel()
+        start = start.ravel()
+        end = end.ravel()
+
+        # Offsets of the first and behind the last site in `pos`
+        lo = np.zeros(len(chromo), dtype=np.int64)
+        hi = np.zeros(len(chromo), dtype=np.int64)
+        for name in np.unique(chromo):
+            if name not in self:
+                continue
+            i = self._chromo_idx[name]
+            offset = self.offsets[i]
+            pos = self.pos[offset:self.offsets[i + 1]]
+            idx = chromo == name
+            lo[idx] = offset + np.searchsorted(pos, start[idx], side='left')
+            hi[idx] = offset + np.searchsorted(pos, end[idx], side='right')
+        idx = hi > lo
+        if not np.any(idx):
+            return []
+        lo, hi = intervals.merge(lo[idx], hi[idx] - 1)
+        hi += 1
+
+        # Split ranges at segments
+        seg_lo = np.searchsorted(self.seg_offsets, lo, side='right') - 1
+        seg_hi = np.searchsorted(self.seg_offsets, hi - 1, side='right') - 1
+        nb_seg = seg_hi - seg_lo + 1
+        ranges = np.repeat(np.arange(len(lo)), nb_seg)
+        segs = np.repeat(seg_lo - np.cumsum(nb_seg) + nb_seg, nb_seg) + \
+            np.arange(len(ranges))
+        seg_start = self.seg_offsets[segs]
+        slab_start = np.maximum(lo[ranges], seg_start)
+        slab_end = np.minimum(hi[ranges], self.seg_offsets[segs + 1])
+        files = self.seg_files[segs]
+        row_start = slab_start - seg_start + self.seg_rows[segs]
+        row_end = row_start + slab_end - slab_start
+
+        # Join consecutive rows of the same file
+        new = np.ones(len(files), dtype=bool)
+        new[1:] = (files[1:] != files[:-1]) | (row_start[1:] != row_end[:-1])
+        first = np.flatnonzero(new)
+        last = np.r_[first[1:], len(files)] - 1
+        return [(self.files[files[i]], int(row_start[i]), int(row_end[j]))
+                for i, j in zip(first, last)]
+
+
+def is_index_current(dirname, index=None):
+    """Tests if the index of `dirname` exists, lists all data files of
+    `dirname`, and is newer than them.
+
+    Parameters
+    ----------
+    dirname: str
+        Data directory.
+    index: :class:`RangeIndex`
+        Index of `dirname` if already loaded.
+    """
+    filename = os.path.join(dirname, INDEX_FILE)
+    if not os.path.isfile(filename):
+        return False
+    if index is None:
+        index = RangeIndex.load(dirname)
+    data_files = find_data_files(dirname)
+    if sorted(index.files) != sorted(data_files):
+        return False
+    mtime = os.path.getmtime(filename)
+    return all([os.path.getmtime(data_file) <= mtime
+                for data_file in data_files])
+
+
+def get_range_index(data_files):
+    """Returns index of `data_files`.
+
+    Loads the index of the directory of `data_files` if it contains all files
+    and is current (see :func:`is_index_current`), or builds it otherwise.
+    """
+    data_files = list(to_list(data_files))
+    dirnames = set([os.path.dirname(os.path.abspath(data_file))
+                    for data_file in data_files])
+    if len(dirnames) == 1:
+        dirname = dirnames.pop()
+        filename = os.path.join(dirname, INDEX_FILE)
+        index = None
+        if os.path.isfile(filename):
+            mtime = os.path.getmtime(filename)
+            cached = _CACHE.get(filename)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, RangeIndex.load(dirname))
+                _CACHE[filename] = cached
+            index = cached[1]
+        if index is not None and is_index_current(dirname, index):
+            files = set(index.files)
+            if all([os.path.abspath(data_file) in files
+                    for data_file in data_files]):
+                return index
+    return RangeIndex.build(data_files)
+
+
+def read_regions(filename):
+    """Reads regions from BED file `filename`, which can be gzip compressed.
+
+    Chromosome names are formatted as in :mod:`deepcpg.data.annotations`,
+    and overlapping regions are merged.
+
+    Returns
+    -------
+    tuple
+        Tuple (`chromo`, `start`, `end`) of arrays.
+    """
+    from .annotations import AnnoTrack
+
+    track = AnnoTrack.read(filename)
+    chromo = np.repeat(np.array(track.chromos, dtype=np.str_),
+                       np.diff(track.offsets))
+    return (chromo, track.start, track.end)
+
+
+def get_region_rows(data_files, regions):
+    """Returns rows of `data_files` with sites in `regions`.
+
+    Parameters
+    ----------
+    data_files: list
+        Data files.
+    regions: tuple or str
+        Tuple (`chromo`, `start`, `end`) of arrays or name of BED file. See
+        :func:`read_regions`.
+
+    Returns
+    -------
+    OrderedDict
+        Sorted rows by name of data files in the order of `data_files`.
+        Files without sites in `regions` are not included.
+    """
+    data_files = list(to_list(data_files))
+    if isinstance(regions, six.string_types):
+        regions = read_regions(regions)
+    slabs = get_range_index(data_files).query(*regions)
+    file_slabs = dict()
+    for filename, row_start, row_end in slabs:
+        file_slabs.setdefault(os.path.abspath(filename), []).append(
+            np.arange(row_start, row_end))
+    rows = OrderedDict()
+    for data_file in data_files:
+        _slabs = file_slabs.get(os.path.abspath(data_file))
+        if _slabs:
+            rows[data_file] = np.sort(np.concatenate(_slabs))
+    return rows
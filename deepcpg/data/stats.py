@@ -3,14 +3,21 @@
 CpG matrix x assumed to have shape
     * [sites, cells] for per CpG statistics
     * [sites, cells, context] for window-based statistics
+
+Functions named after statistics expect masked arrays. :func:`cpg_stats` and
+:func:`reduce_cells` compute the same statistics from dense arrays, which is
+faster and requires less memory.
 """
 
 from __future__ import division
 from __future__ import print_function
 
+from collections import OrderedDict
+
 import numpy as np
 
 from ..utils import EPS, get_from_module
+from .utils import CPG_NAN
 
 
 def mean(x):
@@ -59,5 +66,166 @@ def diff(x):
     return x.min(axis=1) != x.max(axis=1).astype(np.int8)
 
 
+def cov(x):
+    if x.ndim > 2:
+        x = x.mean(axis=2)
+    return np.ma.masked_array(x.count(axis=1))
+
+
+def window_means(state, dist, wlens, center=None):
+    """Computes mean CpG states of a cell in windows of multiple lengths.
+
+    Expects neighboring CpG sites in the layout of
+    :class:`deepcpg.data.feature_extractor.KnnCpgFeatureExtractor`, i.e. `k`
+    left neighbors ordered by decreasing distance followed by `k` right
+    neighbors ordered by increasing distance. Since distances are sorted on
+    both sides, the neighbors within a window are found by counting, and
+    their sum is looked up in cumulative sums. All window lengths are
+    therefore computed from a single pass over neighbors.
+
+    Parameters
+    ----------
+    state: np.array
+        States of neighboring CpG sites of shape [sites, 2k], with `CPG_NAN`
+        for missing neighbors.
+    dist: np.array
+        Distances of neighboring CpG sites of shape [sites, 2k].
+    wlens: list
+        Window lengths. Neighbors with a distance of at most `wlen // 2` are
+        in the window.
+    center: np.array
+        Optional states of the sites themselves of shape [sites], with
+        `CPG_NAN` for unobserved sites. Sites are in all windows.
+
+    Returns
+    -------
+    tuple
+        Tuple (`means`, `counts`) of arrays of shape [len(wlens), sites] with
+        the mean state and number of observed CpG sites in each window. Means
+        of windows without observed sites are zero.
+    """
+    state = np.asarray(state)
+    dist = np.asarray(dist)
+    nb_site = len(state)
+    k = state.shape[1] // 2
+    half = np.array([wlen // 2 for wlen in wlens]).reshape(1, 1, -1)
+    sums = np.zeros((len(wlens), nb_site))
+    counts = np.zeros((len(wlens), nb_site), dtype=np.int64)
+    rows = np.arange(nb_site)
+    for idx in [np.arange(k - 1, -1, -1), np.arange(k, 2 * k)]:
+        # Neighbors on one side, ordered by increasing distance
+        side_state = state[:, idx]
+        valid = side_state != CPG_NAN
+        side_dist = np.where(valid, dist[:, idx], np.inf)
+        csum = np.zeros((nb_site, k + 1))
+        np.cumsum(np.where(valid, side_state, 0), axis=1, out=csum[:, 1:])
+        side_counts = np.sum(side_dist[:, :, np.newaxis] <= half, axis=1)
+        for i in range(len(wlens)):
+            sums[i] += csum[rows, side_counts[:, i]]
+            counts[i] += side_counts[:, i]
+    if center is not None:
+        center = np.asarray(center)
+        valid = center != CPG_NAN
+        sums += np.where(valid, center, 0)
+        counts += valid
+    means = np.zeros_like(sums)
+    has_data = counts > 0
+    means[has_data] = sums[has_data] * 1. / counts[has_data]
+    return (means, counts)
+
+
+def reduce_cells(x, valid, names, nb_bin=3):
+    """Computes statistics across cells from a dense matrix.
+
+    Computes the same statistics as the functions of this module without
+    masked arrays. Cell counts and sums are shared between statistics.
+
+    Parameters
+    ----------
+    x: np.array
+        Values of shape [sites, cells], e.g. mean CpG states in windows.
+    valid: np.array
+        Boolean array of shape [sites, cells], which is `True` for cells with
+        observed values.
+    names: list
+        Names of statistics, e.g. `mean` or `var`.
+    nb_bin: int
+        Number of bins of `cat_var`.
+
+    Returns
+    -------
+    OrderedDict
+        Statistics of shape [sites]. Statistics of sites without valid cells
+        are undefined.
+    """
+    x = np.where(valid, x, 0)
+    if x.dtype.kind in 'biu':
+        # Integers are summed as float64, floats in their own precision, as
+        # by masked arrays.
+        x = x.astype(np.float64)
+    nb_cell = valid.sum(axis=1)
+    result = OrderedDict()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = x.sum(axis=1) * 1. / nb_cell
+        var_x = None
+        if set(names) & set(['var', 'cat_var', 'cat2_var']):
+            danom = np.where(valid, x - mean_x.reshape(-1, 1), 0)
+            danom *= danom
+            var_x = danom.sum(axis=1) / nb_cell
+        for name in names:
+            if name == 'mean':
+                stat = mean_x
+            elif name == 'mode':
+                stat = mean_x.round()
+            elif name == 'var':
+                stat = var_x
+            elif name in ['cat_var', 'cat2_var']:
+                bins = np.linspace(-EPS, 0.25, nb_bin + 1)
+                stat = np.digitize(var_x, bins, right=True) - 1
+                if name == 'cat2_var':
+                    stat[stat > 0] = 1
+            elif name == 'entropy':
+                p1 = np.minimum(1 - EPS, np.maximum(EPS, mean_x))
+                p0 = 1 - p1
+                stat = -(p1 * np.log(p1) + p0 * np.log(p0))
+            elif name == 'diff':
+                # Same as `diff`, which compares the minimum with the maximum
+                # truncated to an integer.
+                x_max = np.where(valid, x, -np.inf).max(axis=1)
+                x_max[nb_cell == 0] = 0
+                x_min = np.where(valid, x, np.inf).min(axis=1)
+                stat = x_min != x_max.astype(np.int8)
+            elif name == 'cov':
+                stat = nb_cell
+            else:
+                raise ValueError('Invalid statistic "%s"!' % name)
+            result[name] = stat
+    return result
+
+
+def cpg_stats(x, names, nan=CPG_NAN):
+    """Computes per CpG statistics of a dense CpG matrix.
+
+    Parameters
+    ----------
+    x: np.array
+        CpG matrix of shape [sites, cells], e.g. int8 with binary states.
+    names: list
+        Names of statistics.
+    nan: int
+        Value of unobserved CpG sites.
+
+    Returns
+    -------
+    tuple
+        Tuple (`stats`, `nb_cell`), where `stats` is an OrderedDict with
+        statistics of shape [sites] and `nb_cell` the number of cells with
+        observed states. Statistics of sites without observed states are
+        undefined.
+    """
+    valid = x != nan
+    return (reduce_cells(x, valid, names), valid.sum(axis=1))
+
+
 def get(name):
     return get_from_module(name, globals())
@@ -1,7 +1,9 @@
 from __future__ import division
 from __future__ import print_function
 
+from collections import OrderedDict
 import gzip
+import os
 import threading
 import re
 
@@ -12,9 +14,14 @@ import six
 from six.moves import range
 
 from . import hdf
+from .manifest import get_entry
 
 CPG_NAN = -1
 OUTPUT_SEP = '/'
+# Number of rows of CpG profiles that are parsed at once
+CPG_PROFILE_CHUNK_SIZE = 10**6
+# Layout versions of `dcpg_data.py` output files. See :func:`get_layout`.
+LAYOUTS = [1, 2]
 
 
 class threadsafe_iter:
@@ -70,9 +77,13 @@ def stack_dict(data):
 def get_nb_sample(data_files, nb_max=None, batch_size=None):
     nb_sample = 0
     for data_file in data_files:
-        data_file = h5.File(data_file, 'r')
-        nb_sample += len(data_file['pos'])
-        data_file.close()
+        entry = get_entry(data_file)
+        if entry is not None:
+            nb_sample += entry['nb_sample']
+        else:
+            data_file = h5.File(data_file, 'r')
+            nb_sample += len(data_file['pos'])
+            data_file.close()
         if nb_max and nb_sample > nb_max:
             nb_sample = nb_max
             break
@@ -81,14 +92,61 @@ def get_nb_sample(data_files, nb_max=None, batch_size=None):
     return nb_sample
 
 
+def get_dna_store(data_file):
+    """Returns genome store of `data_file` if DNA sequence windows are not
+    stored but read from a genome store, or `None` otherwise."""
+    entry = get_entry(data_file)
+    if entry is not None:
+        return entry['dna_store']
+    data_file = h5.File(data_file, 'r')
+    dna_store = None
+    if 'inputs' in data_file and '/inputs/dna' not in data_file:
+        dna_store = data_file['inputs'].attrs.get('dna_store')
+        if isinstance(dna_store, bytes):
+            dna_store = dna_store.decode()
+    data_file.close()
+    return dna_store
+
+
 def get_dna_wlen(data_file, max_len=None):
+    entry = get_entry(data_file)
+    if entry is not None:
+        if '/inputs/dna' not in entry['datasets']:
+            return max_len or entry['dna_wlen']
+        wlen = entry['datasets']['/inputs/dna']['shape'][1]
+        if max_len:
+            wlen = min(max_len, wlen)
+        return wlen
     data_file = h5.File(data_file, 'r')
+    if '/inputs/dna' not in data_file:
+        # Windows of any length can be read from the genome store
+        wlen = max_len or data_file['inputs'].attrs['dna_wlen']
+        data_file.close()
+        return wlen
     wlen = data_file['/inputs/dna'].shape[1]
     if max_len:
         wlen = min(max_len, wlen)
     return wlen
 
 
+def get_layout(data_file):
+    """Returns layout version of `dcpg_data.py` output file.
+
+    * 1: One dataset per cell, e.g. `outputs/cpg/<cell>` and
+      `inputs/cpg/<cell>/state`.
+    * 2: Matrix datasets with cells as columns, i.e. `outputs/cpg` with shape
+      [sites, cells] and `inputs/cpg/state` and `inputs/cpg/dist` with shape
+      [sites, cells, wlen]. See :func:`hdf.get_names`.
+    """
+    entry = get_entry(data_file)
+    if entry is not None:
+        return entry['layout']
+    data_file = h5.File(data_file, 'r')
+    layout = int(data_file.attrs.get('layout', 1))
+    data_file.close()
+    return layout
+
+
 def get_output_names(data_file, *args, **kwargs):
     return hdf.ls(data_file, 'outputs',
                   recursive=True,
@@ -97,6 +155,10 @@ def get_output_names(data_file, *args, **kwargs):
 
 
 def get_replicate_names(data_file, *args, **kwargs):
+    if get_layout(data_file) > 1:
+        return hdf.ls(data_file, 'inputs/cpg/state',
+                      must_exist=False,
+                      *args, **kwargs)
     return hdf.ls(data_file, 'inputs/cpg',
                   recursive=False,
                   groups=True,
@@ -111,9 +173,23 @@ def get_anno_names(data_file, *args, **kwargs):
 
 
 def get_cpg_wlen(data_file, max_len=None):
+    entry = get_entry(data_file)
+    if entry is not None:
+        if entry['layout'] > 1:
+            name = '/inputs/cpg/dist'
+        else:
+            name = '%s/dist' % hdf.ls(data_file, 'inputs/cpg', groups=True)[0]
+            name = '/inputs/cpg/%s' % name
+        wlen = entry['datasets'][name]['shape'][-1]
+        if max_len:
+            wlen = min(max_len, wlen)
+        return wlen
     data_file = h5.File(data_file, 'r')
     group = data_file['/inputs/cpg']
-    wlen = group['%s/dist' % list(group.keys())[0]].shape[1]
+    if int(data_file.attrs.get('layout', 1)) > 1:
+        wlen = group['dist'].shape[2]
+    else:
+        wlen = group['%s/dist' % list(group.keys())[0]].shape[1]
     if max_len:
         wlen = min(max_len, wlen)
     return wlen
@@ -199,6 +275,422 @@ def read_cpg_profile(filename, chromos=None, nb_sample=None, round=False,
     return d
 
 
+def iter_cpg_profile(filename, chromos=None, nb_sample=None,
+                     chromo_sorted=False, chunk_size=CPG_PROFILE_CHUNK_SIZE):
+    """Iterates over chunks of a CpG profile.
+
+    Chromosome names are parsed as categorical and formatted once per
+    category instead of once per row. Categories that are equal after
+    formatting are merged, e.g. 'chr1' and '1'. Rows of chromosomes other
+    than `chromos` are dropped chunk by chunk.
+
+    Parameters
+    ----------
+    filename: str or file
+        Tab delimited file with columns `chromo`, `pos`, `value` or bedGraph
+        file.
+    chromos: list
+        Chromosomes to be read.
+    nb_sample: int
+        Stop after `nb_sample` sites.
+    chromo_sorted: bool
+        If `True`, assume that sites of the same chromosome are stored
+        consecutively, such that reading stops after the last site of
+        `chromos`.
+    chunk_size: int
+        Number of rows that are parsed at once. All rows if `None`.
+
+    Returns
+    -------
+    generator
+        Generator of tuples (`names`, `codes`, `pos`, `value`), where `names`
+        are the chromosome names of the chunk, `codes` int32 indices into
+        `names`, `pos` int32 positions, and `value` float32 values.
+    """
+    if chromos is not None and not isinstance(chromos, list):
+        chromos = [str(chromos)]
+    if is_bedgraph(filename):
+        usecols = [0, 1, 3]
+        skiprows = 1
+    else:
+        usecols = [0, 1, 2]
+        skiprows = 0
+    kwargs = dict(header=None, comment='#', usecols=usecols,
+                  skiprows=skiprows,
+                  dtype={usecols[0]: 'category',
+                         usecols[1]: np.int32,
+                         usecols[2]: np.float32})
+    if chunk_size is None:
+        nrows = nb_sample if chromos is None else None
+        chunks = [pd.read_table(filename, nrows=nrows, **kwargs)]
+    else:
+        chunks = pd.read_table(filename, chunksize=chunk_size, **kwargs)
+
+    nb_read = 0
+    seen = set()
+    for d in chunks:
+        d.columns = ['chromo', 'pos', 'value']
+        value = d['value'].values
+        if np.any((value < 0) | (value > 1)):
+            raise ValueError('Methylation values must be between 0 and 1!')
+        chromo = d['chromo'].values
+        pos = d['pos'].values
+        del d
+        names = format_chromo(pd.Series(chromo.categories.astype(str)))
+        names_codes, names = pd.factorize(names)
+        codes = names_codes.astype(np.int32)[chromo.codes]
+        names = list(names)
+        seen.update(names)
+
+        passed = False
+        if chromos is not None:
+            keep = np.array([name in chromos for name in names], dtype=bool)
+            passed = len(codes) > 0 and not keep[codes[-1]]
+            idx = keep[codes]
+            codes = codes[idx]
+            pos = pos[idx]
+            value = value[idx]
+        if nb_sample is not None and nb_read + len(codes) >= nb_sample:
+            idx = slice(0, nb_sample - nb_read)
+            yield (names, codes[idx], pos[idx], value[idx])
+            break
+        yield (names, codes, pos, value)
+        nb_read += len(codes)
+
+        # Stop after all selected chromosomes were read if the file is sorted
+        # by chromosome.
+        if chromo_sorted and passed and \
+                all([chromo in seen for chromo in chromos]):
+            break
+
+
+class CpgProfile(object):
+    """CpG profile partitioned by chromosome.
+
+    Stores positions and values of all chromosomes in contiguous arrays, which
+    are sorted by chromosome and position, and an offset table, such that the
+    data of a single chromosome is a slice that does not require scanning the
+    profile.
+
+    Parameters
+    ----------
+    chromos: list
+        Chromosome names.
+    offsets: np.array
+        Array of length `len(chromos) + 1`. Data of `chromos[i]` are stored at
+        `offsets[i]:offsets[i + 1]`.
+    pos: np.array
+        Positions sorted by chromosome and position.
+    value: np.array
+        Methylation values.
+    """
+
+    def __init__(self, chromos, offsets, pos, value):
+        self.chromos = list(chromos)
+        self.offsets = np.asarray(offsets)
+        self.pos = pos
+        self.value = value
+        self._chromo_idx = {chromo: i for i, chromo in enumerate(self.chromos)}
+        assert len(self.offsets) == len(self.chromos) + 1
+        assert len(self.pos) == len(self.value) == self.offsets[-1]
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Creates profile from table with columns `chromo`, `pos`, `value`."""
+        codes, chromos = pd.factorize(frame['chromo'], sort=True)
+        pos = frame['pos'].values
+        value = frame['value'].values
+        idx = np.lexsort((pos, codes))
+        offsets = np.zeros(len(chromos) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(codes, minlength=len(chromos)))
+        return cls(chromos, offsets, pos[idx], value[idx])
+
+    @classmethod
+    def read(cls, filename, chromos=None, nb_sample=None, round=False,
+             nb_sample_chromo=None, dtype=np.float32, chromo_sorted=False,
+             chunk_size=CPG_PROFILE_CHUNK_SIZE):
+        """Reads CpG profile.
+
+        Same as :func:`read_cpg_profile`, but parses chromosome names as
+        categorical, such that they are formatted and filtered once per
+        chromosome instead of once per row, and stores the profile as
+        :class:`CpgProfile`.
+
+        If `chromos` is provided, the file is read in chunks of `chunk_size`
+        rows and only rows of `chromos` are kept, such that memory does not
+        grow with the size of the file. Reading stops early if `nb_sample`
+        sites were read, or, with `chromo_sorted`, if all `chromos` were read.
+
+        Parameters
+        ----------
+        filename: str or file
+            Tab delimited file with columns `chromo`, `pos`, `value` or
+            bedGraph file.
+        chromos: list
+            Chromosomes to be read.
+        nb_sample: int
+            Maximum number of sites.
+        round: bool
+            If `True`, round values to zero or one.
+        nb_sample_chromo: int
+            Number of sites that are randomly sampled from each chromosome.
+        dtype: np.dtype
+            Data type of continuous values, e.g. `np.float16` to reduce
+            memory. Binary values are stored as `np.int8`.
+        chromo_sorted: bool
+            If `True`, assume that sites of the same chromosome are stored
+            consecutively, such that reading can stop after the last site of
+            `chromos`.
+        chunk_size: int
+            Number of rows that are parsed at once if `chromos` is provided.
+
+        Returns
+        -------
+        :class:`CpgProfile`
+            CpG profile with positions stored as `np.int32`.
+        """
+        # Merge chromosome names of chunks
+        names_idx = OrderedDict()
+        codes = []
+        pos = []
+        value = []
+        chunks = iter_cpg_profile(
+            filename, chromos=chromos,
+            nb_sample=nb_sample if nb_sample_chromo is None else None,
+            chromo_sorted=chromo_sorted,
+            chunk_size=chunk_size if chromos is not None else None)
+        for chunk_names, chunk_codes, chunk_pos, chunk_value in chunks:
+            chunk_idx = np.array([names_idx.setdefault(name, len(names_idx))
+                                  for name in chunk_names], dtype=np.int32)
+            codes.append(chunk_idx[chunk_codes])
+            pos.append(chunk_pos)
+            value.append(chunk_value)
+        names = list(names_idx.keys())
+
+        def concat(values, dtype):
+            return np.concatenate(values) if values else np.empty(0, dtype)
+
+        codes = concat(codes, np.int32)
+        pos = concat(pos, np.int32)
+        value = concat(value, np.float32)
+
+        # Recode chromosomes in sorted order
+        order = sorted(range(len(names)), key=lambda i: names[i])
+        rank = np.empty(len(names), dtype=np.int32)
+        rank[order] = np.arange(len(names))
+        codes = rank[codes]
+        names = [names[i] for i in order]
+
+        idx = None
+        if nb_sample_chromo is not None:
+            idx = []
+            for i in range(len(names)):
+                chromo_idx = np.flatnonzero(codes == i)
+                if not len(chromo_idx):
+                    continue
+                idx.append(chromo_idx[np.random.choice(
+                    len(chromo_idx), nb_sample_chromo, replace=False)])
+            idx = concat(idx, np.int64)
+        if nb_sample is not None:
+            if idx is None:
+                idx = np.arange(min(nb_sample, len(codes)))
+            else:
+                idx = idx[:nb_sample]
+        if idx is not None:
+            codes = codes[idx]
+            pos = pos[idx]
+            value = value[idx]
+
+        # Drop chromosomes without sites
+        counts = np.bincount(codes, minlength=len(names))
+        used = np.flatnonzero(counts)
+        if len(used) < len(names):
+            new_codes = np.cumsum(counts > 0) - 1
+            codes = new_codes[codes]
+            names = [names[i] for i in used]
+            counts = counts[used]
+
+        idx = np.lexsort((pos, codes))
+        pos = pos[idx]
+        value = value[idx]
+        if round:
+            value = np.round(value)
+        if is_binary(value):
+            value = value.astype(np.int8)
+        else:
+            value = value.astype(dtype)
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        return cls(names, offsets, pos, value)
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __contains__(self, chromo):
+        return chromo in self._chromo_idx
+
+    @property
+    def dtype(self):
+        return self.value.dtype
+
+    def get(self, chromo):
+        """Returns tuple (`pos`, `value`) of sorted arrays of `chromo`."""
+        idx = self._chromo_idx.get(chromo)
+        if idx is None:
+            return (self.pos[:0], self.value[:0])
+        idx = slice(self.offsets[idx], self.offsets[idx + 1])
+        return (self.pos[idx], self.value[idx])
+
+    def save(self, filename, **kwargs):
+        """Saves profile to numpy `.npz` file.
+
+        Parameters
+        ----------
+        filename: str
+            Output filename.
+        kwargs: dict
+            Additional arrays that are stored in the same file, e.g. meta data
+            of the source file.
+        """
+        np.savez(filename, chromos=np.array(self.chromos, dtype=np.str_),
+                 offsets=self.offsets, pos=self.pos, value=self.value,
+                 **kwargs)
+
+    @classmethod
+    def load(cls, filename):
+        """Loads profile from `.npz` file that was created by :meth:`save`."""
+        with np.load(filename) as data:
+            return cls([str(chromo) for chromo in data['chromos']],
+                       data['offsets'], data['pos'], data['value'])
+
+    def to_frame(self):
+        """Returns table with columns `chromo`, `pos`, `value`."""
+        chromo = np.repeat(np.array(self.chromos, dtype=object),
+                           np.diff(self.offsets))
+        return pd.DataFrame({'chromo': chromo, 'pos': self.pos,
+                             'value': self.value},
+                            columns=['chromo', 'pos', 'value'])
+
+
+class SpilledCpgProfile(object):
+    """CpG profile stored in per-chromosome spill files.
+
+    Sites of each chromosome are stored in files `<index>.pos` and
+    `<index>.value` in `dirname`, such that a single chromosome can be loaded
+    without reading the entire profile. Provides the same interface as
+    :class:`CpgProfile` for accessing chromosomes. The last loaded chromosome
+    is kept in memory until another chromosome is loaded or :meth:`release`
+    is called.
+
+    Parameters
+    ----------
+    dirname: str
+        Directory with spill files.
+    chromos: list
+        Chromosome names. Data of `chromos[i]` is stored in files with index
+        `i`.
+    counts: list
+        Number of sites of each chromosome.
+    dtype: np.dtype
+        Data type of values.
+    """
+
+    def __init__(self, dirname, chromos, counts, dtype):
+        self.dirname = dirname
+        self.chromos = list(chromos)
+        self.counts = list(counts)
+        self._dtype = np.dtype(dtype)
+        self._chromo_idx = {chromo: i for i, chromo in enumerate(self.chromos)}
+        self._cache = None
+
+    @classmethod
+    def write(cls, filename, dirname, chromos=None, nb_sample=None,
+              round=False, dtype=np.float32, chromo_sorted=False,
+              chunk_size=CPG_PROFILE_CHUNK_SIZE):
+        """Splits CpG profile `filename` into per-chromosome spill files.
+
+        Reads `filename` in chunks of `chunk_size` rows, such that memory does
+        not depend on the size of the profile. `dirname` must be empty or not
+        exist. Other parameters are the same as for :meth:`CpgProfile.read`.
+
+        Returns
+        -------
+        :class:`SpilledCpgProfile`
+            Profile stored in `dirname`.
+        """
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        elif os.listdir(dirname):
+            raise ValueError('Spill directory "%s" is not empty!' % dirname)
+        chromos_idx = OrderedDict()
+        counts = []
+        binary = True
+        chunks = iter_cpg_profile(filename, chromos=chromos,
+                                  nb_sample=nb_sample,
+                                  chromo_sorted=chromo_sorted,
+                                  chunk_size=chunk_size)
+        for names, codes, pos, value in chunks:
+            if round:
+                value = np.round(value)
+            binary &= bool(is_binary(value))
+            idx = np.argsort(codes, kind='mergesort')
+            offsets = np.zeros(len(names) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(np.bincount(codes, minlength=len(names)))
+            for i, name in enumerate(names):
+                chromo_idx = idx[offsets[i]:offsets[i + 1]]
+                if not len(chromo_idx):
+                    continue
+                if name not in chromos_idx:
+                    chromos_idx[name] = len(chromos_idx)
+                    counts.append(0)
+                j = chromos_idx[name]
+                counts[j] += len(chromo_idx)
+                basename = os.path.join(dirname, str(j))
+                with open(basename + '.pos', 'ab') as f:
+                    f.write(pos[chromo_idx].tobytes())
+                with open(basename + '.value', 'ab') as f:
+                    f.write(value[chromo_idx].tobytes())
+        if binary:
+            dtype = np.int8
+        return cls(dirname, list(chromos_idx.keys()), counts, dtype)
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __contains__(self, chromo):
+        return chromo in self._chromo_idx
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_cache'] = None
+        return state
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    def get(self, chromo):
+        """Returns tuple (`pos`, `value`) of sorted arrays of `chromo`."""
+        if self._cache is not None and self._cache[0] == chromo:
+            return self._cache[1]
+        self.release()
+        idx = self._chromo_idx.get(chromo)
+        if idx is None:
+            return (np.empty(0, dtype=np.int32),
+                    np.empty(0, dtype=self._dtype))
+        basename = os.path.join(self.dirname, str(idx))
+        pos = np.fromfile(basename + '.pos', dtype=np.int32)
+        value = np.fromfile(basename + '.value', dtype=np.float32)
+        idx = np.argsort(pos, kind='mergesort')
+        data = (pos[idx], value[idx].astype(self._dtype))
+        self._cache = (chromo, data)
+        return data
+
+    def release(self):
+        """Releases memory of the last loaded chromosome."""
+        self._cache = None
+
+
 class GzipFile(object):
 
     def __init__(self, filename, mode='r', *args, **kwargs):
@@ -19,6 +19,7 @@ from .. import data as dat
 from .. import evaluation as ev
 from ..data import hdf, OUTPUT_SEP
 from ..data.dna import int_to_onehot
+from ..data.genome import GenomeStore
 from ..utils import to_list
 
 
@@ -505,6 +506,13 @@ class DataReader(object):
     encode_replicates: bool
         If `True`, encode replicated names in key of returned dict. This option
         is deprecated and will be removed in the future.
+    dna_store: str
+        Genome store from which DNA sequence windows are read if data files
+        were created with `dcpg_data.py --dna_ref`. Defaults to the genome
+        store referenced in data files.
+    dna_seed: int
+        Seed for randomly choosing missing nucleotides of DNA sequence windows
+        that are read from a genome store.
 
     Returns
     -------
@@ -516,7 +524,7 @@ class DataReader(object):
     def __init__(self, output_names=None,
                  use_dna=True, dna_wlen=None,
                  replicate_names=None, cpg_wlen=None, cpg_max_dist=25000,
-                 encode_replicates=False):
+                 encode_replicates=False, dna_store=None, dna_seed=None):
         self.output_names = to_list(output_names)
         self.use_dna = use_dna
         self.dna_wlen = dna_wlen
@@ -524,6 +532,8 @@ class DataReader(object):
         self.cpg_wlen = cpg_wlen
         self.cpg_max_dist = cpg_max_dist
         self.encode_replicates = encode_replicates
+        self.dna_store = dna_store
+        self.dna_seed = dna_seed
 
     def _prepro_dna(self, dna):
         """Preprocess DNA sequence windows."""
@@ -534,6 +544,10 @@ class DataReader(object):
             dna = dna[:, (center - delta):(center + delta + 1)]
         return int_to_onehot(dna)
 
+    def _read_dna(self, store, chromos, pos, wlen, rng):
+        """Reads DNA sequence windows from genome store."""
+        return int_to_onehot(store.sample_windows(chromos, pos, wlen, rng))
+
     def _prepro_cpg(self, states, dists):
         """Preprocess the state and distance of neighboring CpG sites."""
         prepro_states = []
@@ -578,13 +592,27 @@ class DataReader(object):
             Python generator for reading data.
         """
         names = []
+        dna_store = None
         if self.use_dna:
-            names.append('inputs/dna')
+            data_file = to_list(data_files)[0]
+            dna_store = dat.get_dna_store(data_file)
+            if dna_store is None:
+                names.append('inputs/dna')
+            else:
+                dna_store = GenomeStore(self.dna_store or dna_store)
+                dna_wlen = dat.get_dna_wlen(data_file, self.dna_wlen)
+                dna_rng = np.random.RandomState(self.dna_seed)
+                names.extend(['chromo', 'pos'])
 
         if self.replicate_names:
+            # Names of states and distances of neighboring CpG sites. Columns
+            # of matrices of layout 2 are read at once by `hdf.reader`.
+            cpg_fmt = 'inputs/cpg/{0}/{1}'
+            if dat.get_layout(to_list(data_files)[0]) > 1:
+                cpg_fmt = 'inputs/cpg/{1}/{0}'
             for name in self.replicate_names:
-                names.append('inputs/cpg/%s/state' % name)
-                names.append('inputs/cpg/%s/dist' % name)
+                names.append(cpg_fmt.format(name, 'state'))
+                names.append(cpg_fmt.format(name, 'dist'))
 
         if self.output_names:
             for name in self.output_names:
@@ -593,16 +621,19 @@ class DataReader(object):
         for data_raw in hdf.reader(data_files, names, *args, **kwargs):
             inputs = dict()
 
-            if self.use_dna:
+            if dna_store is not None:
+                inputs['dna'] = self._read_dna(dna_store, data_raw['chromo'],
+                                               data_raw['pos'], dna_wlen,
+                                               dna_rng)
+            elif self.use_dna:
                 inputs['dna'] = self._prepro_dna(data_raw['inputs/dna'])
 
             if self.replicate_names:
                 states = []
                 dists = []
                 for name in self.replicate_names:
-                    tmp = 'inputs/cpg/%s/' % name
-                    states.append(data_raw[tmp + 'state'])
-                    dists.append(data_raw[tmp + 'dist'])
+                    states.append(data_raw[cpg_fmt.format(name, 'state')])
+                    dists.append(data_raw[cpg_fmt.format(name, 'dist')])
                 states, dists = self._prepro_cpg(states, dists)
                 if self.encode_replicates:
                     # DEPRECATED: to support loading data for legacy models
@@ -46,9 +46,14 @@ See Also
 from __future__ import print_function
 from __future__ import division
 
+import atexit
 from collections import OrderedDict
+import hashlib
+import multiprocessing
 import os
+import shutil
 import sys
+import tempfile
 import warnings
 
 import argparse
@@ -65,26 +70,109 @@ from deepcpg.data import annotations as an
 from deepcpg.data import stats
 from deepcpg.data import dna
 from deepcpg.data import fasta
+from deepcpg.data import genome
+from deepcpg.data import hdf
+from deepcpg.data import manifest as mf
+from deepcpg.data import packing
+from deepcpg.data import range_index as ri
 from deepcpg.data import feature_extractor as fext
 from deepcpg.utils import make_dir
 
 
+# Features of `AnnoIndex.query` by name in `--anno_features`
+ANNO_FEATURES = {'is_in': 'is_in',
+                 'distance': 'signed_distance',
+                 'density': 'density'}
+
+
 def prepro_pos_table(pos_tables):
-    """Extracts unique positions and sorts them."""
+    """Extracts unique positions and sorts them.
+
+    Concatenates all tables once and extracts unique positions in a single
+    sort, instead of merging tables one by one.
+
+    Parameters
+    ----------
+    pos_tables: list
+        List of tables or table with columns `chromo` and `pos`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Table with columns `chromo` (categorical) and `pos` (int32) as
+        returned by :func:`get_profile_pos_table`.
+    """
     if not isinstance(pos_tables, list):
         pos_tables = [pos_tables]
 
-    pos_table = None
-    for next_pos_table in pos_tables:
-        if pos_table is None:
-            pos_table = next_pos_table
-        else:
-            pos_table = pd.concat([pos_table, next_pos_table])
-        pos_table = pos_table.groupby('chromo').apply(
-            lambda df: pd.DataFrame({'pos': np.unique(df['pos'])}))
-        pos_table.reset_index(inplace=True)
-        pos_table = pos_table[['chromo', 'pos']]
-        pos_table.sort_values(['chromo', 'pos'], inplace=True)
+    pos_table = pd.concat([pos_table[['chromo', 'pos']]
+                           for pos_table in pos_tables], ignore_index=True)
+    codes, chromos = pd.factorize(pos_table['chromo'].astype(str), sort=True)
+    pos = pos_table['pos'].values.astype(np.int32)
+    idx = np.lexsort((pos, codes))
+    codes = codes[idx]
+    pos = pos[idx]
+    unique = np.ones(len(pos), dtype=bool)
+    unique[1:] = (codes[1:] != codes[:-1]) | (pos[1:] != pos[:-1])
+    pos_table = pd.DataFrame({
+        'chromo': pd.Categorical.from_codes(codes[unique], chromos),
+        'pos': pos[unique]},
+        columns=['chromo', 'pos'])
+    return pos_table
+
+
+def get_profile_pos_table(cpg_profiles):
+    """Extracts unique positions of CpG profiles and sorts them.
+
+    Concatenates the positions of all profiles once per chromosome and
+    extracts unique positions, instead of merging profiles one by one.
+
+    Parameters
+    ----------
+    cpg_profiles: list
+        List of :class:`dat.CpgProfile`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Table with columns `chromo` (categorical), `pos` (int32), and `cov`,
+        the number of profiles in which a position is observed.
+    """
+    chromos = set()
+    for cpg_profile in cpg_profiles:
+        chromos.update(cpg_profile.chromos)
+    chromos = sorted(chromos)
+
+    codes = []
+    pos = []
+    cov = []
+    for i, chromo in enumerate(chromos):
+        chromo_pos = []
+        for cpg_profile in cpg_profiles:
+            profile_pos = cpg_profile.get(chromo)[0]
+            # Count duplicated positions of a profile only once
+            if len(profile_pos):
+                dup = np.zeros(len(profile_pos), dtype=bool)
+                dup[1:] = profile_pos[1:] == profile_pos[:-1]
+                if np.any(dup):
+                    profile_pos = profile_pos[~dup]
+            chromo_pos.append(profile_pos)
+        chromo_pos, chromo_cov = np.unique(np.concatenate(chromo_pos),
+                                           return_counts=True)
+        codes.append(np.empty(len(chromo_pos), dtype=np.int8 if
+                              len(chromos) < 128 else np.int32))
+        codes[-1].fill(i)
+        pos.append(chromo_pos.astype(np.int32))
+        cov.append(chromo_cov.astype(np.int32))
+
+    def concat(values, dtype):
+        return np.concatenate(values) if values else np.empty(0, dtype=dtype)
+
+    pos_table = pd.DataFrame({
+        'chromo': pd.Categorical.from_codes(concat(codes, np.int8), chromos),
+        'pos': concat(pos, np.int32),
+        'cov': concat(cov, np.int32)},
+        columns=['chromo', 'pos', 'cov'])
     return pos_table
 
 
@@ -93,30 +181,264 @@ def split_ext(filename):
     return os.path.basename(filename).split(os.extsep)[0]
 
 
-def read_cpg_profiles(filenames, log=None, *args, **kwargs):
+def get_file_fingerprint(filename, block_size=2**16):
+    """Returns hash of the size and the first and last `block_size` bytes of
+    `filename`, which changes with most edits without reading the entire
+    file."""
+    size = os.path.getsize(filename)
+    fingerprint = hashlib.sha1(str(size).encode())
+    with open(filename, 'rb') as f:
+        fingerprint.update(f.read(block_size))
+        if size > block_size:
+            f.seek(max(block_size, size - block_size))
+            fingerprint.update(f.read(block_size))
+    return fingerprint.hexdigest()
+
+
+def get_cache_filename(filename, cache_dir, **kwargs):
+    """Returns name of cache file of CpG profile `filename`.
+
+    The name is a hash of the absolute path of `filename`, its fingerprint
+    (see :func:`get_file_fingerprint`), and the options `kwargs` used for
+    reading it, such that copies with preserved modification time or edits
+    that keep size and modification time are not read from stale cache files.
+    """
+    key = repr((os.path.abspath(filename), get_file_fingerprint(filename),
+                sorted(kwargs.items())))
+    key = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, '%s.%s.npz' % (split_ext(filename), key))
+
+
+def get_file_stat(filename):
+    """Returns array with size and modification time of `filename`."""
+    stat = os.stat(filename)
+    return np.array([stat.st_size, stat.st_mtime])
+
+
+def read_cpg_profile(filename, cache_dir=None, spill_dir=None, **kwargs):
+    """Reads CpG profile `filename` as :class:`dat.CpgProfile`.
+
+    If `cache_dir` is provided, the parsed profile is loaded from a binary
+    cache file in `cache_dir`, or stored there after parsing. Cache files are
+    invalidated if the size, modification time, or fingerprint of `filename`
+    changed.
+
+    If `spill_dir` is provided, the profile is split into per-chromosome
+    files in `spill_dir` and returned as :class:`dat.SpilledCpgProfile`
+    instead, and `cache_dir` is ignored.
+
+    Returns
+    -------
+    tuple
+        Tuple (`profile`, `cached`), where `cached` is `True` if the profile
+        was loaded from the cache.
+    """
+    if spill_dir:
+        # Profiles are not sampled randomly in low-memory mode
+        kwargs.pop('nb_sample_chromo', None)
+        cpg_file = dat.GzipFile(filename, 'r')
+        cpg_profile = dat.SpilledCpgProfile.write(cpg_file, spill_dir,
+                                                  **kwargs)
+        cpg_file.close()
+        return (cpg_profile, False)
+
+    cache_file = None
+    if cache_dir:
+        cache_file = get_cache_filename(filename, cache_dir, **kwargs)
+        if os.path.isfile(cache_file):
+            with np.load(cache_file) as data:
+                stat = data['stat'] if 'stat' in data else None
+            if stat is not None and \
+                    np.array_equal(stat, get_file_stat(filename)):
+                return (dat.CpgProfile.load(cache_file), True)
+
+    stat = get_file_stat(filename)
+    cpg_file = dat.GzipFile(filename, 'r')
+    cpg_profile = dat.CpgProfile.read(cpg_file, **kwargs)
+    cpg_file.close()
+
+    if cache_file:
+        make_dir(cache_dir)
+        # Write to temporary file first, such that incomplete cache files are
+        # not read by concurrent runs.
+        tmp_file = '%s.%d.tmp.npz' % (cache_file[:-4], os.getpid())
+        cpg_profile.save(tmp_file, stat=stat)
+        os.rename(tmp_file, cache_file)
+    return (cpg_profile, False)
+
+
+def get_fork_context():
+    """Returns a multiprocessing context that forks worker processes.
+
+    Returns `None` if fork is not supported on this platform. Python 2 lacks
+    contexts, but :class:`multiprocessing.Pool` forks on POSIX.
+    """
+    if not hasattr(multiprocessing, 'get_context'):
+        return multiprocessing if os.name == 'posix' else None
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('fork')
+
+
+def _read_cpg_profile(task):
+    filename, cache_dir, spill_dir, kwargs = task
+    return read_cpg_profile(filename, cache_dir, spill_dir, **kwargs)
+
+
+def read_cpg_profiles(filenames, log=None, cache_dir=None, spill_dir=None,
+                      nb_worker=1, **kwargs):
     """Read methylation profiles.
 
-    Input files can be gzip compressed.
+    Input files can be gzip compressed. Files are read in parallel by
+    `nb_worker` processes and optionally cached in `cache_dir`, such that
+    reading them again does not require to parse text files.
+
+    If `spill_dir` is provided, profiles are split into per-chromosome files
+    in sub-directories of `spill_dir`, such that only one chromosome of all
+    profiles needs to be loaded into memory at a time.
+
+    Profiles are neither read in parallel nor cached if `nb_sample_chromo` is
+    provided, since profiles are then randomly sampled.
 
     Returns
     -------
     dict
-        `dict (key, value)`, where `key` is the output name and `value` the CpG
-        table.
+        `dict (key, value)`, where `key` is the output name and `value` the
+        :class:`dat.CpgProfile` or :class:`dat.SpilledCpgProfile`.
     """
 
+    if kwargs.get('nb_sample_chromo'):
+        cache_dir = None
+        nb_worker = 1
+    tasks = []
+    for i, filename in enumerate(filenames):
+        file_spill_dir = None
+        if spill_dir:
+            file_spill_dir = os.path.join(spill_dir, str(i))
+        tasks.append((filename, cache_dir, file_spill_dir, kwargs))
+    if nb_worker > 1 and len(tasks) > 1:
+        context = get_fork_context() or multiprocessing
+        pool = context.Pool(min(nb_worker, len(tasks)))
+        try:
+            results = pool.map(_read_cpg_profile, tasks, chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = six.moves.map(_read_cpg_profile, tasks)
+
     cpg_profiles = OrderedDict()
-    for filename in filenames:
+    for filename, (cpg_profile, cached) in zip(filenames, results):
         if log:
-            log(filename)
-        cpg_file = dat.GzipFile(filename, 'r')
-        output_name = split_ext(filename)
-        cpg_profile = dat.read_cpg_profile(cpg_file, sort=True, *args, **kwargs)
-        cpg_profiles[output_name] = cpg_profile
-        cpg_file.close()
+            log(filename + (' (cached)' if cached else ''))
+        cpg_profiles[split_ext(filename)] = cpg_profile
     return cpg_profiles
 
 
+class SeqWindowExtractor(object):
+    """Extracts DNA sequence windows from a chromosome.
+
+    Windows inside the chromosome are gathered at once from a strided view of
+    the integer-encoded chromosome, which is not copied, and windows at the
+    chromosome ends are padded by 'N'. Windows of a genome store are read
+    from the store by :meth:`genome.GenomeStore.windows`.
+
+    Parameters
+    ----------
+    seq: str, np.array, or :class:`genome.GenomeStore`
+        DNA sequence, integer-encoded int8 array, or genome store.
+    wlen: int
+        Window length.
+    seq_index: int
+        Offset at which positions start.
+    chromo: str
+        Chromosome name if `seq` is a genome store.
+    """
+
+    def __init__(self, seq, wlen, seq_index=1, chromo=None):
+        self.wlen = wlen
+        self.seq_index = seq_index
+        self.delta = wlen // 2
+        self.store = None
+        self.chromo = chromo
+        if isinstance(seq, genome.GenomeStore):
+            if chromo not in seq:
+                raise ValueError('Chromosome "%s" not in genome store!' %
+                                 chromo)
+            self.store = seq
+            self.seq_len = seq.get_len(chromo)
+            return
+        if isinstance(seq, np.ndarray) and seq.dtype == np.int8:
+            # Already integer-encoded, e.g. memory-mapped from genome store
+            self.seq = seq
+        else:
+            self.seq = dna.ascii_to_int(seq)
+        self.seq_len = len(self.seq)
+        self.wins = np.lib.stride_tricks.as_strided(
+            self.seq, shape=(max(0, self.seq_len - wlen + 1), wlen),
+            strides=(self.seq.strides[0], self.seq.strides[0]),
+            writeable=False)
+
+    def _gather(self, start, wlen):
+        """Returns windows of length `wlen` at 0-based `start` positions.
+        Bases outside the chromosome are 'N'."""
+        if self.store is not None:
+            return self.store.windows(self.chromo, start + wlen // 2, wlen,
+                                      seq_index=0)
+        wins = np.empty((len(start), wlen), dtype=np.int8)
+        inner = (start >= 0) & (start + wlen <= self.seq_len)
+        if wlen == self.wlen:
+            wins[inner] = self.wins[start[inner]]
+        else:
+            inner[:] = False
+        edge = ~inner
+        if np.any(edge):
+            idx = start[edge].reshape(-1, 1) + np.arange(wlen)
+            inside = (idx >= 0) & (idx < self.seq_len)
+            edge_wins = np.empty(idx.shape, dtype=np.int8)
+            edge_wins.fill(dna.CHAR_TO_INT['N'])
+            edge_wins[inside] = self.seq[idx[inside]]
+            wins[edge] = edge_wins
+        return wins
+
+    def __call__(self, pos, assert_cpg=False):
+        """Extracts DNA sequence windows at positions.
+
+        Parameters
+        ----------
+        pos: list
+            Positions at which windows are extracted.
+        assert_cpg: bool
+            If `True`, check if positions in `pos` point to CpG sites.
+
+        Returns
+        -------
+        np.array
+            Array with integer-encoded sequence windows.
+        """
+
+        pos = np.asarray(pos, dtype=np.int64) - self.seq_index
+        out = (pos < 0) | (pos >= self.seq_len)
+        if np.any(out):
+            tmp = pos[out][0] + self.seq_index
+            raise ValueError('Position %d not on chromosome!' % tmp)
+        bases = self._gather(pos, 2)
+        no_cpg = (bases[:, 0] != dna.CHAR_TO_INT['C']) | \
+            (bases[:, 1] != dna.CHAR_TO_INT['G'])
+        for p in pos[no_cpg]:
+            warnings.warn('No CpG site at position %d!' % (p + self.seq_index))
+
+        seq_wins = self._gather(pos - self.delta, self.wlen)
+        # Randomly choose missing nucleotides
+        idx = seq_wins == dna.CHAR_TO_INT['N']
+        seq_wins[idx] = np.random.randint(0, 4, idx.sum())
+        assert seq_wins.max() < 4
+        if assert_cpg:
+            assert np.all(seq_wins[:, self.delta] == 3)
+            assert np.all(seq_wins[:, self.delta + 1] == 2)
+        return seq_wins
+
+
 def extract_seq_windows(seq, pos, wlen, seq_index=1, assert_cpg=False):
     """Extracts DNA sequence windows at positions.
 
@@ -138,89 +460,97 @@ def extract_seq_windows(seq, pos, wlen, seq_index=1, assert_cpg=False):
     np.array
         Array with integer-encoded sequence windows.
     """
+    ext = SeqWindowExtractor(seq, wlen, seq_index=seq_index)
+    return ext(pos, assert_cpg=assert_cpg)
+
+
+def is_sorted(values):
+    """Tests if `values` are sorted in ascending order."""
+    return np.all(values[1:] >= values[:-1])
 
-    delta = wlen // 2
-    nb_win = len(pos)
-    seq = seq.upper()
-    seq_wins = np.zeros((nb_win, wlen), dtype='int8')
-
-    for i in range(nb_win):
-        p = pos[i] - seq_index
-        if p < 0 or p >= len(seq):
-            raise ValueError('Position %d not on chromosome!' % (p + seq_index))
-        if seq[p:p + 2] != 'CG':
-            warnings.warn('No CpG site at position %d!' % (p + seq_index))
-        win = seq[max(0, p - delta): min(len(seq), p + delta + 1)]
-        if len(win) < wlen:
-            win = max(0, delta - p) * 'N' + win
-            win += max(0, p + delta + 1 - len(seq)) * 'N'
-            assert len(win) == wlen
-        seq_wins[i] = dna.char_to_int(win)
-    # Randomly choose missing nucleotides
-    idx = seq_wins == dna.CHAR_TO_INT['N']
-    seq_wins[idx] = np.random.randint(0, 4, idx.sum())
-    assert seq_wins.max() < 4
-    if assert_cpg:
-        assert np.all(seq_wins[:, delta] == 3)
-        assert np.all(seq_wins[:, delta + 1] == 2)
-    return seq_wins
-
-
-def map_values(values, pos, target_pos, dtype=None, nan=dat.CPG_NAN):
+
+def map_values(values, pos, target_pos, dtype=None, nan=dat.CPG_NAN,
+               out=None):
     """Maps `values` array at positions `pos` to `target_pos`.
 
-    Inserts `nan` for uncovered positions.
+    Inserts `nan` for uncovered positions. `pos` and `target_pos` must be
+    sorted.
+
+    Parameters
+    ----------
+    out: np.array
+        Optional array of length `len(target_pos)` into which values are
+        written.
     """
     assert len(values) == len(pos)
-    assert np.all(pos == np.sort(pos))
-    assert np.all(target_pos == np.sort(target_pos))
+    assert is_sorted(pos)
+    assert is_sorted(target_pos)
 
     values = values.ravel()
     pos = pos.ravel()
     target_pos = target_pos.ravel()
-    idx = np.in1d(pos, target_pos)
-    pos = pos[idx]
-    values = values[idx]
-    if not dtype:
-        dtype = values.dtype
-    target_values = np.empty(len(target_pos), dtype=dtype)
-    target_values.fill(nan)
-    idx = np.in1d(target_pos, pos).nonzero()[0]
-    assert len(idx) == len(values)
-    assert np.all(target_pos[idx] == pos)
-    target_values[idx] = values
-    return target_values
+    idx = np.searchsorted(target_pos, pos)
+    match = idx < len(target_pos)
+    match[match] = target_pos[idx[match]] == pos[match]
+    if out is None:
+        if not dtype:
+            dtype = values.dtype
+        out = np.empty(len(target_pos), dtype=dtype)
+    assert len(out) == len(target_pos)
+    out.fill(nan)
+    out[idx[match]] = values[match]
+    return out
 
 
 def map_cpg_tables(cpg_tables, chromo, chromo_pos):
     """Maps values from cpg_tables to `chromo_pos`.
 
-    Positions in `cpg_tables` for `chromo`  must be a subset of `chromo_pos`.
+    `cpg_tables` is a `dict` of :class:`dat.CpgProfile`. Positions in
+    `cpg_tables` for `chromo`  must be a subset of `chromo_pos`.
     Inserts `dat.CPG_NAN` for uncovered positions.
+
+    Returns
+    -------
+    np.array
+        Matrix of size `len(chromo_pos)` x `len(cpg_tables)` with mapped
+        values. int8 if all profiles are binary.
     """
     chromo_pos.sort()
-    mapped_tables = OrderedDict()
-    for name, cpg_table in six.iteritems(cpg_tables):
-        cpg_table = cpg_table.loc[cpg_table.chromo == chromo]
-        cpg_table = cpg_table.sort_values('pos')
-        mapped_table = map_values(cpg_table.value.values,
-                                  cpg_table.pos.values,
-                                  chromo_pos)
-        assert len(mapped_table) == len(chromo_pos)
-        mapped_tables[name] = mapped_table
-    return mapped_tables
+    dtype = np.result_type(*[cpg_table.dtype
+                             for cpg_table in six.itervalues(cpg_tables)])
+    cpg_mat = np.empty((len(chromo_pos), len(cpg_tables)), dtype=dtype)
+    for i, cpg_table in enumerate(six.itervalues(cpg_tables)):
+        pos, value = cpg_table.get(chromo)
+        map_values(value, pos, chromo_pos, out=cpg_mat[:, i])
+    return cpg_mat
 
 
 def format_out_of(out, of):
     return '%d / %d (%.1f%%)' % (out, of, out / of * 100)
 
 
+def create_cpg_dataset(group, name, data, profile=None, compact=False,
+                       dist=False):
+    """Creates dataset of CpG states or distances with storage profile
+    `profile`, which is encoded compactly if `compact` is `True`."""
+    encoding = None
+    if compact:
+        if dist:
+            encoding = 'uint16'
+        elif packing.can_pack_2bit(data):
+            encoding = '2bit'
+    return hdf.create_dataset(group, name, data, profile=profile,
+                              encoding=encoding)
+
+
 def get_stats_meta(names):
     funs = OrderedDict()
     for name in names:
         fun = stats.get(name)
         if name in ['mode', 'cat_var', 'cat2_var', 'diff']:
             dtype = np.int8
+        elif name == 'cov':
+            dtype = np.int32
         else:
             dtype = np.float32
         funs[name] = (fun, dtype)
@@ -237,18 +567,12 @@ def select_dict(data, idx):
     return data
 
 
-def annotate(anno_file, chromo, pos):
-    anno_file = dat.GzipFile(anno_file, 'r')
-    anno = pd.read_table(anno_file, header=None, usecols=[0, 1, 2],
-                         dtype={0: 'str', 1: 'int32', 2: 'int32'})
-    anno_file.close()
-    anno.columns = ['chromo', 'start', 'end']
-    anno.chromo = anno.chromo.str.upper().str.replace('CHR', '')
-    anno = anno.loc[anno.chromo == chromo]
-    anno.sort_values('start', inplace=True)
-    start, end = an.join_overlapping(anno.start.values, anno.end.values)
-    anno = np.array(an.is_in(pos, start, end), dtype='int8')
-    return anno
+# App whose state is shared with forked worker processes
+_app = None
+
+
+def _process_chromo(task):
+    return _app.process_chromo(*task)
 
 
 class App(object):
@@ -289,18 +613,64 @@ class App(object):
         p.add_argument(
             '--dna_files',
             help='Directory or FASTA files named "*.chromosome.`chromo`.fa*"'
-            ' with the DNA sequences for chromosome `chromo`.',
+            ' with the DNA sequences for chromosome `chromo`, or genome store'
+            ' created by `dcpg_genome.py`.',
             nargs='+')
         p.add_argument(
             '--dna_wlen',
             help='DNA window length',
             type=int,
             default=1001)
+        p.add_argument(
+            '--dna_ref',
+            help='Do not store DNA sequence windows but only a reference to'
+            ' the genome store in `--dna_files`, from which windows are read'
+            ' when reading data. Reduces the size of data files and allows'
+            ' to change the window length without recreating data files.',
+            action='store_true')
         p.add_argument(
             '--anno_files',
             help='Files with genomic annotations that are used as input'
-            ' features. Currently ignored by `dcpg_train.py`.',
+            ' features. Currently ignored by `dcpg_train.py`. Files must not'
+            ' be named after features, e.g. `distance.bed`.',
             nargs='+')
+        p.add_argument(
+            '--anno_features',
+            help='Features of annotations. `is_in`: whether CpG sites are'
+            ' in annotated intervals. `distance`: signed distance to the'
+            ' nearest interval, which is negative for upstream intervals.'
+            ' `density`: number of intervals within `--anno_radius`.',
+            nargs='+',
+            choices=['is_in', 'distance', 'density'],
+            default=['is_in'])
+        p.add_argument(
+            '--anno_radius',
+            help='Radius around CpG sites for computing interval density',
+            type=int,
+            default=1000)
+        p.add_argument(
+            '--layout',
+            help='Layout of output files. 1: one dataset per cell. 2: one'
+            ' matrix with cells as columns for CpG outputs and one for states'
+            ' and distances of neighboring CpG sites, which are read at once.',
+            type=int,
+            choices=dat.LAYOUTS,
+            default=1)
+        p.add_argument(
+            '--compact_cpg',
+            help='Store CpG states with missing values, e.g. binary outputs'
+            ' and states of neighboring CpG sites, as 2-bit codes and'
+            ' distances of neighboring CpG sites as uint16, saturated at'
+            ' 65535. Encoded datasets are decoded when reading data.',
+            action='store_true')
+        p.add_argument(
+            '--storage',
+            help='Storage profile of datasets: %s, or comma-separated'
+            ' compression (gzip[:level], lzf, none), `shuffle`, and'
+            ' `chunk_rows=<rows>`, e.g. `gzip:6,shuffle,chunk_rows=1024`.'
+            ' Chunk rows should be a multiple of the batch size.' %
+            ', '.join(hdf.STORAGE_PROFILES.keys()),
+            default='default')
         p.add_argument(
             '-o', '--out_dir',
             help='Output directory',
@@ -340,6 +710,12 @@ class App(object):
             '--chromos',
             nargs='+',
             help='Chromosomes that are used')
+        g.add_argument(
+            '--chromo_sorted',
+            action='store_true',
+            help='Assume that sites of the same chromosome are stored'
+            ' consecutively in CpG profiles, such that reading profiles stops'
+            ' after the chromosomes given by --chromos')
         g.add_argument(
             '--nb_sample',
             type=int,
@@ -354,9 +730,29 @@ class App(object):
             default=32768,
             help='Maximum number of samples per output file. Should be'
             ' divisible by batch size.')
+        g.add_argument(
+            '--nb_worker',
+            type=int,
+            default=1,
+            help='Number of processes for reading CpG profiles and processing'
+            ' chromosomes in parallel')
+        g.add_argument(
+            '--cache_dir',
+            help='Directory for caching parsed CpG profiles and annotations.'
+            ' Cached files are reused by subsequent runs with the same options'
+            ' and updated if input files change.')
+        g.add_argument(
+            '--low_memory',
+            action='store_true',
+            help='Split CpG profiles into temporary per-chromosome files in'
+            ' the output directory and only load one chromosome of all'
+            ' profiles into memory at a time')
         g.add_argument(
             '--seed',
-            help='Seed of random number generator',
+            help='Seed of random number generator, which is reset to `seed +'
+            ' i` for the i-th chromosome, such that output does not depend on'
+            ' --nb_worker. Output therefore differs from versions that seeded'
+            ' the generator only once',
             type=int,
             default=0)
         g.add_argument(
@@ -390,6 +786,20 @@ class App(object):
             raise '--dna_wlen must be odd!'
         if opts.cpg_wlen and opts.cpg_wlen % 2 != 0:
             raise '--cpg_wlen must be even!'
+        opts.storage = hdf.get_storage_profile(opts.storage)
+        if opts.dna_ref:
+            if not opts.dna_files or len(opts.dna_files) != 1 or \
+                    not genome.is_store(opts.dna_files[0]):
+                raise ValueError('--dna_ref requires a genome store created by'
+                                 ' `dcpg_genome.py`!')
+        if opts.anno_files:
+            # Features other than `is_in` are stored in groups `annos/<name>`
+            for anno_file in opts.anno_files:
+                name = split_ext(anno_file)
+                if name != 'is_in' and name in opts.anno_features:
+                    raise ValueError('Annotation name "%s" of %s is reserved'
+                                     ' for annotation features!' %
+                                     (name, anno_file))
 
         # Parse functions for computing output statistics
         cpg_stats_meta = None
@@ -405,11 +815,23 @@ class App(object):
         # Read single-cell profiles if provided
         if opts.cpg_profiles:
             log.info('Reading CpG profiles ...')
+            spill_dir = None
+            if opts.low_memory:
+                if opts.nb_sample_chromo:
+                    raise ValueError('--nb_sample_chromo can not be used with'
+                                     ' --low_memory!')
+                spill_dir = tempfile.mkdtemp(prefix='.spill_',
+                                             dir=opts.out_dir)
+                atexit.register(shutil.rmtree, spill_dir, True)
             outputs['cpg'] = read_cpg_profiles(
                 opts.cpg_profiles,
                 chromos=opts.chromos,
                 nb_sample=opts.nb_sample,
                 nb_sample_chromo=opts.nb_sample_chromo,
+                chromo_sorted=opts.chromo_sorted,
+                cache_dir=opts.cache_dir,
+                spill_dir=spill_dir,
+                nb_worker=opts.nb_worker,
                 log=log.info)
 
         # Create table with unique positions
@@ -424,204 +846,376 @@ class App(object):
             pos_table = prepro_pos_table(pos_table)
         else:
             # Extract positions from profiles
-            pos_tables = []
-            for cpg_table in list(outputs['cpg'].values()):
-                pos_tables.append(cpg_table[['chromo', 'pos']])
-            pos_table = prepro_pos_table(pos_tables)
+            pos_table = get_profile_pos_table(list(outputs['cpg'].values()))
 
         if opts.chromos:
             pos_table = pos_table.loc[pos_table.chromo.isin(opts.chromos)]
+        if hasattr(pos_table.chromo, 'cat'):
+            pos_table = pos_table.copy()
+            pos_table['chromo'] = \
+                pos_table.chromo.cat.remove_unused_categories()
         if opts.nb_sample_chromo:
             pos_table = dat.sample_from_chromo(pos_table, opts.nb_sample_chromo)
         if opts.nb_sample:
             pos_table = pos_table.iloc[:opts.nb_sample]
+        if 'cov' in pos_table.columns and opts.cpg_cov:
+            # Coverage of positions from profiles is already known
+            idx = pos_table['cov'].values >= opts.cpg_cov
+            tmp = '%s sites matched minimum coverage filter'
+            tmp %= format_out_of(idx.sum(), len(idx))
+            log.info(tmp)
+            pos_table = pos_table.loc[idx]
 
         log.info('%d samples' % len(pos_table))
 
         make_dir(opts.out_dir)
+        # Remove manifest and range index while data files are written, such
+        # that they never describe partially written files
+        manifest_file = os.path.join(opts.out_dir, mf.MANIFEST_FILE)
+        if os.path.isfile(manifest_file):
+            os.remove(manifest_file)
+        index_file = os.path.join(opts.out_dir, ri.INDEX_FILE)
+        if os.path.isfile(index_file):
+            os.remove(index_file)
+
+        # Parse annotations once for all chromosomes
+        anno_index = None
+        if opts.anno_files:
+            log.info('Reading annotations ...')
+            anno_index = an.AnnoIndex.read(
+                opts.anno_files,
+                names=[split_ext(anno_file) for anno_file in opts.anno_files],
+                cache_dir=opts.cache_dir)
 
         # Iterate over chromosomes
         # ------------------------
-        for chromo in pos_table.chromo.unique():
-            log.info('-' * 80)
-            log.info('Chromosome %s ...' % (chromo))
-            idx = pos_table.chromo == chromo
-            chromo_pos = pos_table.loc[idx].pos.values
-            chromo_outputs = OrderedDict()
-
-            if 'cpg' in outputs:
-                # Concatenate CpG tables into single nb_site x nb_output matrix
-                chromo_outputs['cpg'] = map_cpg_tables(outputs['cpg'],
+        self.opts = opts
+        self.log = log
+        self.outputs = outputs
+        self.cpg_stats_meta = cpg_stats_meta
+        self.win_stats_meta = win_stats_meta
+        self.anno_index = anno_index
+
+        tasks = []
+        for chromo_idx, chromo in enumerate(pos_table.chromo.unique()):
+            chromo_pos = pos_table.loc[pos_table.chromo == chromo].pos.values
+            if not len(chromo_pos):
+                continue
+            seed = None
+            if opts.seed is not None:
+                seed = opts.seed + chromo_idx
+            tasks.append((chromo, chromo_pos, seed))
+
+        if opts.nb_worker > 1 and len(tasks) > 1:
+            filenames = self.process_parallel(tasks, opts.nb_worker)
+        else:
+            filenames = sum([self.process_chromo(*task) for task in tasks],
+                            [])
+
+        # Manifest and range index only describe files of this run, since
+        # files of previous runs might overlap with them
+        other_files = set(mf.find_data_files(opts.out_dir)) - \
+            set([os.path.join(opts.out_dir, os.path.basename(filename))
+                 for filename in filenames])
+        if other_files:
+            log.warning('%d data files in %s were not written by this run and'
+                        ' are not indexed!' % (len(other_files),
+                                                opts.out_dir))
+        log.info('Writing manifest ...')
+        manifest = mf.Manifest.build(opts.out_dir, filenames)
+        manifest.save()
+        log.info('Writing range index ...')
+        ri.RangeIndex.build(filenames).save(opts.out_dir)
+        nb_sample = sum([manifest.get(filename)['nb_sample']
+                         for filename in filenames])
+        log.info('%d samples written' % nb_sample)
+
+        log.info('Done!')
+        return 0
+
+    def process_parallel(self, tasks, nb_worker):
+        """Processes chromosomes in parallel.
+
+        Worker processes are forked after all inputs have been read, such that
+        they share the memory of CpG profiles with the parent process instead
+        of receiving pickled copies. Tasks only contain the chromosome name,
+        positions, and seed. Large chromosomes are processed first. Without
+        fork, e.g. on Windows, chromosomes are processed serially.
+
+        Returns
+        -------
+        list
+            Names of written data files.
+        """
+        global _app
+
+        # Workers must be forked, since spawned workers re-import the module
+        # and do not share `_app`
+        context = get_fork_context()
+        if context is None:
+            self.log.warning('Parallel processing requires fork. Processing'
+                             ' chromosomes serially.')
+            return sum([self.process_chromo(*task) for task in tasks], [])
+
+        tasks = sorted(tasks, key=lambda task: len(task[1]), reverse=True)
+        _app = self
+        pool = context.Pool(min(nb_worker, len(tasks)))
+        try:
+            filenames = pool.map(_process_chromo, tasks, chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+            _app = None
+        return sum(filenames, [])
+
+    def process_chromo(self, chromo, chromo_pos, seed=None):
+        """Writes data chunk files of chromosome `chromo`.
+
+        Parameters
+        ----------
+        chromo: str
+            Chromosome name.
+        chromo_pos: np.array
+            Sorted positions of CpG sites on `chromo`.
+        seed: int
+            Seed of random number generator, which is reset for each
+            chromosome such that output does not depend on the order in which
+            chromosomes are processed.
+
+        Returns
+        -------
+        list
+            Names of written data files.
+        """
+        opts = self.opts
+        log = self.log
+        outputs = self.outputs
+        cpg_stats_meta = self.cpg_stats_meta
+        win_stats_meta = self.win_stats_meta
+
+        log.info('-' * 80)
+        log.info('Chromosome %s ...' % (chromo))
+        if seed is not None:
+            np.random.seed(seed)
+        chromo_outputs = OrderedDict()
+
+        if 'cpg' in outputs:
+            # Map CpG tables to single nb_site x nb_output matrix
+            cpg_names = list(outputs['cpg'].keys())
+            chromo_outputs['cpg_mat'] = map_cpg_tables(outputs['cpg'],
                                                        chromo, chromo_pos)
-                chromo_outputs['cpg_mat'] = np.vstack(
-                    list(chromo_outputs['cpg'].values())).T
-                assert len(chromo_outputs['cpg_mat']) == len(chromo_pos)
-
-            if 'cpg_mat' in chromo_outputs and opts.cpg_cov:
-                cov = np.sum(chromo_outputs['cpg_mat'] != dat.CPG_NAN, axis=1)
-                assert np.all(cov >= 1)
-                idx = cov >= opts.cpg_cov
-                tmp = '%s sites matched minimum coverage filter'
-                tmp %= format_out_of(idx.sum(), len(idx))
-                log.info(tmp)
-                if idx.sum() == 0:
-                    continue
-
-                chromo_pos = chromo_pos[idx]
-                chromo_outputs = select_dict(chromo_outputs, idx)
-
-            # Read DNA of chromosome
-            chromo_dna = None
-            if opts.dna_files:
-                chromo_dna = fasta.read_chromo(opts.dna_files, chromo)
-
-            annos = None
-            if opts.anno_files:
-                log.info('Annotating CpG sites ...')
-                annos = dict()
-                for anno_file in opts.anno_files:
-                    name = split_ext(anno_file)
-                    annos[name] = annotate(anno_file, chromo, chromo_pos)
-
-            # Iterate over chunks
-            # -------------------
-            nb_chunk = int(np.ceil(len(chromo_pos) / opts.chunk_size))
-            for chunk in range(nb_chunk):
-                log.info('Chunk \t%d / %d' % (chunk + 1, nb_chunk))
-                chunk_start = chunk * opts.chunk_size
-                chunk_end = min(len(chromo_pos), chunk_start + opts.chunk_size)
-                chunk_idx = slice(chunk_start, chunk_end)
-                chunk_pos = chromo_pos[chunk_idx]
-
-                chunk_outputs = select_dict(chromo_outputs, chunk_idx)
-
-                filename = 'c%s_%06d-%06d.h5' % (chromo, chunk_start, chunk_end)
-                filename = os.path.join(opts.out_dir, filename)
-                chunk_file = h5.File(filename, 'w')
-
-                # Write positions
-                chunk_file.create_dataset('chromo', shape=(len(chunk_pos),),
-                                          dtype='S2')
-                chunk_file['chromo'][:] = chromo.encode()
-                chunk_file.create_dataset('pos', data=chunk_pos, dtype=np.int32)
-
-                if len(chunk_outputs):
-                    out_group = chunk_file.create_group('outputs')
-
-                # Write cpg profiles
-                if 'cpg' in chunk_outputs:
-                    for name, value in six.iteritems(chunk_outputs['cpg']):
+            assert len(chromo_outputs['cpg_mat']) == len(chromo_pos)
+
+        if 'cpg_mat' in chromo_outputs and opts.cpg_cov and opts.pos_file:
+            cov = np.sum(chromo_outputs['cpg_mat'] != dat.CPG_NAN, axis=1)
+            assert np.all(cov >= 1)
+            idx = cov >= opts.cpg_cov
+            tmp = '%s sites matched minimum coverage filter'
+            tmp %= format_out_of(idx.sum(), len(idx))
+            log.info(tmp)
+            if idx.sum() == 0:
+                return []
+
+            chromo_pos = chromo_pos[idx]
+            chromo_outputs = select_dict(chromo_outputs, idx)
+
+        # Read DNA of chromosome
+        chromo_dna = None
+        if opts.dna_ref:
+            if chromo not in genome.GenomeStore(opts.dna_files[0]):
+                raise ValueError('Chromosome "%s" not in genome store!' %
+                                 chromo)
+        elif opts.dna_files:
+            dna_file = fasta.select_file_by_chromo(opts.dna_files, chromo)
+            if dna_file and genome.is_store(dna_file):
+                # Windows are read from the store without loading the
+                # chromosome
+                chromo_dna = SeqWindowExtractor(genome.GenomeStore(dna_file),
+                                                opts.dna_wlen, chromo=chromo)
+            else:
+                chromo_dna = SeqWindowExtractor(
+                    fasta.read_chromo(opts.dna_files, chromo, encode=True),
+                    opts.dna_wlen)
+
+        annos = None
+        if opts.anno_files:
+            log.info('Annotating CpG sites ...')
+            features = [ANNO_FEATURES[name] for name in opts.anno_features]
+            annos = self.anno_index.query(chromo, chromo_pos, features,
+                                          radius=opts.anno_radius)
+
+        # Iterate over chunks
+        # -------------------
+        filenames = []
+        nb_chunk = int(np.ceil(len(chromo_pos) / opts.chunk_size))
+        for chunk in range(nb_chunk):
+            log.info('Chunk \t%d / %d' % (chunk + 1, nb_chunk))
+            chunk_start = chunk * opts.chunk_size
+            chunk_end = min(len(chromo_pos), chunk_start + opts.chunk_size)
+            chunk_idx = slice(chunk_start, chunk_end)
+            chunk_pos = chromo_pos[chunk_idx]
+
+            chunk_outputs = select_dict(chromo_outputs, chunk_idx)
+
+            filename = 'c%s_%06d-%06d.h5' % (chromo, chunk_start, chunk_end)
+            filename = os.path.join(opts.out_dir, filename)
+            chunk_file = h5.File(filename, 'w')
+            filenames.append(filename)
+            if opts.layout > 1:
+                chunk_file.attrs['layout'] = opts.layout
+
+            # Write positions
+            chunk_file.create_dataset('chromo', shape=(len(chunk_pos),),
+                                      dtype='S2')
+            chunk_file['chromo'][:] = chromo.encode()
+            chunk_file.create_dataset('pos', data=chunk_pos, dtype=np.int32)
+
+            if len(chunk_outputs):
+                out_group = chunk_file.create_group('outputs')
+
+            # Write cpg profiles
+            if 'cpg_mat' in chunk_outputs:
+                if opts.layout > 1:
+                    # Round continuous values
+                    value = chunk_outputs['cpg_mat'].round().astype(np.int8)
+                    dataset = create_cpg_dataset(out_group, 'cpg', value,
+                                                 opts.storage,
+                                                 opts.compact_cpg)
+                    hdf.set_names(dataset, cpg_names)
+                else:
+                    for i, name in enumerate(cpg_names):
+                        value = chunk_outputs['cpg_mat'][:, i]
                         assert len(value) == len(chunk_pos)
                         # Round continuous values
-                        out_group.create_dataset('cpg/%s' % name,
-                                                 data=value.round(),
-                                                 dtype=np.int8,
-                                                 compression='gzip')
-                    # Compute and write statistics
-                    if cpg_stats_meta is not None:
-                        log.info('Computing per CpG statistics ...')
-                        cpg_mat = np.ma.masked_values(chunk_outputs['cpg_mat'],
-                                                      dat.CPG_NAN)
-                        mask = np.sum(~cpg_mat.mask, axis=1)
-                        mask = mask < opts.cpg_stats_cov
-                        for name, fun in six.iteritems(cpg_stats_meta):
-                            stat = fun[0](cpg_mat).data.astype(fun[1])
-                            stat[mask] = dat.CPG_NAN
-                            assert len(stat) == len(chunk_pos)
-                            out_group.create_dataset('cpg_stats/%s' % name,
-                                                     data=stat,
-                                                     dtype=fun[1],
-                                                     compression='gzip')
-
-                # Write input features
-                in_group = chunk_file.create_group('inputs')
-
-                # DNA windows
-                if chromo_dna:
-                    log.info('Extracting DNA sequence windows ...')
-                    dna_wins = extract_seq_windows(chromo_dna, pos=chunk_pos,
-                                                   wlen=opts.dna_wlen)
-                    assert len(dna_wins) == len(chunk_pos)
-                    in_group.create_dataset('dna', data=dna_wins, dtype=np.int8,
-                                            compression='gzip')
-
-                # CpG neighbors
-                if opts.cpg_wlen:
-                    log.info('Extracting CpG neighbors ...')
-                    cpg_ext = fext.KnnCpgFeatureExtractor(opts.cpg_wlen // 2)
-                    context_group = in_group.create_group('cpg')
-                    # outputs['cpg'], since neighboring CpG sites might lie
-                    # outside chunk borders and un-mapped values are needed
-                    for name, cpg_table in six.iteritems(outputs['cpg']):
-                        cpg_table = cpg_table.loc[cpg_table.chromo == chromo]
-                        state, dist = cpg_ext.extract(chunk_pos,
-                                                      cpg_table.pos.values,
-                                                      cpg_table.value.values)
-                        nan = np.isnan(state)
-                        state[nan] = dat.CPG_NAN
-                        dist[nan] = dat.CPG_NAN
-                        # States can be binary (np.int8) or continuous
-                        # (np.float32).
-                        state = state.astype(cpg_table.value.dtype, copy=False)
-                        dist = dist.astype(np.float32, copy=False)
-
-                        assert len(state) == len(chunk_pos)
-                        assert len(dist) == len(chunk_pos)
-                        assert np.all((dist > 0) | (dist == dat.CPG_NAN))
-
+                        create_cpg_dataset(out_group, 'cpg/%s' % name,
+                                           value.round().astype(np.int8),
+                                           opts.storage, opts.compact_cpg)
+                # Compute and write statistics
+                if cpg_stats_meta is not None:
+                    log.info('Computing per CpG statistics ...')
+                    chunk_stats, nb_cell = stats.cpg_stats(
+                        chunk_outputs['cpg_mat'], list(cpg_stats_meta.keys()))
+                    mask = nb_cell < opts.cpg_stats_cov
+                    for name, fun in six.iteritems(cpg_stats_meta):
+                        stat = np.where(mask, dat.CPG_NAN, chunk_stats[name])
+                        stat = stat.astype(fun[1])
+                        assert len(stat) == len(chunk_pos)
+                        create_cpg_dataset(out_group, 'cpg_stats/%s' % name,
+                                           stat, opts.storage)
+
+            # Write input features
+            in_group = chunk_file.create_group('inputs')
+
+            # DNA windows
+            if chromo_dna is not None:
+                log.info('Extracting DNA sequence windows ...')
+                dna_wins = chromo_dna(chunk_pos)
+                assert len(dna_wins) == len(chunk_pos)
+                hdf.create_dataset(in_group, 'dna', dna_wins, dtype=np.int8,
+                                   profile=opts.storage)
+            elif opts.dna_ref:
+                # Windows are read from the genome store by `DataReader`
+                in_group.attrs['dna_store'] = \
+                    os.path.abspath(opts.dna_files[0])
+                in_group.attrs['dna_wlen'] = opts.dna_wlen
+
+            # Mean states of cells in windows for computing window-based
+            # statistics. Cells are ordered by name.
+            win_means = None
+            if win_stats_meta is not None and opts.cpg_wlen:
+                win_shape = (len(opts.win_stats_wlen), len(chunk_pos),
+                             len(cpg_names))
+                win_means = np.zeros(win_shape)
+                win_valid = np.zeros(win_shape, dtype=bool)
+                win_cells = sorted(cpg_names)
+
+            # CpG neighbors
+            if opts.cpg_wlen:
+                log.info('Extracting CpG neighbors ...')
+                cpg_ext = fext.KnnCpgFeatureExtractor(opts.cpg_wlen // 2)
+                context_group = in_group.create_group('cpg')
+                states = []
+                dists = []
+                # outputs['cpg'], since neighboring CpG sites might lie
+                # outside chunk borders and un-mapped values are needed
+                for i, (name, cpg_table) in \
+                        enumerate(six.iteritems(outputs['cpg'])):
+                    cpg_pos, cpg_value = cpg_table.get(chromo)
+                    state, dist = cpg_ext.extract(chunk_pos, cpg_pos,
+                                                  cpg_value)
+                    nan = np.isnan(state)
+                    state[nan] = dat.CPG_NAN
+                    dist[nan] = dat.CPG_NAN
+                    # States can be binary (np.int8) or continuous
+                    # (np.float32).
+                    state = state.astype(cpg_table.dtype, copy=False)
+                    dist = dist.astype(np.float32, copy=False)
+
+                    assert len(state) == len(chunk_pos)
+                    assert len(dist) == len(chunk_pos)
+                    assert np.all((dist > 0) | (dist == dat.CPG_NAN))
+
+                    if opts.layout > 1:
+                        states.append(state)
+                        dists.append(dist)
+                    else:
                         group = context_group.create_group(name)
-                        group.create_dataset('state', data=state,
-                                             compression='gzip')
-                        group.create_dataset('dist', data=dist,
-                                             compression='gzip')
-
-                if win_stats_meta is not None and opts.cpg_wlen:
-                    log.info('Computing window-based statistics ...')
-                    states = []
-                    dists = []
-                    cpg_states = []
-                    cpg_group = out_group['cpg']
-                    context_group = in_group['cpg']
-                    for output_name in six.iterkeys(cpg_group):
-                        state = context_group[output_name]['state'].value
-                        states.append(np.expand_dims(state, 2))
-                        dist = context_group[output_name]['dist'].value
-                        dists.append(np.expand_dims(dist, 2))
-                        cpg_states.append(cpg_group[output_name].value)
-                    # samples x outputs x cpg_wlen
-                    states = np.swapaxes(np.concatenate(states, axis=2), 1, 2)
-                    dists = np.swapaxes(np.concatenate(dists, axis=2), 1, 2)
-                    cpg_states = np.expand_dims(np.vstack(cpg_states).T, 2)
-                    cpg_dists = np.zeros_like(cpg_states)
-                    states = np.concatenate([states, cpg_states], axis=2)
-                    dists = np.concatenate([dists, cpg_dists], axis=2)
-
-                    for wlen in opts.win_stats_wlen:
-                        idx = (states == dat.CPG_NAN) | (dists > wlen // 2)
-                        states_wlen = np.ma.masked_array(states, idx)
-                        group = out_group.create_group('win_stats/%d' % wlen)
-                        for name, fun in six.iteritems(win_stats_meta):
-                            stat = fun[0](states_wlen)
-                            if hasattr(stat, 'mask'):
-                                idx = stat.mask
-                                stat = stat.data
-                                if np.sum(idx):
-                                    stat[idx] = dat.CPG_NAN
-                            group.create_dataset(name, data=stat, dtype=fun[1],
-                                                 compression='gzip')
-
-                if annos:
-                    log.info('Adding annotations ...')
-                    group = in_group.create_group('annos')
-                    for name, anno in six.iteritems(annos):
-                        group.create_dataset(name, data=anno[chunk_idx],
-                                             dtype='int8',
-                                             compression='gzip')
-
-                chunk_file.close()
-
-        log.info('Done!')
-        return 0
+                        create_cpg_dataset(group, 'state', state,
+                                           opts.storage, opts.compact_cpg)
+                        create_cpg_dataset(group, 'dist', dist,
+                                           opts.storage, opts.compact_cpg,
+                                           dist=True)
+
+                    if win_means is not None:
+                        # States of sites themselves as written to outputs
+                        center = chunk_outputs['cpg_mat'][:, i].round()
+                        means, counts = stats.window_means(
+                            state, dist, opts.win_stats_wlen,
+                            center=center.astype(np.int8))
+                        j = win_cells.index(name)
+                        win_means[:, :, j] = means
+                        win_valid[:, :, j] = counts > 0
+
+                if opts.layout > 1:
+                    # States of all cells have the same type, which is
+                    # float32 if any cell has continuous states.
+                    for kind, values in [('state', states), ('dist', dists)]:
+                        dataset = create_cpg_dataset(
+                            context_group, kind, np.stack(values, axis=1),
+                            opts.storage, opts.compact_cpg,
+                            dist=kind == 'dist')
+                        hdf.set_names(dataset, list(outputs['cpg'].keys()))
+
+            if win_means is not None:
+                log.info('Computing window-based statistics ...')
+                for wlen, means, valid in zip(opts.win_stats_wlen, win_means,
+                                              win_valid):
+                    win_stats = stats.reduce_cells(means, valid,
+                                                   list(win_stats_meta.keys()))
+                    has_data = valid.any(axis=1)
+                    group = out_group.create_group('win_stats/%d' % wlen)
+                    for name, fun in six.iteritems(win_stats_meta):
+                        stat = np.where(has_data, win_stats[name],
+                                        dat.CPG_NAN)
+                        create_cpg_dataset(group, name, stat.astype(fun[1]),
+                                           opts.storage)
+
+            if annos:
+                log.info('Adding annotations ...')
+                group = in_group.create_group('annos')
+                for name in opts.anno_features:
+                    anno = annos[ANNO_FEATURES[name]][chunk_idx]
+                    # Membership is stored at the top level of `annos`
+                    name_group = group
+                    if name != 'is_in':
+                        name_group = group.create_group(name)
+                    for i, track in enumerate(self.anno_index.names):
+                        hdf.create_dataset(name_group, track, anno[:, i],
+                                           profile=opts.storage)
+
+            chunk_file.close()
+
+        return filenames
 
 
 if __name__ == '__main__':
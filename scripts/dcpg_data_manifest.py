@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""Build manifests and range indices of data directories.
+
+Describes the data files of directories created by ``dcpg_data.py`` in a
+manifest file ``manifest.json``, such that the number of samples, dataset
+names, or window lengths can be obtained without opening data files, and
+indexes the positions of sites in ``range_index.npz``, such that sites in
+genomic regions can be read without scanning all files. ``dcpg_data.py``
+writes both files itself. This script builds them for directories created by
+older versions, or updates them after data files have been added, removed, or
+modified.
+
+Examples
+--------
+Build the manifest of ``./data``:
+
+.. code:: bash
+
+    dcpg_data_manifest.py
+        ./data
+
+Check if the manifest and range index of ``./data`` are up to date:
+
+.. code:: bash
+
+    dcpg_data_manifest.py
+        ./data
+        --check
+
+See Also
+--------
+* ``dcpg_data.py``: For creating DeepCpG data files.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import sys
+
+import argparse
+import logging
+
+from deepcpg.data import manifest as mf
+from deepcpg.data import range_index as ri
+
+
+class App(object):
+
+    def run(self, args):
+        name = os.path.basename(args[0])
+        parser = self.create_parser(name)
+        opts = parser.parse_args(args[1:])
+        return self.main(name, opts)
+
+    def create_parser(self, name):
+        p = argparse.ArgumentParser(
+            prog=name,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Builds manifests and range indices of data'
+            ' directories.')
+        p.add_argument(
+            'data_dirs',
+            nargs='+',
+            help='Data directories')
+        p.add_argument(
+            '--check',
+            help='Only report data files whose manifest entries are missing'
+            ' or outdated, and outdated range indices',
+            action='store_true')
+        p.add_argument(
+            '--verbose',
+            help='More detailed log messages',
+            action='store_true')
+        p.add_argument(
+            '--log_file',
+            help='Write log messages to file')
+        return p
+
+    def main(self, name, opts):
+        logging.basicConfig(filename=opts.log_file,
+                            format='%(levelname)s (%(asctime)s): %(message)s')
+        log = logging.getLogger(name)
+        if opts.verbose:
+            log.setLevel(logging.DEBUG)
+        else:
+            log.setLevel(logging.INFO)
+        log.debug(opts)
+
+        nb_stale = 0
+        nb_error = 0
+        for data_dir in opts.data_dirs:
+            log.info(data_dir)
+            manifest = mf.Manifest.load(data_dir)
+            if opts.check:
+                if manifest is None:
+                    log.info('No manifest!')
+                    nb_stale += 1
+                    continue
+                stale = manifest.check()
+                for filename in stale:
+                    log.info('Outdated: %s' % filename)
+                nb_stale += len(stale)
+                if not ri.is_index_current(data_dir):
+                    log.info('Outdated: %s' % ri.INDEX_FILE)
+                    nb_stale += 1
+                continue
+
+            if manifest is None:
+                manifest = mf.Manifest(data_dir)
+            stale = manifest.check()
+            data_files = [os.path.join(data_dir, filename)
+                          for filename in stale]
+            manifest.remove(data_files)
+            manifest.update([filename for filename in data_files
+                             if os.path.isfile(filename)])
+            manifest.save()
+            log.info('%d files (%d updated or removed)' % (len(manifest),
+                                                         len(stale)))
+            if stale or not ri.is_index_current(data_dir):
+                log.info('Writing range index ...')
+                try:
+                    index = ri.RangeIndex.build(mf.find_data_files(data_dir))
+                except ValueError as err:
+                    # E.g. overlapping files of different runs
+                    log.error(str(err))
+                    nb_error += 1
+                    continue
+                index.save(data_dir)
+
+        log.info('Done!')
+        return int(nb_stale > 0 or nb_error > 0)
+
+
+if __name__ == '__main__':
+    app = App()
+    sys.exit(app.run(sys.argv))
@@ -4,7 +4,8 @@
 
 Shows the content of ``dcpg_data.py`` output files for a selected region, for
 example the methylation state of the target CpG site, neighboring CpG sites, or
-the DNA sequence.
+the DNA sequence. Only the rows of sites in the region are read, which are
+looked up in the range index of the data directory.
 
 Examples
 --------
@@ -60,9 +61,11 @@ import sys
 import argparse
 import h5py as h5
 import logging
-import numpy.random
+import numpy as np
 import pandas as pd
 
+from deepcpg import data as dat
+from deepcpg.data import genome
 from deepcpg.data import hdf
 
 
@@ -151,35 +154,67 @@ class App(object):
         if opts.cpg_wlen and opts.cpg_wlen % 2 == 1:
             raise ValueError('CpG window length must be even!')
 
+        if opts.chromo or opts.start or opts.end:
+            # Select rows of sites in region from range index
+            index = dat.get_range_index(opts.data_files)
+            chromos = [opts.chromo] if opts.chromo else index.chromos
+            slabs = index.query(chromos, opts.start or 0,
+                                opts.end or np.iinfo(np.int32).max)
+        else:
+            slabs = [(filename, 0, dat.get_nb_sample([filename]))
+                     for filename in opts.data_files]
+
+        if not slabs:
+            log.info('No data in selected region!')
+            return 0
+
         data = []
-        for filename in opts.data_files:
+        for filename, row_start, row_end in slabs:
             data_file = h5.File(filename, 'r')
+            rows = slice(row_start, row_end)
+
+            def read(name):
+                dataset, column = hdf.resolve(data_file, name)
+                value = dataset[rows]
+                if column is not None:
+                    value = value[:, column]
+                return value
+
             data_chunk = OrderedDict()
-            loc = pd.DataFrame({'chromo': data_file['chromo'].value,
-                                'pos': data_file['pos'].value},
+            loc = pd.DataFrame({'chromo': read('chromo'),
+                                'pos': read('pos')},
                                columns=['chromo', 'pos'])
             data_chunk['loc'] = loc
 
             if opts.outputs is not None:
-                group = data_file['outputs']
                 output_names = opts.outputs
                 if not len(output_names):
                     output_names = hdf.ls(filename, 'outputs', recursive=True)
                 outputs = []
                 for output_name in output_names:
-                    output = pd.Series(group[output_name].value,
+                    output = pd.Series(read('outputs/%s' % output_name),
                                        name=output_name)
                     outputs.append(output)
                 outputs = pd.concat(outputs, axis=1)
                 data_chunk['outputs'] = outputs
 
             if opts.dna_wlen:
-                group = data_file['/inputs/dna']
-                wlen = group.shape[1]
                 delta = opts.dna_wlen // 2
-                ctr = wlen // 2
-                idx = slice(ctr - delta, ctr + delta + 1)
-                dna = group[:, idx]
+                dna_store = dat.get_dna_store(filename)
+                if dna_store:
+                    # Windows are read from genome store
+                    store = genome.GenomeStore(dna_store)
+                    chromo = loc['chromo'].values
+                    dna = np.empty((len(loc), opts.dna_wlen), dtype=np.int8)
+                    for chromo_name in np.unique(chromo):
+                        idx = chromo == chromo_name
+                        dna[idx] = store.windows(chromo_name.decode(),
+                                                 loc['pos'].values[idx],
+                                                 opts.dna_wlen)
+                else:
+                    dna = read('inputs/dna')
+                    ctr = dna.shape[1] // 2
+                    dna = dna[:, (ctr - delta):(ctr + delta + 1)]
                 dna = pd.DataFrame(dna, columns=delta_columns(delta))
                 data_chunk['dna'] = dna
 
@@ -188,34 +223,28 @@ class App(object):
                 if opts.cpg_dist:
                     kinds.append('dist')
 
-                group = data_file['/inputs/cpg']
+                cpg_fmt = 'inputs/cpg/{0}/{1}'
+                if dat.get_layout(filename) > 1:
+                    cpg_fmt = 'inputs/cpg/{1}/{0}'
                 names = opts.cpg
                 if not len(names):
-                    names = list(group.keys())
+                    names = dat.get_replicate_names(filename)
                 for name in names:
                     for kind in kinds:
-                        path = '%s/%s' % (name, kind)
-                        cpg = group[path].value
+                        cpg = read(cpg_fmt.format(name, kind))
+                        ctr = cpg.shape[1] // 2
+                        delta = ctr
                         if opts.cpg_wlen:
-                            ctr = cpg.shape[1] // 2
                             delta = opts.cpg_wlen // 2
                             cpg = cpg[:, (ctr - delta):(ctr + delta)]
                         columns = delta_columns(delta, zero=False)
                         cpg = pd.DataFrame(cpg, columns=columns)
-                        data_chunk[path] = cpg
+                        data_chunk['%s/%s' % (name, kind)] = cpg
 
+            data_file.close()
             data_chunk = pd.concat(data_chunk.values(),
                                    axis=1,
                                    keys=data_chunk.keys())
-            if opts.chromo:
-                idx = data_chunk['loc']['chromo'] == opts.chromo.encode()
-                data_chunk = data_chunk.loc[idx]
-            if opts.start:
-                idx = data_chunk['loc']['pos'] >= opts.start
-                data_chunk = data_chunk.loc[idx]
-            if opts.end:
-                idx = data_chunk['loc']['pos'] <= opts.end
-                data_chunk = data_chunk.loc[idx]
             data.append(data_chunk)
 
         data = pd.concat(data)
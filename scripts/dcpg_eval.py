@@ -23,6 +23,16 @@ Examples
         --model_files ./model
         --out_data ./eval/data.h5
         --out_report ./eval/report.tsv
+
+Evaluate model only on CpG sites in regions of a BED file:
+
+.. code:: bash
+
+    dcpg_eval.py
+        ./data/*.h5
+        --model_files ./model
+        --regions ./cgi.bed
+        --out_report ./eval/report_cgi.tsv
 """
 
 from __future__ import print_function
@@ -48,20 +58,23 @@ from deepcpg.utils import ProgressBar, to_list
 
 class H5Writer(object):
 
-    def __init__(self, filename, nb_sample):
+    def __init__(self, filename, nb_sample, profile=None):
         self.out_file = h5.File(filename, 'w')
         self.nb_sample = nb_sample
+        self.profile = hdf.get_storage_profile(profile)
         self.idx = 0
 
-    def __call__(self, name, data, dtype=None, compression='gzip', stay=False):
+    def __call__(self, name, data, dtype=None, profile=None, stay=False):
         if name not in self.out_file:
             if dtype is None:
                 dtype = data.dtype
-            self.out_file.create_dataset(
-                name=name,
+            if profile is None:
+                profile = self.profile
+            hdf.create_dataset(
+                self.out_file, name,
                 shape=[self.nb_sample] + list(data.shape[1:]),
                 dtype=dtype,
-                compression=compression
+                profile=profile
             )
         self.out_file[name][self.idx:(self.idx + len(data))] = data
         if not stay:
@@ -122,6 +135,9 @@ class App(object):
             '--nb_replicate',
             type=int,
             help='Maximum number of replicates')
+        p.add_argument(
+            '--regions',
+            help='Only evaluate CpG sites in regions of BED file')
         p.add_argument(
             '--eval_size',
             help='Maximum number of samples that are kept in memory for'
@@ -142,6 +158,10 @@ class App(object):
             '--nb_sample',
             help='Number of samples',
             type=int)
+        p.add_argument(
+            '--storage',
+            help='Storage profile of output datasets. See `dcpg_data.py`.',
+            default='default')
         p.add_argument(
             '--verbose',
             help='More detailed log messages',
@@ -168,6 +188,14 @@ class App(object):
 
         log.info('Loading data ...')
         nb_sample = dat.get_nb_sample(opts.data_files, opts.nb_sample)
+        regions = None
+        if opts.regions:
+            # Sites in regions are looked up in the range index
+            regions = dat.read_regions(opts.regions)
+            rows = dat.get_region_rows(opts.data_files, regions)
+            nb_sample = min(nb_sample,
+                            sum([len(value) for value in rows.values()]))
+            log.info('%d samples in regions' % nb_sample)
         replicate_names = dat.get_replicate_names(
             opts.data_files[0],
             regex=opts.replicate_names,
@@ -183,16 +211,18 @@ class App(object):
         data_reader = data_reader(opts.data_files,
                                   nb_sample=nb_sample,
                                   batch_size=opts.batch_size,
-                                  loop=False, shuffle=False)
+                                  loop=False, shuffle=False,
+                                  regions=regions)
 
         meta_reader = hdf.reader(opts.data_files, ['chromo', 'pos'],
                                  nb_sample=nb_sample,
                                  batch_size=opts.batch_size,
-                                 loop=False, shuffle=False)
+                                 loop=False, shuffle=False,
+                                 regions=regions)
 
         writer = None
         if opts.out_data:
-            writer = H5Writer(opts.out_data, nb_sample)
+            writer = H5Writer(opts.out_data, nb_sample, opts.storage)
 
         log.info('Predicting ...')
         nb_tot = 0
@@ -122,6 +122,10 @@ class App(object):
             help='Seed of random number generator',
             type=int,
             default=0)
+        g.add_argument(
+            '--storage',
+            help='Storage profile of output datasets. See `dcpg_data.py`.',
+            default='default')
         g.add_argument(
             '--verbose',
             help='More detailed log messages',
@@ -195,15 +199,15 @@ class App(object):
         out_group['weights/weights'] = weights[0]
         out_group['weights/bias'] = weights[1]
 
-        def h5_dump(path, data, idx, dtype=None, compression='gzip'):
+        def h5_dump(path, data, idx, dtype=None):
             if path not in out_group:
                 if dtype is None:
                     dtype = data.dtype
-                out_group.create_dataset(
-                    name=path,
+                hdf.create_dataset(
+                    out_group, path,
                     shape=[nb_sample] + list(data.shape[1:]),
                     dtype=dtype,
-                    compression=compression
+                    profile=opts.storage
                 )
             out_group[path][idx:idx+len(data)] = data
 
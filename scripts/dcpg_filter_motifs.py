@@ -152,14 +152,12 @@ def get_act_kmers(filter_act, filter_len, seqs, thr_per=0.5, thr_max=25000,
 
 
 def write_kmers(kmers, filename):
-    char_kmers = np.chararray(kmers.shape)
-    for _char, _int in six.iteritems(ALPHABET):
-        char_kmers[kmers == _int] = _char
+    char_kmers = dna.int_to_ascii(kmers)
 
     with open(filename, 'w') as fh:
         for i, kmer in enumerate(char_kmers):
             print('>%d' % i, file=fh)
-            print(kmer.tostring().decode(), file=fh)
+            print(kmer.tobytes().decode(), file=fh)
 
 
 def plot_filter_densities(densities, filename=None):
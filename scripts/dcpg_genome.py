@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""Convert FASTA files into a compact genome store.
+
+Encodes chromosome sequences once and writes them to a memory-mappable genome
+store, from which ``dcpg_data.py`` reads DNA sequence windows without parsing
+FASTA files on every run. Genome stores can either store one byte per base or
+four bases per byte with a bit-packed mask of 'N' nucleotides.
+
+Examples
+--------
+Convert the mm10 genome into a genome store in the same directory, which
+``dcpg_data.py --dna_files ./mm10`` will then use instead of FASTA files:
+
+.. code:: bash
+
+    dcpg_genome.py
+        ./mm10
+        --out_dir ./mm10
+
+Store chromosome 18 and 19 with 2 bits per base:
+
+.. code:: bash
+
+    dcpg_genome.py
+        ./mm10
+        --chromos 18 19
+        --encoding 2bit
+        --out_dir ./mm10_2bit
+
+See Also
+--------
+* ``dcpg_data.py``: For creating DeepCpG data files.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import sys
+
+import argparse
+import logging
+
+from deepcpg.data import genome
+
+
+class App(object):
+
+    def run(self, args):
+        name = os.path.basename(args[0])
+        parser = self.create_parser(name)
+        opts = parser.parse_args(args[1:])
+        return self.main(name, opts)
+
+    def create_parser(self, name):
+        p = argparse.ArgumentParser(
+            prog=name,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Converts FASTA files into a genome store.')
+        p.add_argument(
+            'dna_files',
+            nargs='+',
+            help='Directory or FASTA files')
+        p.add_argument(
+            '-o', '--out_dir',
+            help='Output directory of genome store',
+            default='.')
+        p.add_argument(
+            '--chromos',
+            nargs='+',
+            help='Chromosomes that are stored')
+        p.add_argument(
+            '--encoding',
+            choices=genome.ENCODINGS,
+            default='int8',
+            help='Store one byte per base (int8) or 2 bits per base (2bit)')
+        p.add_argument(
+            '--verbose',
+            help='More detailed log messages',
+            action='store_true')
+        p.add_argument(
+            '--log_file',
+            help='Write log messages to file')
+        return p
+
+    def main(self, name, opts):
+        logging.basicConfig(filename=opts.log_file,
+                            format='%(levelname)s (%(asctime)s): %(message)s')
+        log = logging.getLogger(name)
+        if opts.verbose:
+            log.setLevel(logging.DEBUG)
+        else:
+            log.setLevel(logging.INFO)
+        log.debug(opts)
+
+        log.info('Writing genome store ...')
+        chromos = genome.fasta_to_store(opts.dna_files, opts.out_dir,
+                                        chromos=opts.chromos,
+                                        encoding=opts.encoding)
+        store = genome.GenomeStore(opts.out_dir)
+        for chromo in chromos:
+            log.info('%s: %d bp' % (chromo, store.get_len(chromo)))
+        log.info('Done!')
+        return 0
+
+
+if __name__ == '__main__':
+    app = App()
+    app.run(sys.argv)
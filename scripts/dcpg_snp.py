@@ -113,6 +113,10 @@ class App(object):
             help='Seed of random number generator',
             type=int,
             default=0)
+        p.add_argument(
+            '--storage',
+            help='Storage profile of output datasets. See `dcpg_data.py`.',
+            default='default')
         p.add_argument(
             '--verbose',
             help='More detailed log messages',
@@ -193,15 +197,15 @@ class App(object):
         out_file = h5.File(opts.out_file, 'w')
         out_group = out_file
 
-        def h5_dump(path, data, idx, dtype=None, compression='gzip'):
+        def h5_dump(path, data, idx, dtype=None):
             if path not in out_group:
                 if dtype is None:
                     dtype = data.dtype
-                out_group.create_dataset(
-                    name=path,
+                hdf.create_dataset(
+                    out_group, path,
                     shape=[nb_sample] + list(data.shape[1:]),
                     dtype=dtype,
-                    compression=compression
+                    profile=opts.storage
                 )
             out_group[path][idx:idx+len(data)] = data
 
@@ -107,3 +107,93 @@ def test_group_overlapping():
     g = [0, 1, 1,  2,  2,  2,  3]
     a = annos.group_overlapping(s, e)
     npt.assert_array_equal(a, g)
+
+
+def _write_bed(filename, rows):
+    with open(filename, 'w') as f:
+        for row in rows:
+            f.write('%s\t%d\t%d\n' % row)
+
+
+def test_anno_track(tmpdir):
+    filename = str(tmpdir.join('anno.bed'))
+    _write_bed(filename, [('chr2', 5, 8), ('1', 1, 3), ('CHR2', 7, 10),
+                          ('chr1', 10, 12), ('2', 20, 21), ('X', 1, 1)])
+    track = annos.AnnoTrack.read(filename)
+    assert track.chromos == ['1', '2', 'X']
+    assert len(track) == 5
+    assert '2' in track
+    assert 'Y' not in track
+    start, end = track.get('2')
+    npt.assert_array_equal(start, [5, 20])
+    npt.assert_array_equal(end, [10, 21])
+    start, end = track.get('Y')
+    assert len(start) == 0
+
+    cache_file = str(tmpdir.join('anno.npz'))
+    track.save(cache_file)
+    loaded = annos.AnnoTrack.load(cache_file)
+    assert loaded.chromos == track.chromos
+    npt.assert_array_equal(loaded.offsets, track.offsets)
+    npt.assert_array_equal(loaded.start, track.start)
+    npt.assert_array_equal(loaded.end, track.end)
+
+
+def test_anno_index(tmpdir):
+    filenames = [str(tmpdir.join('a.bed')), str(tmpdir.join('b.bed'))]
+    _write_bed(filenames[0], [('chr1', 5, 8), ('chr1', 7, 10),
+                              ('chr2', 1, 2)])
+    _write_bed(filenames[1], [('chr1', 1, 1), ('chr3', 1, 5)])
+    cache_dir = str(tmpdir.join('cache'))
+    index = annos.AnnoIndex.read(filenames, names=['a', 'b'],
+                                 cache_dir=cache_dir)
+    assert index.names == ['a', 'b']
+    pos = np.array([1, 4, 5, 10, 12])
+    result = index.query('1', pos, ['is_in', 'distance'])
+    npt.assert_array_equal(result['is_in'],
+                           [[0, 1], [0, 0], [1, 0], [1, 0], [0, 0]])
+    npt.assert_array_equal(result['distance'],
+                           [[4, 0], [1, 3], [0, 4], [0, 9], [2, 11]])
+    result = index.query('2', pos, ['distance'])
+    assert list(result.keys()) == ['distance']
+    npt.assert_array_equal(result['distance'][:, 1], np.inf)
+
+    # Tracks are loaded from cache
+    cached = annos.AnnoIndex.read(filenames, names=['a', 'b'],
+                                  cache_dir=cache_dir)
+    assert len(tmpdir.join('cache').listdir()) == 2
+    for name in index.names:
+        npt.assert_array_equal(cached.tracks[name].start,
+                               index.tracks[name].start)
+    _write_bed(filenames[1], [('chr1', 2, 3)])
+    cached = annos.AnnoIndex.read(filenames, names=['a', 'b'],
+                                  cache_dir=cache_dir)
+    npt.assert_array_equal(cached.tracks['b'].start, [2])
+
+
+def test_anno_index_features(tmpdir):
+    filename = str(tmpdir.join('a.bed'))
+    _write_bed(filename, [('chr1', 5, 8), ('chr1', 20, 25), ('chr1', 30, 30)])
+    index = annos.AnnoIndex.read([filename])
+    pos = np.array([1, 6, 12, 13, 14, 27, 40])
+    result = index.query('1', pos, ['density', 'signed_distance', 'is_in'],
+                         radius=3)
+    assert list(result.keys()) == ['is_in', 'signed_distance', 'density']
+    assert result['signed_distance'].dtype == np.int32
+    npt.assert_array_equal(result['is_in'][:, 0], [0, 1, 0, 0, 0, 0, 0])
+    npt.assert_array_equal(result['signed_distance'][:, 0],
+                           [4, 0, -4, -5, -6, -2, -10])
+    npt.assert_array_equal(result['density'][:, 0], [0, 1, 0, 0, 0, 2, 0])
+
+    # Reference implementations
+    result = index.query('1', pos, annos.AnnoIndex.FEATURES, radius=3)
+    npt.assert_array_equal(np.abs(result['signed_distance'][:, 0]),
+                           result['distance'][:, 0])
+    start, end = index.tracks[filename].get('1')
+    npt.assert_array_equal(result['distance'][:, 0],
+                           annos.distance(pos, start, end))
+
+    result = index.query('2', pos, ['signed_distance', 'density'])
+    npt.assert_array_equal(result['signed_distance'],
+                           np.iinfo(np.int32).max)
+    npt.assert_array_equal(result['density'], 0)
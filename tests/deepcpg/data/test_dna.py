@@ -0,0 +1,67 @@
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from deepcpg.data import dna
+
+
+def test_char_to_int():
+    npt.assert_array_equal(dna.char_to_int('ATGCN'), [0, 1, 2, 3, 4])
+    npt.assert_array_equal(dna.char_to_int('atgcn'), [0, 1, 2, 3, 4])
+    npt.assert_array_equal(dna.char_to_int('ARYN'), [0, 4, 4, 4])
+    assert dna.char_to_int('') == []
+
+
+def test_ascii_to_int():
+    expect = np.array([3, 2, 0, 1, 4], dtype=np.int8)
+    for seq in ['CGATN', b'CGATN', bytearray(b'cgatn'),
+                np.frombuffer(b'CGATN', dtype=np.uint8),
+                np.array(list('CGATN'), dtype='S1')]:
+        actual = dna.ascii_to_int(seq)
+        assert actual.dtype == np.int8
+        npt.assert_array_equal(actual, expect)
+
+    out = np.empty(7, dtype=np.int8)
+    out.fill(-1)
+    dna.ascii_to_int('CGATN', out=out[1:-1])
+    npt.assert_array_equal(out, [-1, 3, 2, 0, 1, 4, -1])
+
+
+def test_int_to_char():
+    seq = 'ATGCNNCGTA'
+    assert dna.int_to_char(dna.char_to_int(seq)) == seq
+    assert dna.int_to_char([0, 3], join=False) == ['A', 'C']
+    ascii = dna.int_to_ascii(np.array([[0, 1], [2, 3]]))
+    npt.assert_array_equal(ascii, [[ord('A'), ord('T')], [ord('G'), ord('C')]])
+    for seq in [[0, -1], [5, 1], [0, 256]]:
+        with pytest.raises(ValueError):
+            dna.int_to_char(seq)
+        with pytest.raises(ValueError):
+            dna.int_to_ascii(np.array(seq))
+
+
+def test_int_to_onehot():
+    seqs = np.array([[0, 1, 2, 3, 4]], dtype=np.int8)
+    expect = np.array([[[1, 0, 0, 0],
+                        [0, 1, 0, 0],
+                        [0, 0, 1, 0],
+                        [0, 0, 0, 1],
+                        [0, 0, 0, 0]]])
+    actual = dna.int_to_onehot(seqs)
+    assert actual.dtype == np.int8
+    npt.assert_array_equal(actual, expect)
+    npt.assert_array_equal(dna.int_to_onehot(seqs[0]), expect)
+    npt.assert_array_equal(dna.onehot_to_int(actual)[:, :4], seqs[:, :4])
+
+    out = np.empty((1, 5, 4), dtype=np.int8)
+    dna.int_to_onehot(seqs, out=out)
+    npt.assert_array_equal(out, expect)
+
+    for seqs in [[[0, -1]], [[1, 5]], [[256, 0]], [[-256, 0]]]:
+        with pytest.raises(ValueError):
+            dna.int_to_onehot(np.array(seqs))
+    assert dna.int_to_onehot(np.zeros((0, 3), dtype=np.int8)).shape == \
+        (0, 3, 4)
@@ -0,0 +1,76 @@
+from __future__ import division
+from __future__ import print_function
+
+import gzip
+
+import numpy as np
+import numpy.testing as npt
+
+from deepcpg.data import dna, fasta
+
+
+class TestFasta(object):
+
+    def setup_method(self, method):
+        np.random.seed(0)
+        self.seqs = [('>1 chromosome 1', 'ACGTNacgtn' * 7 + 'AC'),
+                     ('>chrX', ''.join(np.random.choice(list('ACGTN'), 251))),
+                     ('>Y', 'CG')]
+
+    def _write(self, filename, width=10, compress=False):
+        fh = gzip.open(filename, 'wt') if compress else open(filename, 'w')
+        print('', file=fh)
+        for head, seq in self.seqs:
+            print(head, file=fh)
+            for i in range(0, len(seq), width):
+                print(seq[i:i + width], file=fh)
+        fh.close()
+        return filename
+
+    def _test_records(self, records):
+        assert [record.head for record in records] == \
+            [head for head, _ in self.seqs]
+        assert [record.seq for record in records] == \
+            [seq for _, seq in self.seqs]
+
+    def test_parse_lines(self):
+        lines = ['ACGT', '', '>1', 'AC ', ' GT', '>2', '', 'NN']
+        records = fasta.parse_lines(lines)
+        assert [record.head for record in records] == ['>1', '>2']
+        assert [record.seq for record in records] == ['ACGT', 'NN']
+
+    def test_iter_file(self, tmpdir):
+        for compress in [False, True]:
+            filename = self._write(str(tmpdir.join('seq.fa.gz' if compress
+                                                   else 'seq.fa')),
+                                   compress=compress)
+            self._test_records(fasta.read_file(filename))
+            for block_size in [1, 3, 11, 64]:
+                records = list(fasta.iter_file(filename,
+                                               block_size=block_size))
+                self._test_records(records)
+
+            records = list(fasta.iter_file(filename, encode=True,
+                                           select=lambda head: 'X' in head))
+            assert len(records) == 1
+            assert records[0].seq.dtype == np.int8
+            npt.assert_array_equal(records[0].seq,
+                                   dna.ascii_to_int(self.seqs[1][1]))
+
+    def test_fai(self, tmpdir):
+        filename = self._write(str(tmpdir.join('seq.fa')), width=7)
+        for name, (head, seq) in zip(['1', 'chrX', 'Y'], self.seqs):
+            # Without index
+            assert fasta.read_seq(filename, name) == seq
+        fai_filename = fasta.write_fai(filename)
+        assert fai_filename == filename + '.fai'
+        index = fasta.read_fai(fai_filename)
+        assert list(index.keys()) == ['1', 'chrX', 'Y']
+        assert index['1'][0] == 72
+        assert index['1'][2:] == (7, 8)
+        for name, (head, seq) in zip(['1', 'chrX', 'Y'], self.seqs):
+            for block_size in [1, 5, 1000]:
+                assert fasta.read_seq(filename, name,
+                                      block_size=block_size) == seq
+            npt.assert_array_equal(fasta.read_seq(filename, name, encode=True),
+                                   dna.ascii_to_int(seq))
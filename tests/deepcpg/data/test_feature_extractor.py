@@ -3,6 +3,7 @@ from __future__ import print_function
 
 import numpy as np
 import numpy.testing as npt
+import pytest
 import six
 
 from deepcpg.data import feature_extractor as fe
@@ -88,6 +89,38 @@ class TestKnnCpgFeatureExtractor(object):
         result = fe.KnnCpgFeatureExtractor(3).extract(x, y, ys)
         self._compare(result, expect)
 
+    def _extract_naive(self, x, y, ys, k):
+        cpg = np.empty((len(x), 2 * k))
+        cpg.fill(np.nan)
+        dist = cpg.copy()
+        for i, xi in enumerate(x):
+            left = np.nonzero(y < xi)[0][::-1][:k]
+            cpg[i, k - len(left):k] = ys[left[::-1]]
+            dist[i, k - len(left):k] = xi - y[left[::-1]]
+            right = np.nonzero(y > xi)[0][:k]
+            cpg[i, k:k + len(right)] = ys[right]
+            dist[i, k:k + len(right)] = y[right] - xi
+        return (cpg, dist)
+
+    def test_extract_random(self):
+        np.random.seed(0)
+        for k in [1, 2, 5, 10]:
+            x = np.sort(np.random.choice(1000, 200, replace=False))
+            y = np.sort(np.random.choice(x, 30, replace=False))
+            ys = np.random.binomial(1, 0.5, len(y))
+            expect = self._extract_naive(x, y, ys, k)
+            result = fe.KnnCpgFeatureExtractor(k).extract(x, y, ys)
+            npt.assert_array_equal(result[0], expect[0])
+            npt.assert_array_equal(result[1], expect[1])
+
+    def test_extract_empty(self):
+        ext = fe.KnnCpgFeatureExtractor(2)
+        state, dist = ext.extract(np.array([1, 5]), np.array([], dtype=int),
+                                  np.array([]))
+        assert state.shape == (2, 4)
+        assert np.all(np.isnan(state))
+        assert np.all(np.isnan(dist))
+
 
 class TestIntervalFeatureExtractor(object):
 
@@ -213,3 +246,55 @@ class TestKmersFeatureExtractor(object):
         actual = ext(seqs)
         assert actual.shape == (2, 4**4)
         npt.assert_array_equal(actual, expect)
+
+    def _count_loop(self, seqs, kmer_len):
+        kmer_freq = np.zeros((len(seqs), 4**kmer_len), dtype=np.int32)
+        for i, seq in enumerate(seqs):
+            for j in range(len(seq) - kmer_len + 1):
+                kmer = seq[j:(j + kmer_len)]
+                if np.all(kmer < 4):
+                    kmer_freq[i, self._kmer_idx(
+                        [dna.INT_TO_CHAR[c] for c in kmer])] += 1
+        return kmer_freq
+
+    def test_random(self):
+        np.random.seed(0)
+        seqs = np.random.randint(0, 5, (20, 30))
+        seqs[seqs == 4] = np.random.randint(0, 5, (seqs == 4).sum())
+        for kmer_len in [1, 2, 3, 5]:
+            expect = self._count_loop(seqs, kmer_len)
+            actual = fe.KmersFeatureExtractor(kmer_len)(seqs)
+            npt.assert_array_equal(actual, expect)
+            actual = fe.KmersFeatureExtractor(kmer_len, batch_size=50)(seqs)
+            npt.assert_array_equal(actual, expect)
+
+    def test_mask(self):
+        ext = fe.KmersFeatureExtractor(2)
+        seqs = self._translate_seqs(['AANAAT', 'NNNNNN'])
+        actual = ext(seqs)
+        expect = [self._freq({'AA': 2, 'AT': 1}), self._freq({'AA': 0})]
+        npt.assert_array_equal(actual, expect)
+
+        actual = fe.KmersFeatureExtractor(8)(seqs)
+        assert actual.shape == (2, 4**8)
+        assert actual.sum() == 0
+
+    def test_canonical(self):
+        ext = fe.KmersFeatureExtractor(2, canonical=True)
+        seqs = self._translate_seqs(['AAATTCG'])
+        actual = ext(seqs)
+        # AA and TT, AT, TC and GA, CG
+        expect = self._freq({'AA': 3, 'AT': 1, 'GA': 1, 'CG': 1})
+        npt.assert_array_equal(actual, [expect])
+
+        np.random.seed(0)
+        seqs = np.random.randint(0, 4, (10, 20))
+        actual = fe.KmersFeatureExtractor(3, canonical=True)(seqs)
+        freq = fe.KmersFeatureExtractor(3)(seqs)
+        npt.assert_array_equal(actual.sum(axis=1), freq.sum(axis=1))
+        rc_seqs = (seqs ^ 1)[:, ::-1]
+        npt.assert_array_equal(
+            fe.KmersFeatureExtractor(3, canonical=True)(rc_seqs), actual)
+
+        with pytest.raises(ValueError):
+            fe.KmersFeatureExtractor(2, nb_char=5, canonical=True)
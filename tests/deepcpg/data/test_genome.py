@@ -0,0 +1,133 @@
+from __future__ import division
+from __future__ import print_function
+
+import gzip
+import os
+
+import numpy as np
+import numpy.testing as npt
+
+from deepcpg.data import dna, fasta, genome
+
+
+def write_fasta(filename, head, seq, width=10):
+    with gzip.open(filename, 'wt') as f:
+        print('>%s' % head, file=f)
+        for i in range(0, len(seq), width):
+            print(seq[i:i + width], file=f)
+
+
+class TestGenomeStore(object):
+
+    def setup_method(self, method):
+        np.random.seed(0)
+        self.seqs = dict()
+        self.seqs['1'] = ''.join(np.random.choice(list('ACGTN'), 103))
+        self.seqs['X'] = 'NNACGTacgtCG'
+
+    def _write(self, dirname, encoding):
+        return genome.write_store(dirname,
+                                  [(chromo, self.seqs[chromo])
+                                   for chromo in sorted(self.seqs)],
+                                  encoding=encoding)
+
+    def test_pack_2bit(self):
+        seq = dna.ascii_to_int(self.seqs['1'])
+        packed, mask = genome.pack_2bit(seq)
+        assert len(packed) == 26
+        assert len(mask) == 13
+        for start, end in [(0, 103), (0, 1), (5, 6), (3, 17), (100, 103),
+                           (7, 7)]:
+            actual = genome.unpack_2bit(packed, mask, start, end)
+            npt.assert_array_equal(actual, seq[start:end])
+
+    def test_store(self, tmpdir):
+        for encoding in genome.ENCODINGS:
+            dirname = str(tmpdir.join(encoding))
+            assert self._write(dirname, encoding) == ['1', 'X']
+            assert genome.is_store(dirname)
+            store = genome.GenomeStore(dirname)
+            assert store.encoding == encoding
+            assert store.chromos == ['1', 'X']
+            assert 'X' in store
+            assert '2' not in store
+            for chromo, seq in self.seqs.items():
+                seq = dna.ascii_to_int(seq)
+                assert store.get_len(chromo) == len(seq)
+                npt.assert_array_equal(store.seq(chromo), seq)
+                npt.assert_array_equal(store.seq(chromo, 2, 9), seq[2:9])
+                npt.assert_array_equal(store.seq(chromo, -5, 5), seq[:5])
+                npt.assert_array_equal(store.seq(chromo, 8, 1000), seq[8:])
+
+    def test_windows(self, tmpdir):
+        pos = np.array([1, 2, 50, 103, 5, 98])
+        for encoding in genome.ENCODINGS:
+            dirname = str(tmpdir.join(encoding))
+            self._write(dirname, encoding)
+            store = genome.GenomeStore(dirname)
+            for chromo, seq in self.seqs.items():
+                seq = dna.ascii_to_int(seq)
+                chromo_pos = pos[pos <= len(seq)]
+                for wlen in [1, 4, 11]:
+                    delta = wlen // 2
+                    padded = np.empty(len(seq) + 2 * wlen, dtype=np.int8)
+                    padded.fill(dna.CHAR_TO_INT['N'])
+                    padded[wlen:wlen + len(seq)] = seq
+                    expect = [padded[p - 1 - delta + wlen:
+                                     p - 1 - delta + 2 * wlen]
+                              for p in chromo_pos]
+                    actual = store.windows(chromo, chromo_pos, wlen)
+                    assert actual.dtype == np.int8
+                    npt.assert_array_equal(actual, expect)
+
+    def test_sample_windows(self, tmpdir):
+        chromos = np.array([b'X', b'1', b'X', b'1', b'1'])
+        pos = np.array([1, 50, 12, 103, 2])
+        for encoding in genome.ENCODINGS:
+            dirname = str(tmpdir.join(encoding))
+            self._write(dirname, encoding)
+            store = genome.GenomeStore(dirname)
+            for wlen in [1, 11]:
+                expect = np.concatenate(
+                    [store.windows(chromo.decode(), [p], wlen)
+                     for chromo, p in zip(chromos, pos)])
+                known = expect != dna.CHAR_TO_INT['N']
+                assert np.any(~known)
+                actual = store.sample_windows(
+                    chromos, pos, wlen, np.random.RandomState(0))
+                assert actual.dtype == np.int8
+                assert actual.shape == (len(pos), wlen)
+                npt.assert_array_equal(actual[known], expect[known])
+                assert np.all((actual >= 0) & (actual < 4))
+                # Missing nucleotides are reproducible
+                npt.assert_array_equal(
+                    store.sample_windows(chromos.astype(str), pos, wlen,
+                                         np.random.RandomState(0)), actual)
+
+    def test_fasta(self, tmpdir):
+        dna_dir = str(tmpdir.join('dna'))
+        os.makedirs(dna_dir)
+        for chromo, seq in self.seqs.items():
+            write_fasta(os.path.join(dna_dir,
+                                     'mm10.dna.chromosome.%s.fa.gz' % chromo),
+                        'chr%s description' % chromo.lower(), seq)
+
+        # Read from FASTA files without store
+        assert fasta.read_chromo(dna_dir, 'X') == self.seqs['X']
+
+        chromos = genome.fasta_to_store(dna_dir, dna_dir, chromos=['X'])
+        assert chromos == ['X']
+        assert fasta.select_file_by_chromo(dna_dir, 'X') == dna_dir
+        assert fasta.select_file_by_chromo(dna_dir, '1').endswith('1.fa.gz')
+        assert fasta.read_chromo(dna_dir, 'X') == self.seqs['X'].upper()
+        npt.assert_array_equal(fasta.read_chromo(dna_dir, 'X', encode=True),
+                               dna.ascii_to_int(self.seqs['X']))
+        npt.assert_array_equal(fasta.read_chromo(dna_dir, '1', encode=True),
+                               dna.ascii_to_int(self.seqs['1']))
+
+        # Chromosome names are formatted as FASTA headers
+        for chromos in [['chrx'], ['x'], 'chrX']:
+            dirname = str(tmpdir.join('store'))
+            assert genome.fasta_to_store(dna_dir, dirname,
+                                         chromos=chromos) == ['X']
+            assert genome.GenomeStore(dirname).chromos == ['X']
@@ -7,6 +7,7 @@ import os
 import h5py as h5
 import numpy as np
 from numpy import testing as npt
+import pytest
 import six
 from six.moves import range
 
@@ -32,6 +33,76 @@ def test_hnames_to_names():
     assert names == ['a/a1', 'b/b1', 'b/b2', 'c']
 
 
+def test_matrix(tmpdir):
+    filename = str(tmpdir.join('data.h5'))
+    cells = np.arange(20).reshape(10, 2)
+    with h5.File(filename, 'w') as data_file:
+        data_file['pos'] = np.arange(10)
+        data_file.create_dataset('outputs/cpg', data=cells)
+        hdf.set_names(data_file['outputs/cpg'], ['c1', 'c2'])
+        data_file['outputs/stats'] = np.arange(10) * 2
+
+    with h5.File(filename, 'r') as data_file:
+        assert hdf.get_names(data_file['outputs/cpg']) == ['c1', 'c2']
+        assert hdf.get_names(data_file['pos']) is None
+        dataset, column = hdf.resolve(data_file, 'outputs/cpg/c2')
+        assert dataset.name == '/outputs/cpg'
+        assert column == 1
+        dataset, column = hdf.resolve(data_file, 'pos')
+        assert column is None
+        for name in ['outputs/cpg/c3', 'outputs/stats/c1', 'outputs/pos']:
+            with pytest.raises(ValueError):
+                hdf.resolve(data_file, name)
+
+    assert hdf.ls(filename, 'outputs', recursive=True) == \
+        ['cpg/c1', 'cpg/c2', 'stats']
+    names = ['outputs/cpg/c2', 'pos', 'outputs/cpg/c1']
+    for shuffle in [False, True]:
+        data = hdf.read(filename, names, batch_size=3, shuffle=shuffle)
+        npt.assert_array_equal(data['outputs/cpg/c1'], data['pos'] * 2)
+        npt.assert_array_equal(data['outputs/cpg/c2'], data['pos'] * 2 + 1)
+
+
+def test_storage_profile(tmpdir):
+    profile = hdf.StorageProfile.parse('gzip:6,shuffle,chunk_rows=256')
+    assert profile.compression == 'gzip'
+    assert profile.level == 6
+    assert profile.shuffle
+    assert profile.chunk_rows == 256
+    assert profile.get_kwargs((1000, 501)) == {
+        'compression': 'gzip', 'compression_opts': 6, 'shuffle': True,
+        'chunks': (256, 501)}
+    assert profile.get_kwargs((100,))['chunks'] == (100,)
+    assert profile.get_kwargs((1000, 2), 4)['chunks'] == (64, 2)
+    assert 'chunks' not in profile.get_kwargs((0,))
+
+    assert hdf.get_storage_profile().get_kwargs((10,)) == \
+        {'compression': 'gzip'}
+    assert hdf.get_storage_profile('none').get_kwargs((10,)) == dict()
+    assert hdf.get_storage_profile(profile) is profile
+    for spec in ['bz2', 'lzf:4', 'gzip,chunks=10', 'gzip,chunk_rows']:
+        with pytest.raises(ValueError):
+            hdf.StorageProfile.parse(spec)
+
+    filename = str(tmpdir.join('data.h5'))
+    data = np.random.randint(0, 4, (1000, 11)).astype(np.int8)
+    with h5.File(filename, 'w') as data_file:
+        dataset = hdf.create_dataset(data_file, 'x', data, profile='fast')
+        assert dataset.compression == 'lzf'
+        assert dataset.chunks == (1000, 11)
+        dataset = hdf.create_dataset(data_file, 'y', shape=(1000, 3),
+                                     dtype=np.float32, profile='small',
+                                     chunks=(128, 3))
+        assert dataset.compression_opts == 9
+        assert dataset.chunks == (128, 3)
+        dataset[:] = 1
+        dataset = hdf.create_dataset(data_file, 'z', data, dtype=np.int16,
+                                     profile='none')
+        assert dataset.dtype == np.int16
+        assert dataset.compression is None
+    npt.assert_array_equal(hdf.read(filename, ['x'])['x'], data)
+
+
 class TestReader(object):
 
     def setup(self):
@@ -0,0 +1,158 @@
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import numpy.testing as npt
+
+from deepcpg.data import intervals
+
+
+def _in_which_naive(x, ys, ye):
+    rv = np.empty(len(x), dtype=np.int64)
+    rv.fill(-1)
+    i = 0
+    j = 0
+    while i < len(ys) and j < len(x):
+        while j < len(x) and x[j] <= ye[i]:
+            if x[j] >= ys[i]:
+                rv[j] = i
+            j += 1
+        i += 1
+    return rv
+
+
+def _distance_naive(pos, start, end):
+    i = 0
+    j = 0
+    end_prev = -10**7
+    dist = np.zeros(len(pos))
+    while i < len(start) and j < len(pos):
+        while j < len(pos) and pos[j] <= end[i]:
+            if pos[j] < start[i]:
+                dist[j] = min(pos[j] - end_prev, start[i] - pos[j])
+            j += 1
+        end_prev = end[i]
+        i += 1
+    dist[j:] = pos[j:] - end_prev
+    return dist
+
+
+def _merge_naive(s, e):
+    rs = []
+    re = []
+    if len(s) == 0:
+        return (rs, re)
+    l = s[0]
+    r = e[0]
+    for i in range(1, len(s)):
+        if s[i] > r:
+            rs.append(l)
+            re.append(r)
+            l = s[i]
+            r = e[i]
+        else:
+            r = max(r, e[i])
+    rs.append(l)
+    re.append(r)
+    return (rs, re)
+
+
+def _group_naive(s, e):
+    group = np.zeros(len(s), dtype='int32')
+    if len(s) == 0:
+        return group
+    idx = 0
+    r = e[0]
+    for i in range(1, len(s)):
+        if s[i] > r:
+            idx += 1
+            r = e[i]
+        else:
+            r = max(r, e[i])
+        group[i] = idx
+    return group
+
+
+def _random_intervals(nb_interval, max_pos=10000, max_len=100):
+    start = np.sort(np.random.randint(1, max_pos, nb_interval))
+    end = start + np.random.randint(0, max_len, nb_interval)
+    return (start, end)
+
+
+def test_merge_group():
+    np.random.seed(0)
+    for nb_interval in [0, 1, 10, 500]:
+        start, end = _random_intervals(nb_interval)
+        expect = _merge_naive(start, end)
+        actual = intervals.merge(start, end)
+        npt.assert_array_equal(actual[0], expect[0])
+        npt.assert_array_equal(actual[1], expect[1])
+        npt.assert_array_equal(intervals.group(start, end),
+                               _group_naive(start, end))
+
+
+def test_index_distance():
+    np.random.seed(0)
+    for nb_interval in [1, 10, 500]:
+        start, end = intervals.merge(*_random_intervals(nb_interval))
+        pos = np.sort(np.random.randint(-10, 10200, 1000))
+        npt.assert_array_equal(intervals.index(pos, start, end),
+                               _in_which_naive(pos, start, end))
+        npt.assert_array_equal(intervals.is_in(pos, start, end),
+                               _in_which_naive(pos, start, end) >= 0)
+        npt.assert_array_equal(intervals.distance(pos, start, end),
+                               _distance_naive(pos, start, end))
+
+    dist = intervals.distance([1, 5], [], [])
+    assert np.all(np.isinf(dist))
+
+
+def test_unsorted():
+    start = np.array([10, 1, 5])
+    end = np.array([12, 3, 5])
+    npt.assert_array_equal(intervals.index([2, 5, 11, 13], start, end),
+                           [1, 2, 0, -1])
+    npt.assert_array_equal(intervals.group(start, end), [2, 0, 1])
+    npt.assert_array_equal(intervals.distance([4, 7, 20], start, end),
+                           [1, 2, 8])
+
+
+def test_chromos():
+    np.random.seed(0)
+    chromos = np.array(['1', '10', '2', 'X'])
+    starts = []
+    ends = []
+    for chromo in chromos:
+        start, end = _random_intervals(50)
+        starts.append(start)
+        ends.append(end)
+    chromo = np.repeat(chromos, 50)
+    order = np.random.permutation(len(chromo))
+    start = np.concatenate(starts)[order]
+    end = np.concatenate(ends)[order]
+    chromo = chromo[order]
+
+    merged = intervals.merge(start, end, chromo)
+    pos = np.sort(np.random.randint(1, 10100, 300))
+    for i, name in enumerate(chromos):
+        idx = merged[0] == name
+        expect = _merge_naive(starts[i], ends[i])
+        npt.assert_array_equal(merged[1][idx], expect[0])
+        npt.assert_array_equal(merged[2][idx], expect[1])
+
+        pos_chromo = np.repeat(name, len(pos))
+        expect_idx = _in_which_naive(pos, *expect)
+        actual_idx = intervals.index(pos, merged[1], merged[2],
+                                     pos_chromo, merged[0])
+        assert np.all(merged[0][actual_idx[actual_idx >= 0]] == name)
+        npt.assert_array_equal(actual_idx >= 0, expect_idx >= 0)
+        npt.assert_array_equal(
+            intervals.distance(pos, merged[1], merged[2], pos_chromo,
+                               merged[0]),
+            _distance_naive(pos, *expect))
+
+    groups = intervals.group(start, end, chromo)
+    npt.assert_array_equal(np.unique(groups), np.arange(len(merged[0])))
+
+    dist = intervals.distance([1, 5], [1], [3], ['1', 'Y'], ['1'])
+    npt.assert_array_equal(dist, [0, np.inf])
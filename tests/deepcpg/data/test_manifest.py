@@ -0,0 +1,124 @@
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import h5py as h5
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from deepcpg.data import hdf
+from deepcpg.data import manifest as mf
+from deepcpg.data import utils
+
+
+def write_data_file(filename, chromos, pos, layout=1):
+    with h5.File(filename, 'w') as data_file:
+        if layout > 1:
+            data_file.attrs['layout'] = layout
+        data_file['chromo'] = np.array([chromo.encode() for chromo in chromos])
+        data_file['pos'] = np.asarray(pos, dtype=np.int32)
+        nb_sample = len(pos)
+        data_file['inputs/dna'] = np.zeros((nb_sample, 11), dtype=np.int8)
+        if layout > 1:
+            for kind in ['state', 'dist']:
+                dataset = hdf.create_dataset(
+                    data_file, 'inputs/cpg/%s' % kind,
+                    np.zeros((nb_sample, 2, 4), dtype=np.int8))
+                hdf.set_names(dataset, ['c1', 'c2'])
+            dataset = hdf.create_dataset(
+                data_file, 'outputs/cpg', np.zeros((nb_sample, 2)),
+                encoding='2bit')
+            hdf.set_names(dataset, ['c1', 'c2'])
+        else:
+            for cell in ['c1', 'c2']:
+                for kind in ['state', 'dist']:
+                    data_file['inputs/cpg/%s/%s' % (cell, kind)] = \
+                        np.zeros((nb_sample, 4), dtype=np.int8)
+                data_file['outputs/cpg/%s' % cell] = \
+                    np.zeros(nb_sample, dtype=np.int8)
+        data_file['outputs/stats/mean'] = np.zeros(nb_sample)
+
+
+def get_answers(data_files):
+    data_file = data_files[0]
+    return [utils.get_nb_sample(data_files),
+            utils.get_nb_sample(data_files, 4),
+            utils.get_layout(data_file),
+            utils.get_dna_store(data_file),
+            utils.get_dna_wlen(data_file),
+            utils.get_dna_wlen(data_file, 5),
+            utils.get_cpg_wlen(data_file),
+            utils.get_output_names(data_file),
+            utils.get_output_names(data_file, regex='cpg'),
+            utils.get_replicate_names(data_file),
+            utils.get_replicate_names(data_file, nb_key=1),
+            hdf.ls(data_file, '/', recursive=True),
+            hdf.ls(data_file, '/', recursive=True, groups=True),
+            hdf.ls(data_file, 'inputs', groups=True),
+            hdf.ls(data_file, 'outputs/cpg'),
+            hdf.ls(data_file, 'outputs/none', must_exist=False)]
+
+
+@pytest.mark.parametrize('layout', [1, 2])
+def test_manifest(tmpdir, monkeypatch, layout):
+    data_dir = str(tmpdir)
+    data_files = [os.path.join(data_dir, 'c1.h5'),
+                  os.path.join(data_dir, 'c2.h5')]
+    write_data_file(data_files[0], ['1', '1', '1', '2'], [5, 9, 7, 3], layout)
+    write_data_file(data_files[1], ['2', '2', '3'], [1, 2, 3], layout)
+    answers = get_answers(data_files)
+    assert mf.get_entry(data_files[0]) is None
+
+    manifest = mf.Manifest.build(data_dir)
+    assert len(manifest) == 2
+    assert data_files[1] in manifest
+    entry = manifest.get(data_files[0])
+    assert entry['nb_sample'] == 4
+    assert entry['regions'] == [['1', 5, 9, 0, 3], ['2', 3, 3, 3, 4]]
+    assert entry['layout'] == layout
+    assert entry['datasets']['/pos']['dtype'] == '<i4'
+    if layout > 1:
+        assert entry['datasets']['/outputs/cpg']['shape'] == [4, 2]
+        assert entry['datasets']['/outputs/cpg']['encoding'] == '2bit'
+        assert entry['datasets']['/outputs/cpg']['names'] == ['c1', 'c2']
+    manifest.save()
+    assert mf.get_entry(data_files[0]) == entry
+
+    # Answers must not require opening data files
+    def fail(*args, **kwargs):
+        raise AssertionError('Data file opened!')
+
+    monkeypatch.setattr(h5, 'File', fail)
+    assert get_answers(data_files) == answers
+    with pytest.raises(KeyError):
+        hdf.ls(data_files[0], 'outputs/none')
+    reader = hdf.reader(data_files, ['pos'], nb_sample=5)
+    with pytest.raises(ValueError):
+        next(hdf.reader(data_files, ['outputs/cpg/c3']))
+    with pytest.raises(AssertionError):
+        next(reader)
+    monkeypatch.undo()
+    npt.assert_array_equal(hdf.read(data_files, ['pos'], nb_sample=5)['pos'],
+                           [5, 9, 7, 3, 1])
+
+    assert mf.Manifest.load(data_dir).check() == []
+    os.remove(data_files[1])
+    write_data_file(os.path.join(data_dir, 'c3.h5'), ['3'], [1])
+    assert mf.Manifest.load(data_dir).check() == ['c2.h5', 'c3.h5']
+
+    # Entries of modified or removed files are ignored
+    assert mf.get_entry(data_files[0]) == entry
+    assert mf.get_entry(data_files[1]) is None
+    write_data_file(data_files[0], ['1', '1'], [5, 9], layout)
+    os.utime(data_files[0], (0, entry['mtime'] + 1))
+    assert mf.get_entry(data_files[0]) is None
+    assert utils.get_nb_sample(data_files[:1]) == 2
+
+    # Entries of removed files are dropped when updating
+    manifest = mf.Manifest.load(data_dir)
+    manifest.update([data_files[0]])
+    assert list(manifest.files.keys()) == ['c1.h5']
+    assert manifest.get(data_files[0])['nb_sample'] == 2
+    assert manifest.check() == ['c3.h5']
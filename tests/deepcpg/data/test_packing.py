@@ -0,0 +1,80 @@
+from __future__ import division
+from __future__ import print_function
+
+import h5py as h5
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from deepcpg.data import hdf, packing
+from deepcpg.data import CPG_NAN
+
+
+def test_2bit():
+    np.random.seed(0)
+    for shape in [(0,), (1,), (7,), (8, 3), (9, 2, 5)]:
+        x = np.random.randint(-1, 3, shape).astype(np.int8)
+        assert packing.can_pack_2bit(x)
+        packed = packing.pack_2bit(x)
+        assert packed.dtype == np.uint8
+        assert packed.shape == (int(np.ceil(shape[0] / 4)),) + shape[1:]
+        unpacked = packing.unpack_2bit(packed)
+        assert unpacked.dtype == np.int8
+        npt.assert_array_equal(unpacked[:len(x)], x)
+
+    assert not packing.can_pack_2bit(np.array([0, 3]))
+    assert not packing.can_pack_2bit(np.array([0, 0.5]))
+
+
+def test_dist():
+    dist = np.array([CPG_NAN, 1, 2, 65535, 100000], dtype=np.float32)
+    quant = packing.quantize_dist(dist)
+    assert quant.dtype == np.uint16
+    npt.assert_array_equal(quant, [0, 1, 2, 65535, 65535])
+    npt.assert_array_equal(packing.dequantize_dist(quant),
+                           [CPG_NAN, 1, 2, 65535, 65535])
+
+
+def test_encoded_dataset(tmpdir):
+    np.random.seed(0)
+    filename = str(tmpdir.join('data.h5'))
+    state = np.random.randint(-1, 2, (11, 2, 4)).astype(np.int8)
+    dist = np.random.randint(1, 100, (11, 2, 4)).astype(np.float32)
+    dist[state == CPG_NAN] = CPG_NAN
+    with h5.File(filename, 'w') as data_file:
+        data_file['pos'] = np.arange(11)
+        hdf.create_dataset(data_file, 'state', state, encoding='2bit')
+        dataset = hdf.create_dataset(data_file, 'dist', dist,
+                                     profile='fast', encoding='uint16')
+        hdf.set_names(dataset, ['c1', 'c2'])
+        with pytest.raises(ValueError):
+            hdf.create_dataset(data_file, 'x', state, encoding='x')
+
+    with h5.File(filename, 'r') as data_file:
+        dataset = packing.EncodedDataset(data_file['state'])
+        assert len(dataset) == 11
+        assert dataset.shape == state.shape
+        for start, stop in [(0, 11), (1, 2), (3, 9), (5, 5), (8, 100)]:
+            npt.assert_array_equal(dataset[start:stop], state[start:stop])
+        npt.assert_array_equal(dataset[::3], state[::3])
+        npt.assert_array_equal(dataset[[1, 4]], state[[1, 4]])
+        npt.assert_array_equal(dataset[[9, -1, 5]], state[[9, -1, 5]])
+        npt.assert_array_equal(dataset[state[:, 0, 0] == 1],
+                               state[state[:, 0, 0] == 1])
+        npt.assert_array_equal(dataset[6], state[6])
+        npt.assert_array_equal(dataset[-2], state[-2])
+        npt.assert_array_equal(dataset[2:7, 1], state[2:7, 1])
+        npt.assert_array_equal(dataset[[3, 5], :, 2], state[[3, 5], :, 2])
+        assert dataset[4, 1, 3] == state[4, 1, 3]
+        with pytest.raises(IndexError):
+            dataset[11]
+        dataset = packing.EncodedDataset(data_file['dist'])
+        npt.assert_array_equal(dataset[[2, 8]], dist[[2, 8]])
+        npt.assert_array_equal(dataset[10], dist[10])
+
+    for batch_size in [1, 3, 4, 128]:
+        data = hdf.read(filename, ['state', 'dist/c2', 'pos'],
+                        batch_size=batch_size)
+        npt.assert_array_equal(data['state'], state)
+        npt.assert_array_equal(data['dist/c2'], dist[:, 1])
+        assert data['dist/c2'].dtype == np.float32
@@ -0,0 +1,137 @@
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import h5py as h5
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from deepcpg.data import hdf
+from deepcpg.data import range_index as ri
+
+
+def write_data_file(filename, chromos, pos):
+    with h5.File(filename, 'w') as data_file:
+        data_file['chromo'] = np.array([chromo.encode() for chromo in chromos])
+        data_file['pos'] = np.asarray(pos, dtype=np.int32)
+        data_file['value'] = np.arange(len(pos)) * 10
+
+
+class TestRangeIndex(object):
+
+    @pytest.fixture(autouse=True)
+    def data_files(self, tmpdir):
+        self.data_dir = str(tmpdir)
+        self.data_files = [os.path.join(self.data_dir, name)
+                           for name in ['c1.h5', 'c2.h5', 'c3.h5']]
+        write_data_file(self.data_files[0], ['1', '1', '1', '2', '2'],
+                        [1, 5, 9, 2, 4])
+        write_data_file(self.data_files[1], ['2', '2', '2'], [6, 8, 9])
+        write_data_file(self.data_files[2], ['10', '10'], [1, 3])
+
+    def test_build(self):
+        index = ri.RangeIndex.build(self.data_files[::-1])
+        assert len(index) == 10
+        assert index.chromos == ['1', '10', '2']
+        assert '10' in index
+        assert 'X' not in index
+        npt.assert_array_equal(index.offsets, [0, 3, 5, 10])
+        npt.assert_array_equal(index.pos, [1, 5, 9, 1, 3, 2, 4, 6, 8, 9])
+        npt.assert_array_equal(index.seg_offsets, [0, 3, 5, 7, 10])
+        npt.assert_array_equal(index.seg_rows, [0, 0, 3, 0])
+
+        index.save(self.data_dir)
+        loaded = ri.RangeIndex.load(self.data_dir)
+        assert loaded.files == [os.path.join(self.data_dir, name)
+                                for name in ['c3.h5', 'c2.h5', 'c1.h5']]
+        npt.assert_array_equal(loaded.pos, index.pos)
+        assert ri.get_range_index(self.data_files[:2]).files == loaded.files
+
+        write_data_file(os.path.join(self.data_dir, 'c4.h5'), ['2'], [8])
+        with pytest.raises(ValueError):
+            ri.RangeIndex.build(self.data_files +
+                                [os.path.join(self.data_dir, 'c4.h5')])
+        write_data_file(os.path.join(self.data_dir, 'c5.h5'), ['X', 'X'],
+                        [3, 1])
+        with pytest.raises(ValueError):
+            ri.RangeIndex.build([os.path.join(self.data_dir, 'c5.h5')])
+
+    def test_query(self):
+        index = ri.RangeIndex.build(self.data_files)
+        c1, c2, c3 = self.data_files
+        assert index.query('1', 1, 9) == [(c1, 0, 3)]
+        assert index.query('1', 2, 8) == [(c1, 1, 2)]
+        assert index.query('1', 6, 8) == []
+        assert index.query('X', 1, 10) == []
+        assert index.query('2', 3, 8) == [(c1, 4, 5), (c2, 0, 2)]
+        # Overlapping intervals are merged and consecutive rows joined
+        assert index.query(['2', '2', '1'], [8, 2, 9], [9, 6, 100]) == \
+            [(c1, 2, 5), (c2, 0, 3)]
+        assert index.query(['10', '1'], [3, 1], [3, 1]) == \
+            [(c1, 0, 1), (c3, 1, 2)]
+        assert index.query(['1', '2'], 0, 100) == \
+            [(c1, 0, 5), (c2, 0, 3)]
+
+    def test_reader(self):
+        regions = (np.array(['2', '1', '10']), np.array([5, 4, 1]),
+                   np.array([8, 9, 2]))
+        rows = ri.get_region_rows(self.data_files[::-1], regions)
+        assert list(rows.keys()) == self.data_files[::-1]
+        npt.assert_array_equal(rows[self.data_files[0]], [1, 2])
+        npt.assert_array_equal(rows[self.data_files[1]], [0, 1])
+        npt.assert_array_equal(rows[self.data_files[2]], [0])
+
+        names = ['chromo', 'pos', 'value']
+        for batch_size in [1, 2, 128]:
+            data = hdf.read(self.data_files, names, regions=regions,
+                            batch_size=batch_size)
+            npt.assert_array_equal(data['chromo'],
+                                   [b'1', b'1', b'2', b'2', b'10'])
+            npt.assert_array_equal(data['pos'], [5, 9, 6, 8, 1])
+            npt.assert_array_equal(data['value'], [10, 20, 0, 10, 0])
+        data = hdf.read(self.data_files, names, regions=regions,
+                        shuffle=True)
+        assert sorted(data['pos']) == [1, 5, 6, 8, 9]
+        data = hdf.read(self.data_files, names, regions=regions, nb_sample=3)
+        npt.assert_array_equal(data['pos'], [5, 9, 6])
+
+        bed_file = os.path.join(self.data_dir, 'regions.bed')
+        with open(bed_file, 'w') as f:
+            f.write('chr2\t7\t20\nchr1\t1\t1\n')
+        chromo, start, end = ri.read_regions(bed_file)
+        npt.assert_array_equal(chromo, ['1', '2'])
+        npt.assert_array_equal(start, [1, 7])
+        npt.assert_array_equal(end, [1, 20])
+        data = hdf.read(self.data_files, names, regions=bed_file)
+        npt.assert_array_equal(data['pos'], [1, 8, 9])
+
+    def test_outdated(self):
+        ri.RangeIndex.build(self.data_files).save(self.data_dir)
+        assert ri.is_index_current(self.data_dir)
+        regions = (np.array(['2']), np.array([1]), np.array([7]))
+        rows = ri.get_region_rows(self.data_files, regions)
+        npt.assert_array_equal(rows[self.data_files[0]], [3, 4])
+
+        # Rewrite file after index
+        index_file = os.path.join(self.data_dir, ri.INDEX_FILE)
+        mtime = os.path.getmtime(index_file)
+        write_data_file(self.data_files[0], ['1', '2', '2', '2'],
+                        [1, 2, 3, 4])
+        os.utime(self.data_files[0], (mtime + 1, mtime + 1))
+        assert not ri.is_index_current(self.data_dir)
+        rows = ri.get_region_rows(self.data_files, regions)
+        npt.assert_array_equal(rows[self.data_files[0]], [1, 2, 3])
+        npt.assert_array_equal(rows[self.data_files[1]], [0])
+        data = hdf.read(self.data_files, ['pos'], regions=regions)
+        npt.assert_array_equal(data['pos'], [2, 3, 4, 6])
+
+        # Remove file listed in index
+        ri.RangeIndex.build(self.data_files).save(self.data_dir)
+        os.utime(index_file, (mtime + 2, mtime + 2))
+        assert ri.is_index_current(self.data_dir)
+        os.remove(self.data_files[1])
+        assert not ri.is_index_current(self.data_dir)
+        data = hdf.read(self.data_files[::2], ['pos'], regions=regions)
+        npt.assert_array_equal(data['pos'], [2, 3, 4])
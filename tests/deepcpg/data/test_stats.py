@@ -0,0 +1,112 @@
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import numpy.testing as npt
+
+from deepcpg.data import stats
+from deepcpg.data import feature_extractor as fext
+from deepcpg.data.utils import CPG_NAN
+
+
+class TestWinStats(object):
+
+    def setup_method(self, method):
+        np.random.seed(0)
+        nb_site = 200
+        nb_cell = 4
+        self.k = 5
+        self.wlens = [11, 101, 301]
+        self.pos = np.sort(np.random.choice(5000, nb_site, replace=False))
+        self.states = []
+        self.dists = []
+        self.center = []
+        ext = fext.KnnCpgFeatureExtractor(self.k)
+        for cell in range(nb_cell):
+            idx = np.sort(np.random.choice(nb_site, nb_site // 3,
+                                           replace=False))
+            value = np.random.binomial(1, 0.5, len(idx))
+            state, dist = ext.extract(self.pos, self.pos[idx], value)
+            nan = np.isnan(state)
+            state[nan] = CPG_NAN
+            dist[nan] = CPG_NAN
+            self.states.append(state.astype(np.int8))
+            self.dists.append(dist.astype(np.float32))
+            center = np.empty(nb_site, dtype=np.int8)
+            center.fill(CPG_NAN)
+            center[idx] = value
+            self.center.append(center)
+
+    def _masked_states(self, wlen):
+        states = np.concatenate([np.dstack(self.states),
+                                 np.vstack(self.center).T[:, np.newaxis]],
+                                axis=1)
+        dists = np.concatenate([np.dstack(self.dists),
+                                np.zeros((len(self.pos), 1,
+                                          len(self.states)))], axis=1)
+        states = np.swapaxes(states, 1, 2)
+        dists = np.swapaxes(dists, 1, 2)
+        idx = (states == CPG_NAN) | (dists > wlen // 2)
+        return np.ma.masked_array(states, idx)
+
+    def test_window_means(self):
+        for state, dist, center in zip(self.states, self.dists, self.center):
+            means, counts = stats.window_means(state, dist, self.wlens,
+                                               center=center)
+            assert means.shape == (len(self.wlens), len(self.pos))
+            for i, wlen in enumerate(self.wlens):
+                x = np.hstack([state, center.reshape(-1, 1)])
+                d = np.hstack([dist, np.zeros((len(dist), 1))])
+                x = np.ma.masked_array(x, (x == CPG_NAN) | (d > wlen // 2))
+                npt.assert_array_equal(counts[i], x.count(axis=1))
+                expect = x.mean(axis=1).filled(0)
+                npt.assert_array_equal(means[i], expect)
+
+    def test_reduce_cells(self):
+        names = ['mean', 'mode', 'var', 'cat_var', 'cat2_var', 'entropy',
+                 'diff', 'cov']
+        for i, wlen in enumerate(self.wlens):
+            means = []
+            valid = []
+            for state, dist, center in zip(self.states, self.dists,
+                                           self.center):
+                _means, _counts = stats.window_means(state, dist, self.wlens,
+                                                     center=center)
+                means.append(_means[i])
+                valid.append(_counts[i] > 0)
+            means = np.vstack(means).T
+            valid = np.vstack(valid).T
+            actual = stats.reduce_cells(means, valid, names)
+            x = self._masked_states(wlen)
+            for name in names:
+                expect = stats.get(name)(x)
+                idx = ~np.ma.getmaskarray(expect)
+                npt.assert_array_equal(actual[name][idx], expect.data[idx])
+
+
+class TestCpgStats(object):
+
+    def _test(self, x):
+        names = ['mean', 'mode', 'var', 'cat_var', 'cat2_var', 'entropy',
+                 'diff', 'cov']
+        actual, nb_cell = stats.cpg_stats(x, names)
+        masked = np.ma.masked_values(x, CPG_NAN)
+        npt.assert_array_equal(nb_cell, masked.count(axis=1))
+        for name in names:
+            expect = stats.get(name)(masked)
+            idx = ~np.ma.getmaskarray(expect)
+            assert np.sum(idx) > 0
+            npt.assert_array_equal(actual[name][idx], expect.data[idx])
+
+    def test_binary(self):
+        np.random.seed(0)
+        x = np.random.binomial(1, 0.3, (1000, 20)).astype(np.int8)
+        x[np.random.binomial(1, 0.5, x.shape).astype(bool)] = CPG_NAN
+        x[0] = CPG_NAN
+        self._test(x)
+
+    def test_continuous(self):
+        np.random.seed(0)
+        x = np.random.uniform(0, 1, (1000, 20)).astype(np.float32)
+        x[np.random.binomial(1, 0.5, x.shape).astype(bool)] = CPG_NAN
+        self._test(x)
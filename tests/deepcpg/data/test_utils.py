@@ -0,0 +1,250 @@
+from __future__ import division
+from __future__ import print_function
+
+import pickle
+
+import h5py as h5
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pytest
+
+from deepcpg.data import hdf
+from deepcpg.data import utils
+
+
+class TestCpgProfile(object):
+
+    def setup_method(self, method):
+        self.frame = pd.DataFrame({
+            'chromo': ['2', '1', '2', 'X', '1', '2'],
+            'pos': [5, 9, 1, 3, 2, 3],
+            'value': np.array([1, 0, 0, 1, 1, 0], dtype=np.int8)},
+            columns=['chromo', 'pos', 'value'])
+
+    def test_from_frame(self):
+        profile = utils.CpgProfile.from_frame(self.frame)
+        assert len(profile) == 6
+        assert profile.chromos == ['1', '2', 'X']
+        assert profile.dtype == np.int8
+        npt.assert_array_equal(profile.offsets, [0, 2, 5, 6])
+        assert '2' in profile
+        assert 'Y' not in profile
+
+        pos, value = profile.get('2')
+        npt.assert_array_equal(pos, [1, 3, 5])
+        npt.assert_array_equal(value, [0, 0, 1])
+        pos, value = profile.get('1')
+        npt.assert_array_equal(pos, [2, 9])
+        npt.assert_array_equal(value, [1, 0])
+        pos, value = profile.get('Y')
+        assert len(pos) == 0
+        assert value.dtype == np.int8
+
+    def test_to_frame(self):
+        profile = utils.CpgProfile.from_frame(self.frame)
+        frame = profile.to_frame()
+        expect = self.frame.sort_values(['chromo', 'pos'])
+        npt.assert_array_equal(frame.values, expect.values)
+        assert list(frame.columns) == ['chromo', 'pos', 'value']
+
+    def test_save_load(self, tmpdir):
+        profile = utils.CpgProfile.from_frame(self.frame)
+        filename = str(tmpdir.join('profile.npz'))
+        profile.save(filename)
+        loaded = utils.CpgProfile.load(filename)
+        assert loaded.chromos == profile.chromos
+        assert loaded.dtype == np.int8
+        npt.assert_array_equal(loaded.offsets, profile.offsets)
+        npt.assert_array_equal(loaded.pos, profile.pos)
+        npt.assert_array_equal(loaded.value, profile.value)
+
+        profile = utils.CpgProfile([], [0], np.array([], dtype=np.int32),
+                                   np.array([], dtype=np.float32))
+        profile.save(filename)
+        loaded = utils.CpgProfile.load(filename)
+        assert len(loaded) == 0
+        assert loaded.chromos == []
+        assert loaded.dtype == np.float32
+
+    def _write_profile(self, tmpdir, values, bedgraph=False):
+        filename = str(tmpdir.join('profile.tsv'))
+        chromos = ['chr2', '1', 'CHR2', 'chrX', 'chr1', '2', 'x', '1']
+        pos = [5, 9, 1, 3, 2, 3, 7, 4]
+        with open(filename, 'w') as f:
+            if bedgraph:
+                f.write('track type=bedGraph\n')
+            for chromo, p, value in zip(chromos, pos, values):
+                if bedgraph:
+                    f.write('%s\t%d\t%d\t%s\n' % (chromo, p, p + 1, value))
+                else:
+                    f.write('%s\t%d\t%s\n' % (chromo, p, value))
+        return filename
+
+    def _compare_read(self, filename, **kwargs):
+        np.random.seed(0)
+        expect = utils.read_cpg_profile(filename, **kwargs)
+        np.random.seed(0)
+        profile = utils.CpgProfile.read(filename, **kwargs)
+        frame = profile.to_frame()
+        assert frame['value'].dtype == expect['value'].dtype
+        npt.assert_array_equal(frame.values, expect.values)
+        return profile
+
+    def test_read(self, tmpdir):
+        filename = self._write_profile(tmpdir, [1, 0, 0, 1, 1, 0, 1, 0])
+        profile = self._compare_read(filename)
+        assert profile.chromos == ['1', '2', 'X']
+        assert profile.pos.dtype == np.int32
+        assert profile.dtype == np.int8
+        npt.assert_array_equal(profile.offsets, [0, 3, 6, 8])
+
+        profile = self._compare_read(filename, chromos=['2', 'X'])
+        assert profile.chromos == ['2', 'X']
+        profile = self._compare_read(filename, chromos='1')
+        assert profile.chromos == ['1']
+        profile = self._compare_read(filename, nb_sample=3)
+        assert profile.chromos == ['1', '2']
+        self._compare_read(filename, nb_sample_chromo=2)
+        self._compare_read(filename, nb_sample_chromo=1, nb_sample=2,
+                           chromos=['1', 'X'])
+
+    def test_read_continuous(self, tmpdir):
+        values = [0.5, 0.1, 1.0, 0.0, 0.7, 0.3, 0.9, 0.2]
+        filename = self._write_profile(tmpdir, values, bedgraph=True)
+        profile = self._compare_read(filename)
+        assert profile.dtype == np.float32
+        profile = self._compare_read(filename, round=True)
+        assert profile.dtype == np.int8
+
+        profile = utils.CpgProfile.read(filename, dtype=np.float16)
+        assert profile.dtype == np.float16
+        pos, value = profile.get('1')
+        npt.assert_array_equal(pos, [2, 4, 9])
+        npt.assert_array_almost_equal(value, [0.7, 0.2, 0.1], 3)
+
+    def test_read_chunks(self, tmpdir):
+        filename = self._write_profile(tmpdir, [1, 0, 0, 1, 1, 0, 1, 0])
+        for chunk_size in [1, 2, 3, 100]:
+            np.random.seed(0)
+            expect = utils.read_cpg_profile(filename, chromos=['1', 'X'],
+                                            nb_sample=2)
+            profile = utils.CpgProfile.read(filename, chromos=['1', 'X'],
+                                            nb_sample=2, chunk_size=chunk_size)
+            npt.assert_array_equal(profile.to_frame().values, expect.values)
+
+            expect = utils.read_cpg_profile(filename, chromos=['2'])
+            profile = utils.CpgProfile.read(filename, chromos=['2'],
+                                            chunk_size=chunk_size)
+            npt.assert_array_equal(profile.to_frame().values, expect.values)
+
+    def test_read_chromo_sorted(self, tmpdir):
+        filename = str(tmpdir.join('profile.tsv'))
+        with open(filename, 'w') as f:
+            f.write('chr1\t1\t1\nchr1\t5\t0\nchr2\t3\t1\nchr2\t4\t1\n')
+            f.write('chr3\t1\t0\nchr3\t2\t2\n')
+        profile = utils.CpgProfile.read(filename, chromos=['2'],
+                                        chromo_sorted=True, chunk_size=1)
+        assert profile.chromos == ['2']
+        npt.assert_array_equal(profile.pos, [3, 4])
+        npt.assert_array_equal(profile.value, [1, 1])
+
+        with pytest.raises(ValueError):
+            utils.CpgProfile.read(filename, chromos=['2'], chunk_size=1)
+
+
+class TestSpilledCpgProfile(object):
+
+    def _write_profile(self, tmpdir, values):
+        filename = str(tmpdir.join('profile.tsv'))
+        chromos = ['chr2', '1', 'CHR2', 'chrX', 'chr1', '2', 'x', '1']
+        pos = [5, 9, 1, 3, 2, 3, 7, 4]
+        with open(filename, 'w') as f:
+            for chromo, p, value in zip(chromos, pos, values):
+                f.write('%s\t%d\t%s\n' % (chromo, p, value))
+        return filename
+
+    def _compare(self, filename, dirname, **kwargs):
+        expect = utils.CpgProfile.read(filename, **kwargs)
+        profile = utils.SpilledCpgProfile.write(filename, dirname,
+                                                chunk_size=3, **kwargs)
+        assert sorted(profile.chromos) == expect.chromos
+        assert len(profile) == len(expect)
+        assert profile.dtype == expect.dtype
+        for chromo in expect.chromos + ['Y']:
+            assert (chromo in profile) == (chromo in expect)
+            pos, value = profile.get(chromo)
+            expect_pos, expect_value = expect.get(chromo)
+            assert pos.dtype == np.int32
+            assert value.dtype == expect.dtype
+            npt.assert_array_equal(pos, expect_pos)
+            npt.assert_array_equal(value, expect_value)
+        return profile
+
+    def test_write(self, tmpdir):
+        filename = self._write_profile(tmpdir, [1, 0, 0, 1, 1, 0, 1, 0])
+        profile = self._compare(filename, str(tmpdir.join('s1')))
+        assert profile.dtype == np.int8
+        self._compare(filename, str(tmpdir.join('s2')), chromos=['1', 'X'])
+        self._compare(filename, str(tmpdir.join('s3')), nb_sample=5)
+
+        with pytest.raises(ValueError):
+            utils.SpilledCpgProfile.write(filename, str(tmpdir.join('s1')))
+
+    def test_write_continuous(self, tmpdir):
+        values = [0.5, 0.1, 1.0, 0.0, 0.7, 0.3, 0.9, 0.2]
+        filename = self._write_profile(tmpdir, values)
+        profile = self._compare(filename, str(tmpdir.join('s1')))
+        assert profile.dtype == np.float32
+        profile = self._compare(filename, str(tmpdir.join('s2')), round=True)
+        assert profile.dtype == np.int8
+
+    def test_cache(self, tmpdir):
+        filename = self._write_profile(tmpdir, [1, 0, 0, 1, 1, 0, 1, 0])
+        profile = utils.SpilledCpgProfile.write(filename,
+                                                str(tmpdir.join('s')))
+        pos = profile.get('1')[0]
+        assert profile.get('1')[0] is pos
+        assert pickle.loads(pickle.dumps(profile))._cache is None
+        profile.release()
+        assert profile.get('1')[0] is not pos
+
+
+def test_dna_store(tmpdir):
+    filename = str(tmpdir.join('data.h5'))
+    with h5.File(filename, 'w') as data_file:
+        data_file.create_dataset('inputs/dna', data=np.zeros((2, 11)))
+    assert utils.get_dna_store(filename) is None
+    assert utils.get_dna_wlen(filename) == 11
+    assert utils.get_dna_wlen(filename, 5) == 5
+
+    with h5.File(filename, 'w') as data_file:
+        group = data_file.create_group('inputs')
+        group.attrs['dna_store'] = '/data/mm10'
+        group.attrs['dna_wlen'] = 11
+    assert utils.get_dna_store(filename) == '/data/mm10'
+    assert utils.get_dna_wlen(filename) == 11
+    assert utils.get_dna_wlen(filename, 101) == 101
+
+
+def test_layout(tmpdir):
+    filename = str(tmpdir.join('data.h5'))
+    with h5.File(filename, 'w') as data_file:
+        for name in ['c1', 'c2']:
+            data_file['inputs/cpg/%s/state' % name] = np.zeros((3, 4))
+            data_file['inputs/cpg/%s/dist' % name] = np.zeros((3, 4))
+    assert utils.get_layout(filename) == 1
+    assert utils.get_replicate_names(filename) == ['c1', 'c2']
+    assert utils.get_cpg_wlen(filename) == 4
+
+    with h5.File(filename, 'w') as data_file:
+        data_file.attrs['layout'] = 2
+        for kind in ['state', 'dist']:
+            dataset = data_file.create_dataset('inputs/cpg/%s' % kind,
+                                               data=np.zeros((3, 2, 4)))
+            hdf.set_names(dataset, ['c1', 'c2'])
+    assert utils.get_layout(filename) == 2
+    assert utils.get_replicate_names(filename) == ['c1', 'c2']
+    assert utils.get_replicate_names(filename, nb_key=1) == ['c1']
+    assert utils.get_cpg_wlen(filename) == 4
+    assert utils.get_cpg_wlen(filename, 2) == 2
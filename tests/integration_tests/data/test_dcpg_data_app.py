@@ -0,0 +1,543 @@
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import glob
+import os
+import sys
+import warnings
+
+import h5py as h5
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pytest
+import six
+
+from deepcpg import data as dat
+from deepcpg.data import dna
+from deepcpg.data import genome
+from deepcpg.data import hdf
+from deepcpg.data import manifest as mf
+from deepcpg.data import packing
+from deepcpg.data import range_index as ri
+
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                          '..', '..', '..', 'scripts')
+
+
+def load_script(name='dcpg_data'):
+    script = os.path.join(SCRIPT_DIR, '%s.py' % name)
+    if six.PY2:
+        import imp
+        # Registers the module in `sys.modules`
+        return imp.load_source(name, script)
+
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(name, script)
+    module = importlib.util.module_from_spec(spec)
+    # Functions passed to worker processes are pickled by module name
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_data_dir(data_dir):
+    data = dict()
+
+    def read(name, obj):
+        if isinstance(obj, h5.Dataset):
+            data[(filename, name)] = obj[()]
+
+    for filename in sorted(os.listdir(data_dir)):
+        if filename.endswith('.h5'):
+            with h5.File(os.path.join(data_dir, filename), 'r') as h5_file:
+                h5_file.visititems(read)
+    return data
+
+
+def extract_seq_windows(seq, pos, wlen, seq_index=1):
+    """Extracts windows position by position as `dcpg_data.py` did before
+    :class:`SeqWindowExtractor`."""
+    delta = wlen // 2
+    nb_win = len(pos)
+    seq = seq.upper()
+    seq_wins = np.zeros((nb_win, wlen), dtype='int8')
+    for i in range(nb_win):
+        p = pos[i] - seq_index
+        win = seq[max(0, p - delta): min(len(seq), p + delta + 1)]
+        if len(win) < wlen:
+            win = max(0, delta - p) * 'N' + win
+            win += max(0, p + delta + 1 - len(seq)) * 'N'
+            assert len(win) == wlen
+        seq_wins[i] = dna.char_to_int(win)
+    idx = seq_wins == dna.CHAR_TO_INT['N']
+    seq_wins[idx] = np.random.randint(0, 4, idx.sum())
+    return seq_wins
+
+
+def map_values(values, pos, target_pos, dtype=None, nan=-1):
+    """Maps values as `dcpg_data.py` did before :func:`np.searchsorted`."""
+    idx = np.in1d(pos, target_pos)
+    pos = pos[idx]
+    values = values[idx]
+    if not dtype:
+        dtype = values.dtype
+    target_values = np.empty(len(target_pos), dtype=dtype)
+    target_values.fill(nan)
+    idx = np.in1d(target_pos, pos).nonzero()[0]
+    assert len(idx) == len(values)
+    target_values[idx] = values
+    return target_values
+
+
+def test_map_values():
+    script = load_script()
+    np.random.seed(0)
+    target_pos = np.array([2, 5, 7, 9, 12, 20])
+    for pos in [[5, 9, 20], [1, 5, 6, 12, 30, 31], [21, 25], [0, 1], [],
+                [2, 5, 7, 9, 12, 20]]:
+        pos = np.array(pos, dtype=np.int32)
+        values = np.random.randint(0, 2, len(pos)).astype(np.int8)
+        expected = map_values(values, pos, target_pos)
+        actual = script.map_values(values, pos, target_pos)
+        assert actual.dtype == np.int8
+        npt.assert_array_equal(actual, expected)
+        actual = script.map_values(values, pos, target_pos, dtype=np.float32)
+        assert actual.dtype == np.float32
+        npt.assert_array_equal(actual, expected)
+        out = np.empty((len(target_pos), 2), dtype=np.float32)
+        script.map_values(values, pos, target_pos, out=out[:, 1])
+        npt.assert_array_equal(out[:, 1], expected)
+        npt.assert_array_equal(
+            script.map_values(values, pos, np.array([], dtype=np.int32)), [])
+    with pytest.raises(AssertionError):
+        script.map_values(np.zeros(2), np.array([5, 1]), target_pos)
+
+
+def test_map_cpg_tables():
+    script = load_script()
+    frames = [pd.DataFrame({'chromo': ['1', '1', '1', '2'],
+                            'pos': [9, 2, 30, 4],
+                            'value': np.array([1, 0, 1, 1], dtype=np.int8)}),
+              pd.DataFrame({'chromo': ['2', '2'], 'pos': [4, 8],
+                            'value': np.array([0.5, 1], dtype=np.float32)})]
+    cpg_tables = OrderedDict([
+        (str(i), dat.CpgProfile.from_frame(frame[['chromo', 'pos', 'value']]))
+        for i, frame in enumerate(frames)])
+    chromo_pos = np.array([2, 5, 9, 40])
+    cpg_mat = script.map_cpg_tables(cpg_tables, '1', chromo_pos)
+    assert cpg_mat.dtype == np.float32
+    npt.assert_array_equal(cpg_mat, [[0, -1], [-1, -1], [1, -1], [-1, -1]])
+    for chromo in ['1', '2', 'X']:
+        cpg_mat = script.map_cpg_tables(cpg_tables, chromo, chromo_pos)
+        for i, cpg_table in enumerate(cpg_tables.values()):
+            pos, value = cpg_table.get(chromo)
+            npt.assert_array_equal(
+                cpg_mat[:, i], map_values(value, pos, chromo_pos,
+                                          dtype=np.float32))
+    del cpg_tables['1']
+    cpg_mat = script.map_cpg_tables(cpg_tables, '2', chromo_pos)
+    assert cpg_mat.dtype == np.int8
+    npt.assert_array_equal(cpg_mat[:, 0], [-1, -1, -1, -1])
+
+
+def test_seq_window_extractor():
+    script = load_script()
+    np.random.seed(0)
+    seq = ''.join(np.random.choice(list('ACGTNacgt'), 50))
+    pos = np.array([1, 2, 5, 17, 25, 33, 46, 49, 50])
+    for wlen in [1, 11, 31, 101]:
+        for seq_index in [0, 1]:
+            extract = script.SeqWindowExtractor(seq, wlen, seq_index)
+            _pos = pos - 1 + seq_index
+            np.random.seed(1)
+            expected = extract_seq_windows(seq, _pos, wlen, seq_index)
+            np.random.seed(1)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                actual = extract(_pos)
+            npt.assert_array_equal(actual, expected)
+            with pytest.raises(ValueError):
+                extract([seq_index - 1])
+            with pytest.raises(ValueError):
+                extract([len(seq) + seq_index])
+
+
+def test_seq_window_extractor_store(tmpdir):
+    script = load_script()
+    np.random.seed(0)
+    seqs = [('1', ''.join(np.random.choice(list('ACGTN'), 50))),
+            ('2', 'CG')]
+    pos = np.array([1, 2, 5, 17, 25, 33, 46, 49, 50])
+    for encoding in genome.ENCODINGS:
+        dirname = str(tmpdir.join(encoding))
+        genome.write_store(dirname, seqs, encoding=encoding)
+        store = genome.GenomeStore(dirname)
+        for chromo, seq in seqs:
+            _pos = pos[pos <= len(seq)]
+            for wlen in [1, 11, 101]:
+                np.random.seed(1)
+                expected = extract_seq_windows(seq, _pos - 1, wlen, 0)
+                np.random.seed(1)
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    actual = script.SeqWindowExtractor(store, wlen,
+                                                       chromo=chromo)(_pos)
+                npt.assert_array_equal(actual, expected)
+                # Memory-mapped chromosome, which is not copied
+                np.random.seed(1)
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    actual = script.SeqWindowExtractor(store.seq(chromo),
+                                                       wlen)(_pos)
+                npt.assert_array_equal(actual, expected)
+        with pytest.raises(ValueError):
+            script.SeqWindowExtractor(store, 11, chromo='3')
+
+
+def test_prepro_pos_table():
+    script = load_script()
+    tables = [pd.DataFrame({'chromo': ['2', '1', '10', '1'],
+                            'pos': [5, 9, 3, 9]},
+                           columns=['chromo', 'pos']),
+              pd.DataFrame({'chromo': ['X', '1', '2'], 'pos': [1, 2, 5]},
+                           columns=['chromo', 'pos'])]
+    for _tables in [tables, tables[::-1]]:
+        pos_table = script.prepro_pos_table(_tables)
+        assert list(pos_table.columns) == ['chromo', 'pos']
+        assert pos_table['pos'].dtype == np.int32
+        assert list(pos_table['chromo'].cat.categories) == \
+            ['1', '10', '2', 'X']
+        assert list(pos_table['chromo']) == ['1', '1', '10', '2', 'X']
+        npt.assert_array_equal(pos_table['pos'], [2, 9, 3, 5, 1])
+    pos_table = script.prepro_pos_table(tables[1])
+    npt.assert_array_equal(pos_table['pos'], [2, 5, 1])
+
+
+def test_get_profile_pos_table():
+    script = load_script()
+
+    def profile(chromos, pos):
+        frame = pd.DataFrame({'chromo': chromos, 'pos': pos,
+                              'value': np.ones(len(pos), dtype=np.int8)},
+                             columns=['chromo', 'pos', 'value'])
+        return dat.CpgProfile.from_frame(frame)
+
+    profiles = [profile(['1', '1', '1', '2', '10'], [5, 3, 5, 8, 1]),
+                profile(['1', '2', '2', 'X'], [5, 8, 2, 7]),
+                profile(['1'], [9])]
+    pos_table = script.get_profile_pos_table(profiles)
+    assert list(pos_table.columns) == ['chromo', 'pos', 'cov']
+    assert pos_table['pos'].dtype == np.int32
+    assert list(pos_table['chromo'].cat.categories) == ['1', '10', '2', 'X']
+    assert list(pos_table['chromo']) == \
+        ['1', '1', '1', '10', '2', '2', 'X']
+    npt.assert_array_equal(pos_table['pos'], [3, 5, 9, 1, 2, 8, 7])
+    # Duplicated positions of a profile are counted once
+    npt.assert_array_equal(pos_table['cov'], [1, 2, 1, 1, 1, 2, 1])
+
+    # Positions of profiles are the same as from a position table
+    expected = script.prepro_pos_table([
+        pd.DataFrame({'chromo': np.repeat(p.chromos, np.diff(p.offsets)),
+                      'pos': p.pos}) for p in profiles])
+    npt.assert_array_equal(pos_table['chromo'], expected['chromo'])
+    npt.assert_array_equal(pos_table['pos'], expected['pos'])
+
+    pos_table = script.get_profile_pos_table([profile([], [])])
+    assert len(pos_table) == 0
+    assert list(pos_table.columns) == ['chromo', 'pos', 'cov']
+
+
+def test_read_cpg_profile(tmpdir):
+    script = load_script()
+    cache_dir = str(tmpdir.join('cache'))
+    filename = str(tmpdir.join('c1.tsv'))
+    with open(filename, 'w') as f:
+        f.write('1\t3\t1\n1\t7\t0\n2\t5\t1\nX\t2\t0\n')
+
+    def assert_equal(actual, expected):
+        assert actual.chromos == expected.chromos
+        npt.assert_array_equal(actual.offsets, expected.offsets)
+        npt.assert_array_equal(actual.pos, expected.pos)
+        npt.assert_array_equal(actual.value, expected.value)
+        assert actual.value.dtype == expected.value.dtype
+
+    expected, cached = script.read_cpg_profile(filename, cache_dir)
+    assert not cached
+    assert expected.chromos == ['1', '2', 'X']
+    cache_file = script.get_cache_filename(filename, cache_dir)
+    assert os.path.isfile(cache_file)
+    actual, cached = script.read_cpg_profile(filename, cache_dir)
+    assert cached
+    assert_equal(actual, expected)
+
+    # Cache files are invalidated if the profile is modified
+    with open(filename, 'a') as f:
+        f.write('2\t9\t1\n')
+    actual, cached = script.read_cpg_profile(filename, cache_dir)
+    assert not cached
+    npt.assert_array_equal(actual.get('2')[0], [5, 9])
+    actual, cached = script.read_cpg_profile(filename, cache_dir)
+    assert cached
+    npt.assert_array_equal(actual.get('2')[0], [5, 9])
+    stat = os.stat(filename)
+    os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+    assert not script.read_cpg_profile(filename, cache_dir)[1]
+    assert script.read_cpg_profile(filename, cache_dir)[1]
+
+    # Edits that keep size and modification time, e.g. copies with preserved
+    # modification time
+    stat = os.stat(filename)
+    with open(filename) as f:
+        lines = f.read().replace('X\t2\t0', 'X\t2\t1')
+    with open(filename, 'w') as f:
+        f.write(lines)
+    os.utime(filename, (stat.st_atime, stat.st_mtime))
+    assert os.path.getsize(filename) == stat.st_size
+    actual, cached = script.read_cpg_profile(filename, cache_dir)
+    assert not cached
+    npt.assert_array_equal(actual.get('X')[1], [1])
+    assert script.read_cpg_profile(filename, cache_dir)[1]
+    # Options are part of the name of cache files
+    chromo_file = script.get_cache_filename(filename, cache_dir,
+                                            chromos=['1'])
+    assert chromo_file != cache_file
+    actual, cached = script.read_cpg_profile(filename, cache_dir,
+                                             chromos=['1'])
+    assert not cached
+    assert actual.chromos == ['1']
+    assert os.path.isfile(chromo_file)
+    assert script.read_cpg_profile(filename, cache_dir, chromos=['1'])[1]
+    assert script.read_cpg_profile(filename, cache_dir)[1]
+
+    # Fingerprints of large files include the last block
+    fingerprint = script.get_file_fingerprint(filename, 4)
+    with open(filename, 'a') as f:
+        f.write('X\t9\t1\n')
+    assert script.get_file_fingerprint(filename, 4) != fingerprint
+
+
+class TestApp(object):
+
+    @pytest.fixture(autouse=True)
+    def input_files(self, tmpdir):
+        self.tmp_dir = str(tmpdir)
+        np.random.seed(0)
+        self.dna_dir = os.path.join(self.tmp_dir, 'dna')
+        os.makedirs(self.dna_dir)
+        self.cpg_files = [os.path.join(self.tmp_dir, 'c%d.tsv' % i)
+                          for i in range(2)]
+        cpg_files = [open(filename, 'w') for filename in self.cpg_files]
+        for chromo, seq_len in [('1', 3000), ('2', 2000), ('3', 1000)]:
+            seq = ''.join(np.random.choice(list('ACGT'), seq_len))
+            filename = os.path.join(self.dna_dir,
+                                    'mm10.dna.chromosome.%s.fa' % chromo)
+            with open(filename, 'w') as f:
+                f.write('>%s\n%s\n' % (chromo, seq))
+            pos = [i + 1 for i in range(seq_len - 1) if seq[i:i + 2] == 'CG']
+            for cpg_file in cpg_files:
+                for p in pos:
+                    if np.random.rand() < 0.7:
+                        cpg_file.write('%s\t%d\t%d\n' % (
+                            chromo, p, np.random.randint(0, 2)))
+        for cpg_file in cpg_files:
+            cpg_file.close()
+
+    def run(self, out_dir, *args, **kwargs):
+        args = ['dcpg_data.py',
+                '--dna_files', kwargs.get('dna_files', self.dna_dir),
+                '--cpg_profiles'] + self.cpg_files + [
+                '--dna_wlen', '101',
+                '--cpg_wlen', '10',
+                '--cpg_stats', 'mean', 'var',
+                '--chunk_size', '50',
+                '--seed', '0',
+                '--out_dir', os.path.join(self.tmp_dir, out_dir)] + list(args)
+        script = kwargs.get('script') or load_script()
+        assert script.App().run(args) == 0
+        return read_data_dir(os.path.join(self.tmp_dir, out_dir))
+
+    def test_nb_worker(self):
+        expected = self.run('serial')
+        assert len(expected)
+        actual = self.run('parallel', '--nb_worker', '2')
+        assert sorted(actual.keys()) == sorted(expected.keys())
+        for key, value in expected.items():
+            npt.assert_array_equal(actual[key], value, err_msg=str(key))
+
+        # Chromosomes are processed serially without fork
+        script = load_script()
+        script.get_fork_context = lambda: None
+        actual = self.run('no_fork', '--nb_worker', '2', script=script)
+        assert sorted(actual.keys()) == sorted(expected.keys())
+        for key, value in expected.items():
+            npt.assert_array_equal(actual[key], value, err_msg=str(key))
+
+    def test_pos_file(self):
+        expected = self.run('profiles')
+        pos_file = os.path.join(self.tmp_dir, 'pos.tsv')
+        with open(pos_file, 'w') as f:
+            for filename in self.cpg_files[::-1]:
+                with open(filename) as cpg_file:
+                    for line in cpg_file:
+                        f.write('chr%s\t%s\n' % tuple(line.split()[:2]))
+        actual = self.run('pos_file', '--pos_file', pos_file)
+        assert sorted(actual.keys()) == sorted(expected.keys())
+        for key, value in expected.items():
+            npt.assert_array_equal(actual[key], value, err_msg=str(key))
+
+    def test_rerun(self):
+        # Chunks of the second run overlap with chunks of the first run
+        self.run('data')
+        expected = self.run('rerun', '--chunk_size', '80')
+        data = self.run('data', '--chunk_size', '80')
+        data_dir = os.path.join(self.tmp_dir, 'data')
+        data_files = sorted(glob.glob(os.path.join(data_dir, '*.h5')))
+        new_files = sorted([os.path.join(data_dir, filename)
+                            for filename, _ in expected])
+        assert sorted(set(filename for filename, _ in data)) == \
+            sorted([os.path.basename(filename) for filename in data_files])
+        assert len(data_files) > len(set(new_files))
+
+        manifest = mf.Manifest.load(data_dir)
+        assert sorted(manifest.files.keys()) == \
+            sorted(set([os.path.basename(filename)
+                        for filename in new_files]))
+        index = ri.RangeIndex.load(data_dir)
+        assert sorted(index.files) == sorted(set(new_files))
+        nb_sample = sum([len(value) for (_, name), value in expected.items()
+                         if name == 'pos'])
+        assert len(index) == nb_sample
+        regions = (np.array(['1']), np.array([0]), np.array([10 ** 6]))
+        pos = hdf.read(sorted(set(new_files)), ['pos'],
+                       regions=regions)['pos']
+        assert len(pos) == len(np.unique(pos))
+
+        # Overlapping files are reported
+        assert load_script('dcpg_data_manifest').App().run(
+            ['dcpg_data_manifest.py', data_dir]) == 1
+
+    def test_compact_cpg(self):
+        expected = self.run('plain', '--win_stats', 'mean', 'mode',
+                            '--win_stats_wlen', '3', '7')
+        self.run('compact', '--compact_cpg', '--win_stats', 'mean', 'mode',
+                 '--win_stats_wlen', '3', '7')
+        data_files = sorted(glob.glob(os.path.join(self.tmp_dir, 'compact',
+                                                   '*.h5')))
+        assert len(data_files)
+        encodings = dict()
+        for data_file in data_files:
+            with h5.File(data_file, 'r') as h5_file:
+                def visit(name, obj):
+                    if isinstance(obj, h5.Dataset):
+                        encodings.setdefault(name, set()).add(
+                            packing.get_encoding(obj))
+                h5_file.visititems(visit)
+        for name, encoding in encodings.items():
+            if name.startswith('outputs/cpg/') or \
+                    name.endswith('/state') and name.startswith('inputs/cpg'):
+                assert encoding == {'2bit'}, name
+            elif name.endswith('/dist') and name.startswith('inputs/cpg'):
+                assert encoding == {'uint16'}, name
+            else:
+                assert encoding == {None}, name
+
+        names = [name for _, name in expected
+                 if name.startswith('outputs/') or name.startswith('inputs/')]
+        data = hdf.read(data_files, sorted(set(names)))
+        for name in set(names):
+            values = [value for (_, _name), value in sorted(expected.items())
+                      if _name == name]
+            value = np.concatenate(values)
+            assert data[name].dtype == value.dtype, name
+            npt.assert_array_equal(data[name], value, err_msg=name)
+
+    def test_anno_names(self):
+        anno_file = os.path.join(self.tmp_dir, 'distance.bed')
+        with open(anno_file, 'w') as f:
+            f.write('1\t10\t100\n')
+        with pytest.raises(ValueError):
+            self.run('annos', '--anno_files', anno_file,
+                     '--anno_features', 'is_in', 'distance')
+        data = self.run('is_in', '--anno_files', anno_file,
+                        '--anno_features', 'is_in')
+        assert any([name == 'inputs/annos/distance' for _, name in data])
+
+    def test_dna_store(self):
+        expected = self.run('fasta')
+        for encoding in genome.ENCODINGS:
+            store_dir = os.path.join(self.tmp_dir, encoding)
+            genome.fasta_to_store(self.dna_dir, store_dir, encoding=encoding)
+            actual = self.run('store_%s' % encoding, dna_files=store_dir)
+            assert sorted(actual.keys()) == sorted(expected.keys())
+            for key, value in expected.items():
+                npt.assert_array_equal(actual[key], value, err_msg=str(key))
+
+    def test_dna_ref_windows(self):
+        store_dir = os.path.join(self.tmp_dir, 'store')
+        genome.fasta_to_store(self.dna_dir, store_dir, encoding='2bit')
+        self.run('dna')
+        self.run('dna_ref', '--dna_ref', dna_files=store_dir)
+        data_files = [sorted(glob.glob(os.path.join(self.tmp_dir, data_dir,
+                                                    '*.h5')))
+                      for data_dir in ['dna', 'dna_ref']]
+        assert dat.get_dna_store(data_files[1][0]) == \
+            os.path.abspath(store_dir)
+        assert dat.get_dna_wlen(data_files[1][0]) == 101
+        store = genome.GenomeStore(store_dir)
+        nb_sample = 0
+        for expected, actual in zip(
+                hdf.reader(data_files[0], ['chromo', 'pos', 'inputs/dna'],
+                           batch_size=64),
+                hdf.reader(data_files[1], ['chromo', 'pos'], batch_size=64)):
+            npt.assert_array_equal(actual['pos'], expected['pos'])
+            wins = store.sample_windows(actual['chromo'], actual['pos'], 101,
+                                        np.random.RandomState(0))
+            # Bases outside chromosomes are chosen randomly
+            known = np.zeros(wins.shape, dtype=bool)
+            for chromo in np.unique(actual['chromo']):
+                idx = actual['chromo'] == chromo
+                known[idx] = store.windows(
+                    chromo.decode(), actual['pos'][idx], 101) != \
+                    dna.CHAR_TO_INT['N']
+            npt.assert_array_equal(wins[known],
+                                   expected['inputs/dna'][known])
+            nb_sample += len(wins)
+        assert nb_sample == 358
+
+    def test_dna_ref(self):
+        mod = pytest.importorskip('deepcpg.models')
+        store_dir = os.path.join(self.tmp_dir, 'store')
+        genome.fasta_to_store(self.dna_dir, store_dir, encoding='2bit')
+        self.run('dna')
+        self.run('dna_ref', '--dna_ref', dna_files=store_dir)
+        data_files = [sorted(glob.glob(os.path.join(self.tmp_dir, data_dir,
+                                                    '*.h5')))
+                      for data_dir in ['dna', 'dna_ref']]
+        assert [os.path.basename(data_file) for data_file in data_files[0]] \
+            == [os.path.basename(data_file) for data_file in data_files[1]]
+
+        reader = mod.DataReader(dna_seed=0)
+        store = genome.GenomeStore(store_dir)
+        nb_sample = 0
+        nb_unknown = 0
+        for expected, actual in zip(
+                hdf.reader(data_files[0], ['chromo', 'pos', 'inputs/dna'],
+                           batch_size=64),
+                reader(data_files[1], batch_size=64)):
+            chromos = expected['chromo']
+            pos = expected['pos']
+            # Bases outside chromosomes are chosen randomly
+            known = np.zeros(pos.shape + (101,), dtype=bool)
+            for chromo in np.unique(chromos):
+                idx = chromos == chromo
+                known[idx] = store.windows(chromo.decode(), pos[idx], 101) != \
+                    dna.CHAR_TO_INT['N']
+            nb_unknown += np.sum(~known)
+            npt.assert_array_equal(
+                actual['dna'][known],
+                dna.int_to_onehot(expected['inputs/dna'])[known])
+            nb_sample += len(pos)
+        assert nb_sample == 358
+        assert nb_unknown > 0